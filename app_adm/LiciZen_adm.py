@@ -1,13 +1,18 @@
-import argparse, asyncio, json, os, re
+import argparse, asyncio, json, os, re, sys, time, weakref
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
-import qdrant_client
 from pydantic import BaseModel, Field, validator
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_qdrant import Qdrant
-from langchain import PromptTemplate, LLMChain
+from langchain_core.prompts import PromptTemplate
+
+from comun import metricas
+from comun.borradores import AlmacenBorradores
+from comun.casete import chat_con_casete, embeddings_con_casete
+from comun.pasarela_llm import estimar_tokens, pasarela
+from .recursos_adm import recursos
+from .recuperacion_adm import ServicioRecuperacion
+from .resumenes_adm import CacheResumenes, clave_resumen, PROMPT_RESUMEN, VERSION_PROMPT_RESUMEN
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 0 · Variables de entorno y configuración global
@@ -16,7 +21,42 @@ load_dotenv()
 API_KEY         = os.getenv("GOOGLE_API_KEY")
 QDRANT_API_KEY  = os.getenv("QDRANT_API_KEY")
 QDRANT_URL      = os.getenv("QDRANT_URL")
+# Backend vectorial: "qdrant" (remoto), "qdrant_local" (en proceso) o "numpy" (índice en memoria)
+BACKEND_VECTORIAL = os.getenv("ADM_BACKEND_VECTORIAL", "qdrant")
+QDRANT_RUTA       = os.getenv("ADM_QDRANT_RUTA", ":memory:")
+INDICE_NUMPY      = os.getenv("ADM_INDICE_NUMPY")
+MODELO_LLM        = "gemini-2.5-flash"
+TEMPERATURA_LLM   = 0.4
+MODELO_EMBEDDINGS = "models/embedding-001"
 COLLECTION_NAME = "Prevencion_de_blanqueo_y_finanzas_sensibles"
+# Colecciones normativas que consulta contexto_para. Se pueden cambiar con ADM_COLECCIONES (lista JSON);
+# ojo, " Normativa General y Contratación Pública" se llama así en Qdrant, con el espacio inicial.
+COLECCIONES     = json.loads(os.getenv("ADM_COLECCIONES", json.dumps([
+    "Prevencion_de_blanqueo_y_finanzas_sensibles",
+    " Normativa General y Contratación Pública",
+    "proteccion_de_datos_y_seguridad_digital",
+    "sostenibilidad_recuperacion_y_fondos_europeos",
+])))
+
+# Paralelismo máximo por etapa (búsquedas en Qdrant, resúmenes y redacción de secciones)
+MAX_BUSQUEDAS   = int(os.getenv("ADM_MAX_BUSQUEDAS", "8"))
+MAX_RESUMENES   = int(os.getenv("ADM_MAX_RESUMENES", "8"))
+MAX_SECCIONES   = int(os.getenv("ADM_MAX_SECCIONES", "5"))
+
+# Revisión final (ADM_MODO_REVISION): "unica" pasa el pliego completo por REVISION_FINAL en una llamada;
+# "secciones" revisa cada sección en paralelo con los datos clave comunes y termina con una pasada de
+# coherencia que solo devuelve parches (ver revision_por_secciones)
+MODO_REVISION   = os.getenv("ADM_MODO_REVISION", "unica")
+
+# Fragmentos que se piden a cada colección ya filtrados por título en Qdrant (cuota por colección).
+# ADM_CUOTAS_COLECCION permite ajustar colecciones concretas, p. ej. '{"proteccion_de_datos_y_seguridad_digital": 4}'
+K_POR_COLECCION = int(os.getenv("ADM_K_POR_COLECCION", "3"))
+CUOTAS_COLECCION = json.loads(os.getenv("ADM_CUOTAS_COLECCION", "{}"))
+K_RESPALDO = 40  # Búsqueda amplia sin filtro, solo si la filtrada no devuelve nada
+TIMEOUT_BUSQUEDA = float(os.getenv("ADM_TIMEOUT_BUSQUEDA", "10"))  # Segundos por colección
+
+# Nº de consultas recientes cuyo embedding se conserva entre peticiones
+CACHE_EMBEDDINGS_MAX = int(os.getenv("ADM_CACHE_EMBEDDINGS", "256"))
 
 EU_THRESHOLDS_2025 = {"services_subcentral": 221_000}
 SIMPLIFIED_LIMIT   = 215_000
@@ -189,10 +229,65 @@ def justificar_vec(cls, v, values):
 # ──────────────────────────────────────────────────────────────────────────────
 # 3 · LLM + Embeddings + Vectorstore
 # ──────────────────────────────────────────────────────────────────────────────
-llm    = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.4, streaming=True)
-emb    = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=API_KEY)
-client = qdrant_client.QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-vectorstore = Qdrant(client=client, collection_name=COLLECTION_NAME, embeddings=emb)
+# Nada se construye al importar el módulo: cada recurso se crea la primera vez que se usa
+# (o en el arranque de la API, ver main_adm) y vive en el registro por proceso `recursos`.
+
+# Con LICIZEN_LLM_MODO=grabar/reproducir, el LLM y los embeddings de consulta pasan por el casete
+# (comun.casete): en modo reproducir no se crean los clientes reales ni hace falta clave de API.
+def _crear_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return chat_con_casete(
+        lambda: ChatGoogleGenerativeAI(model=MODELO_LLM, temperature=TEMPERATURA_LLM, streaming=True),
+        MODELO_LLM, {"temperature": TEMPERATURA_LLM},
+    )
+
+
+def _crear_emb():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return embeddings_con_casete(
+        lambda: GoogleGenerativeAIEmbeddings(model=MODELO_EMBEDDINGS, google_api_key=API_KEY), MODELO_EMBEDDINGS,
+    )
+
+
+def _crear_recuperacion() -> ServicioRecuperacion:
+    from .vectoriales_adm import crear_almacenes
+
+    emb = recursos.obtener("emb")
+    almacenes, client, async_client = crear_almacenes(
+        BACKEND_VECTORIAL, COLECCIONES, emb, url=QDRANT_URL, api_key=QDRANT_API_KEY,
+        ruta_local=QDRANT_RUTA, ruta_numpy=INDICE_NUMPY,
+    )
+    # Servicio de recuperación único para todo el proceso (almacenes por colección reutilizables)
+    return ServicioRecuperacion(
+        almacenes, emb, CUOTAS_COLECCION,
+        k_por_coleccion=K_POR_COLECCION, k_respaldo=K_RESPALDO, timeout=TIMEOUT_BUSQUEDA,
+        max_busquedas=MAX_BUSQUEDAS, cache_embeddings=CACHE_EMBEDDINGS_MAX,
+        client=client, async_client=async_client,
+    )
+
+
+recursos.registrar("llm", _crear_llm)
+recursos.registrar("emb", _crear_emb)
+recursos.registrar("recuperacion", _crear_recuperacion, cierre=lambda r: r.cerrar())
+recursos.registrar("cache_resumenes", CacheResumenes, cierre=lambda c: c.cerrar())
+recursos.registrar(
+    "borradores",
+    lambda: AlmacenBorradores.desde_entorno("ADM", str(Path(__file__).resolve().parent / "borradores.sqlite3")),
+    cierre=lambda b: b.cerrar(),
+)
+
+
+def obtener_llm():
+    return recursos.obtener("llm")
+
+
+def obtener_recuperacion() -> ServicioRecuperacion:
+    return recursos.obtener("recuperacion")
+
+
+def pasarela_gemini():
+    """Pasarela de llamadas al LLM (límite RPM/TPM, concurrencia adaptativa y reintentos ante 429/503)."""
+    return pasarela(MODELO_LLM)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 4 · Secciones y prompts
@@ -206,6 +301,38 @@ PAUTAS = {
     "Portada": "Incluye órgano de contratación, título, fecha y número de expediente.",
     "Firma":   "Inserta {fecha} y espacio para dos firmantes (nombre y cargo).",
 }
+# Campos de Datos (sub-modelos incluidos) que necesita cada sección: es lo único que recibe su
+# prompt (ver proyectar_datos). Los de CAMPOS_CONSULTA forman la consulta de recuperación y van
+# en todas. Si cambia alguno, la sección se vuelve a redactar al actualizar un borrador.
+CAMPOS_CONSULTA = ["objeto_contrato", "pbl_sin_iva", "duracion_meses"]
+CAMPOS_POR_SECCION = {
+    "Portada": ["responsable_contrato", "documentacion"],
+    "Objeto del contrato": ["necesidad_resuelta", "lugar_prestacion", "iva", "prorrogas", "vec", "vec_justificado"],
+    "Procedimiento de adjudicación": ["iva", "prorrogas", "vec", "vec_justificado", "procedimiento", "sara"],
+    "Condiciones de ejecución": ["lugar_prestacion", "prorrogas", "responsable_contrato", "subcontratacion", "proteccion_datos"],
+    "Garantías": ["iva", "vec", "garantias"],
+    "Solvencia y clasificación": ["vec", "solvencia"],
+    "Criterios de adjudicación": ["vec", "criterios", "ponderacion", "nextgen"],
+    "Obligaciones de confidencialidad y protección de datos": ["proteccion_datos", "subcontratacion"],
+    "Cláusula ambiental y DNSH": ["nextgen", "ponderacion"],
+    "Firma": ["responsable_contrato", "documentacion"],
+}
+
+
+def campos_seccion(sec: str) -> List[str]:
+    return CAMPOS_CONSULTA + CAMPOS_POR_SECCION.get(sec, [])
+
+
+def proyectar_datos(datos: Datos) -> Dict[str, str]:
+    """
+    JSON compacto con los campos de cada sección. Cada campo se serializa una sola vez por
+    petición y los JSON de las secciones se componen a partir de esos trozos.
+    """
+    trozos = {
+        campo: f"{json.dumps(campo)}:{json.dumps(valor, ensure_ascii=False, separators=(',', ':'))}"
+        for campo, valor in datos.model_dump(mode="json").items()
+    }
+    return {sec: "{" + ",".join(trozos[c] for c in campos_seccion(sec)) + "}" for sec in SECCIONES}
 PROMPT = PromptTemplate.from_template(
     "Eres jurista experto en contratación pública española.\n"
     "Redacta exclusivamente la sección «{titulo}». No incluyas ninguna otra parte del pliego ni repitas información de otras secciones. Este bloque debe ser autónomo y autocontenido. No intentes revisar el pliego completo."
@@ -302,62 +429,352 @@ REVISION_FINAL = PromptTemplate.from_template(
 )
 
 
+# Revisión por secciones: cada sección con los datos clave del contrato, y después solo las contradicciones
+REVISION_SECCION = PromptTemplate.from_template(
+    "Actúa como técnico de contratación pública experto.\n"
+    "Revisa la sección «{titulo}» de un pliego administrativo. Las demás secciones se revisan por separado.\n\n"
+    "1. Elimina repeticiones y contradicciones internas de la sección.\n"
+    "2. Los importes, plazos, porcentajes y garantías deben coincidir con los datos clave del contrato; corrige los que no coincidan.\n"
+    "3. **No insertes notas o avisos ⚠️ dentro del texto.** No añadas contenido de otras secciones.\n"
+    "Devuelve únicamente el texto revisado de la sección, sin su título y sin comentarios. No hables como una IA.\n\n"
+    "Datos clave del contrato:\n{hechos}\n\n"
+    "Texto de la sección:\n{seccion}"
+)
+
+REVISION_COHERENCIA = PromptTemplate.from_template(
+    "Actúa como técnico de contratación pública experto.\n"
+    "Estas son las frases con cifras, plazos o garantías de cada sección de un pliego administrativo ya revisado.\n"
+    "Busca únicamente contradicciones entre secciones o con los datos clave del contrato; no mejores la redacción.\n"
+    "Responde solo con JSON, sin markdown:\n"
+    '{{"parches": [{{"seccion": "<sección>", "buscar": "<texto exacto de la frase>", "reemplazar": "<texto corregido>"}}], '
+    '"advertencias": ["<punto que debe revisar el órgano de contratación>"]}}\n'
+    'Si no hay contradicciones: {{"parches": [], "advertencias": []}}\n\n'
+    "Datos clave del contrato:\n{hechos}\n\n"
+    "Frases por sección:\n{frases}"
+)
+
 
-CADENAS: Dict[str, LLMChain] = {s: (PROMPT | llm) for s in SECCIONES}
+def cadena_seccion(sec: str):
+    """Cadena PROMPT | llm de una sección (todas comparten plantilla y modelo)."""
+    return PROMPT | obtener_llm()
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 5 · Contexto legal selectivo
 # ──────────────────────────────────────────────────────────────────────────────
 
-def contexto_para(titulo: str, consulta: str, k: int = 5) -> str:
+# Semáforos compartidos por todas las peticiones del proceso: limitan cada etapa
+# sin bloquear el bucle de eventos mientras se espera a Gemini.
+# (Las búsquedas las limita el propio ServicioRecuperacion con MAX_BUSQUEDAS.)
+# Un asyncio.Semaphore queda ligado al bucle en el que se usa, así que se crean al primer uso
+# en cada bucle: los scripts y benchmarks que llaman varias veces a asyncio.run tienen los suyos.
+_SEMAFOROS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def _semaforo(nombre: str, limite: int) -> asyncio.Semaphore:
+    por_bucle = _SEMAFOROS.setdefault(asyncio.get_running_loop(), {})
+    if nombre not in por_bucle:
+        por_bucle[nombre] = asyncio.Semaphore(limite)
+    return por_bucle[nombre]
+
+
+def sem_resumenes() -> asyncio.Semaphore:
+    """Límite de resúmenes simultáneos (ADM_MAX_RESUMENES) del bucle en curso."""
+    return _semaforo("resumenes", MAX_RESUMENES)
+
+
+def sem_secciones() -> asyncio.Semaphore:
+    """Límite de llamadas de redacción y revisión simultáneas (ADM_MAX_SECCIONES) del bucle en curso."""
+    return _semaforo("secciones", MAX_SECCIONES)
+
+
+# Resúmenes que se están calculando ahora mismo (los ya calculados están en la caché SQLite
+# "cache_resumenes"), para que dos secciones que recuperan el mismo fragmento no lo resuman dos veces.
+_RESUMENES_EN_CURSO: Dict[str, asyncio.Future] = {}
+
+
+async def _resumir(texto: str, limite: asyncio.Semaphore) -> str:
+    prompt = PROMPT_RESUMEN.format(texto=texto)
+    async with limite:
+        with metricas.etapa("resumen"):
+            return (await pasarela_gemini().llamar(lambda: obtener_llm().ainvoke(prompt), tokens=estimar_tokens(prompt))).content
+
+
+def resumen_precalculado(doc) -> Optional[str]:
+    """Resumen guardado en el payload del punto, solo si corresponde a la versión actual del prompt."""
+    if doc.metadata.get("resumen_version") == VERSION_PROMPT_RESUMEN:
+        return doc.metadata.get("resumen")
+    return None
+
+
+async def resumir_fragmentos(textos: List[str], limite: Optional[asyncio.Semaphore] = None) -> List[str]:
+    """Resume los fragmentos usando la caché; los que faltan se resumen en paralelo y se guardan.
+
+    `limite` acota los resúmenes simultáneos; por defecto, sem_resumenes() (compartido por las peticiones).
+    """
+    limite = limite or sem_resumenes()
+    claves = [clave_resumen(t) for t in textos]
+    cache = recursos.obtener("cache_resumenes")
+    resumenes = await asyncio.to_thread(cache.obtener_varios, claves)
+
+    # Los que nadie está resumiendo ya los resume esta llamada; el resto espera al que ya está en marcha
+    propios: Dict[str, str] = {}
+    for clave, texto in zip(claves, textos):
+        if clave not in resumenes and clave not in _RESUMENES_EN_CURSO:
+            _RESUMENES_EN_CURSO[clave] = asyncio.get_running_loop().create_future()
+            propios[clave] = texto
+    pendientes = {c: _RESUMENES_EN_CURSO[c] for c in claves if c not in resumenes}
+
+    try:
+        if propios:
+            nuevos = await asyncio.gather(*(_resumir(t, limite) for t in propios.values()), return_exceptions=True)
+            correctos = [(c, r) for c, r in zip(propios, nuevos) if not isinstance(r, BaseException)]
+            await asyncio.to_thread(cache.guardar_varios, correctos)
+            for clave, resultado in zip(propios, nuevos):
+                futuro = _RESUMENES_EN_CURSO.pop(clave)
+                if isinstance(resultado, BaseException):
+                    futuro.set_exception(resultado)
+                else:
+                    futuro.set_result(resultado)
+    finally:
+        # Si esta petición se cancela a medias, desbloqueamos a las que esperaban sus resúmenes
+        for clave in propios:
+            futuro = _RESUMENES_EN_CURSO.pop(clave, None)
+            if futuro is not None and not futuro.done():
+                futuro.set_exception(RuntimeError("Resumen cancelado"))
+
+    for clave, futuro in pendientes.items():
+        resumenes[clave] = await futuro
+    return [resumenes[c] for c in claves]
+
+
+async def contexto_para(titulo: str, vector: List[float], k: int = 5) -> str:
     keyword = titulo.split()[0].lower()
-    colecciones = [
-        "Prevencion_de_blanqueo_y_finanzas_sensibles",
-        " Normativa General y Contratación Pública",
-        "proteccion_de_datos_y_seguridad_digital",
-        "sostenibilidad_recuperacion_y_fondos_europeos"
-    ]
 
-    docs = []
-    for col in colecciones:
-        temp_vs = Qdrant(client=client, collection_name=col, embeddings=emb)
-        try:
-            docs.extend(temp_vs.similarity_search(consulta, k=40))
-        except Exception as e:
-            print(f"⚠️ Error al buscar en '{col}': {e}")
-
-    # Ordenamos por similitud si hay `score`, o simplemente cogemos los primeros que contengan el keyword
-    candidatos = [d for d in docs if keyword in d.metadata.get("titulo", "").lower()]
-    if not candidatos:
-        candidatos = docs[:k]  # si no hay coincidencia por keyword, devolvemos cualquiera
-
-    resumenes = [
-        llm.invoke(f"Resume en dos líneas:\n{d.page_content}").content
-        for d in candidatos[:k]
-    ]
+    # Las colecciones se consultan a la vez, con el filtro por título resuelto en Qdrant
+    elegidos = await obtener_recuperacion().buscar_por_palabra(keyword, vector, k)
+
+    # Si el job de precálculo (precalculo_adm) ya dejó el resumen en el payload, se usa tal cual
+    resumenes = [resumen_precalculado(d) for d in elegidos]
+    faltan = [i for i, r in enumerate(resumenes) if r is None]
+    for i, resumen in zip(faltan, await resumir_fragmentos([elegidos[i].page_content for i in faltan])):
+        resumenes[i] = resumen
     return "\n".join(resumenes)
 
 
+async def contexto_compartido(memo: Optional[Dict], titulo: str, consulta: str, vector: List[float]) -> str:
+    """
+    contexto_para con memo opcional compartido entre los documentos de un lote: si otro documento
+    ya ha pedido (o está pidiendo) el contexto de la misma sección con la misma consulta, se reutiliza.
+    """
+    if memo is None:
+        return await contexto_para(titulo, vector)
+    clave = (titulo, consulta)
+    if clave not in memo:
+        memo[clave] = asyncio.ensure_future(contexto_para(titulo, vector))
+    # shield: si un documento del lote se cancela, la búsqueda sigue para los demás
+    return await asyncio.shield(memo[clave])
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 6 · Redacción por sección (async)
 # ──────────────────────────────────────────────────────────────────────────────
-async def redactar_secciones(datos: Datos) -> Dict[str, str]:
+async def redactar_secciones_stream(datos: Datos, secciones: List[str] = SECCIONES, memo_contexto: Optional[Dict] = None):
+    """
+    Redacta las secciones pedidas (todas por defecto) en paralelo y las va devolviendo (sección, texto) según terminan.
+    memo_contexto permite compartir el contexto recuperado entre varios documentos (ver contexto_compartido).
+    """
     base_query = f"Pliego servicios informáticos — {datos.objeto_contrato}. PBL {datos.pbl_sin_iva} €, {datos.duracion_meses} meses."
-    resultado: Dict[str, str] = {}
+    datos_por_seccion = proyectar_datos(datos)  # Cada sección recibe solo sus campos, en JSON compacto
+    # Un único embedding por petición, compartido por todas las secciones y colecciones
+    vector = await obtener_recuperacion().vector_consulta(base_query)
 
     async def tarea(sec: str):
-        ctx = contexto_para(sec, base_query)
-        raw = CADENAS[sec].invoke({
+        with metricas.etapa("contexto", seccion=sec):
+            ctx = await contexto_compartido(memo_contexto, sec, base_query, vector)
+        entrada = {
             "titulo": sec,
             "pautas": PAUTAS.get(sec, ""),
-            "datos": json.dumps(datos.model_dump(), ensure_ascii=False, indent=2),
+            "datos": datos_por_seccion[sec],
             "contexto": ctx,
-        })
-        resultado[sec] = raw.content if hasattr(raw, "content") else raw
+        }
+        tokens = estimar_tokens(PROMPT.template) + estimar_tokens(datos_por_seccion[sec]) + estimar_tokens(ctx)
+        async with sem_secciones():
+            with metricas.etapa("seccion", seccion=sec):
+                raw = await pasarela_gemini().llamar(lambda: cadena_seccion(sec).ainvoke(entrada), tokens=tokens)
+        return sec, raw.content if hasattr(raw, "content") else raw
+
+    tareas = [asyncio.create_task(tarea(s)) for s in secciones]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            yield await siguiente
+    finally:
+        # Si quien consume el stream se va, no dejamos secciones redactándose en segundo plano
+        for t in tareas:
+            t.cancel()
+
+
+async def redactar_secciones(datos: Datos, secciones: List[str] = SECCIONES, memo_contexto: Optional[Dict] = None) -> Dict[str, str]:
+    resultado = {sec: texto async for sec, texto in redactar_secciones_stream(datos, secciones, memo_contexto)}
+    # Se devuelven en el orden de SECCIONES aunque hayan terminado desordenadas
+    return {sec: resultado[sec] for sec in SECCIONES if sec in resultado}
+
+
+def unir_secciones(secciones: Dict[str, str]) -> str:
+    """Texto completo en markdown, en el orden de SECCIONES, que se pasa a la revisión final."""
+    return "\n\n".join(f"## {sec}\n\n{secciones[sec]}" for sec in SECCIONES if sec in secciones)
+
+
+def separar_secciones(pliego: str) -> Dict[str, str]:
+    """Inversa de unir_secciones para un pliego revisado por secciones (se descarta el apartado de advertencias)."""
+    pliego = pliego.split(f"\n\n{TITULO_ADVERTENCIAS}\n\n", 1)[0]
+    partes = re.split(r"(?:^|\n\n)## (" + "|".join(map(re.escape, SECCIONES)) + r")\n\n", pliego)
+    return dict(zip(partes[1::2], partes[2::2]))
+
+
+async def revision_final_stream(secciones: Dict[str, str], datos: Datos, modo: Optional[str] = None):
+    """
+    Aplica la revisión final y va devolviendo el texto revisado a trozos. En modo "unica", según lo
+    genera Gemini; en modo "secciones", una sección revisada por trozo cuando ya están todas parcheadas.
+    """
+    if (modo or MODO_REVISION) == "secciones":
+        inicio = time.perf_counter()
+        try:
+            revisadas, advertencias = await revision_por_secciones(secciones, datos)
+        finally:
+            metricas.anotar("revision", time.perf_counter() - inicio)
+        for i, sec in enumerate(revisadas):
+            yield ("\n\n" if i else "") + f"## {sec}\n\n{revisadas[sec]}"
+        yield apartado_advertencias(advertencias)
+        return
+
+    revisado = REVISION_FINAL | obtener_llm()
+    pliego = unir_secciones(secciones)
+    tokens = estimar_tokens(REVISION_FINAL.template) + 2 * estimar_tokens(pliego)  # Entrada y salida, de tamaño parecido
+    inicio = time.perf_counter()
+    try:
+        async for chunk in pasarela_gemini().transmitir(lambda: revisado.astream({"pliego": pliego}), tokens=tokens,
+                                                        etiquetas={"etapa": "revision"}):
+            if chunk.content:
+                yield chunk.content
+    finally:
+        metricas.anotar("revision", time.perf_counter() - inicio)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 6b · Revisión final por secciones (map-reduce)
+# ──────────────────────────────────────────────────────────────────────────────
+# La revisión única reescribe el pliego entero en una llamada: es la cola de la latencia, su coste crece
+# con el documento y puede chocar con el límite de tokens de salida. Aquí cada sección se revisa por su
+# cuenta (en paralelo, con sem_secciones()) frente a los mismos datos clave, y la coherencia entre secciones
+# se comprueba después con una llamada pequeña que solo ve las frases con cifras y devuelve parches.
+_FRASE = re.compile(r"(?<=[.;])\s+|\n+")
+_CIFRA = re.compile(r"\d|garant[ií]a|plazo|pr[óo]rroga|\bmes(es)?\b|€|%", re.IGNORECASE)
+
+
+def _euros(importe: float) -> str:
+    return f"{importe:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".") + " €"
+
+
+def hechos_clave(datos: Datos) -> str:
+    """
+    Datos que aparecen en varias secciones (importes, plazos, garantías), sacados de Datos sin llamar a Gemini.
+    Los validadores de Datos no se aplican (están fuera de la clase), así que VEC, procedimiento y SARA se
+    calculan aquí con los helpers procedimentales y el IVA se normaliza a fracción; lo que no se puede
+    deducir de los datos no se incluye, para que la revisión no alinee las secciones con un valor inventado.
+    """
+    g, s, p, c = datos.garantias, datos.solvencia, datos.ponderacion, datos.criterios
+    suma = p.metodologia_plan + p.equipo_experiencia + p.dnsh_sostenibilidad + p.oferta_economica
+    vec = datos.vec or datos.pbl_sin_iva * (datos.duracion_meses + datos.prorrogas) / datos.duracion_meses
+    iva = datos.iva / 100 if datos.iva > 1 else datos.iva  # Como normalizar_iva: 21 y 0.21 son el 21 %
+    presupuesto = f"- Presupuesto base de licitación: {_euros(datos.pbl_sin_iva)} sin IVA"
+    if round(iva, 2) in (0.0, 0.04, 0.10, 0.21):  # Un IVA no admitido se deja para la revisión manual
+        presupuesto += f"; IVA {iva * 100:g} %; {_euros(datos.pbl_sin_iva * (1 + iva))} con IVA"
+    lineas = [
+        f"- Objeto: {datos.objeto_contrato}",
+        presupuesto,
+        f"- Valor estimado del contrato: {_euros(vec)}",
+        f"- Duración: {datos.duracion_meses} meses; prórrogas: {datos.prorrogas} meses; "
+        f"máximo total: {datos.duracion_meses + datos.prorrogas} meses",
+        f"- Procedimiento: {datos.procedimiento or procedure_type(vec)}; sujeto a regulación armonizada: "
+        f"{'sí' if (datos.sara if datos.sara is not None else sara(vec)) else 'no'}",
+        "- Garantía provisional: " + (
+            (f"sí, {g.porcentaje_cuantia}" if g.porcentaje_cuantia else "sí") if g.garantia_provisional else "no se exige"
+        ),
+        f"- Solvencia: volumen anual de negocios mínimo {_euros(s.volumen_anual_negocios_min)}; "
+        f"trabajos similares mínimo anual {_euros(s.importe_anual_similares_min)}; seguro de RC mínimo {_euros(s.seguro_rcp_min)}",
+        f"- Ponderación: metodología {p.metodologia_plan:g} %, equipo {p.equipo_experiencia:g} %, "
+        f"DNSH {p.dnsh_sostenibilidad:g} %, oferta económica {p.oferta_economica:g} % (suma {suma:g} %)",
+        f"- Precio ofertado: {_euros(c.precio_ofertado)}; anormalmente bajo: {'sí' if c.anormalmente_bajo else 'no'}",
+        f"- Fecha: {datos.documentacion.fecha}",
+    ]
+    return "\n".join(lineas)
+
+
+def frases_con_cifras(texto: str, max_caracteres: int = 300) -> List[str]:
+    """Frases (o filas de tabla) de una sección que mencionan cifras, plazos o garantías."""
+    return [f[:max_caracteres] for f in (f.strip() for f in _FRASE.split(texto)) if f and _CIFRA.search(f)]
 
-    await asyncio.gather(*(tarea(s) for s in SECCIONES))
+
+def leer_correcciones(respuesta: str) -> Dict[str, list]:
+    """JSON de la pasada de coherencia; si Gemini no devuelve un JSON válido, no se aplica nada."""
+    try:
+        correcciones = json.loads(re.search(r"\{.*\}", respuesta, re.DOTALL).group(0))
+    except (AttributeError, ValueError):
+        return {"parches": [], "advertencias": []}
+    return {"parches": correcciones.get("parches") or [], "advertencias": correcciones.get("advertencias") or []}
+
+
+def aplicar_parches(secciones: Dict[str, str], parches: List[dict]) -> Dict[str, str]:
+    """Sustituye cada `buscar` por su `reemplazar` en su sección; los que no se encuentran tal cual se ignoran."""
+    resultado = dict(secciones)
+    for parche in parches:
+        sec, buscar = parche.get("seccion"), parche.get("buscar")
+        if sec in resultado and buscar and buscar in resultado[sec]:
+            resultado[sec] = resultado[sec].replace(buscar, parche.get("reemplazar", ""), 1)
     return resultado
 
+
+TITULO_ADVERTENCIAS = "## ⚠️ ADVERTENCIAS Y PUNTOS A REVISAR"
+
+
+def apartado_advertencias(advertencias: List[str]) -> str:
+    if not advertencias:
+        return ""
+    return f"\n\n{TITULO_ADVERTENCIAS}\n\n" + "\n".join(f"- {a}" for a in advertencias)
+
+
+async def _revisar_seccion(sec: str, texto: str, hechos: str) -> str:
+    entrada = {"titulo": sec, "hechos": hechos, "seccion": texto}
+    tokens = estimar_tokens(REVISION_SECCION.template) + estimar_tokens(hechos) + 2 * estimar_tokens(texto)
+    async with sem_secciones():
+        with metricas.etapa("revision_seccion", seccion=sec):
+            raw = await pasarela_gemini().llamar(lambda: (REVISION_SECCION | obtener_llm()).ainvoke(entrada), tokens=tokens)
+    return raw.content.strip()
+
+
+async def revision_por_secciones(secciones: Dict[str, str], datos: Datos, previas: Optional[Dict[str, str]] = None):
+    """
+    Revisa las secciones en paralelo y aplica los parches de la pasada de coherencia.
+    Las secciones de `previas` ya están revisadas (p. ej. las que no cambian en un borrador) y no
+    se vuelven a revisar, aunque sí entran en la pasada de coherencia.
+    Devuelve (secciones revisadas en el orden de SECCIONES, advertencias).
+    """
+    hechos = hechos_clave(datos)
+    previas = previas or {}
+    orden = [sec for sec in SECCIONES if sec in secciones]
+    pendientes = [sec for sec in orden if sec not in previas]
+    nuevas = dict(zip(pendientes, await asyncio.gather(*(_revisar_seccion(sec, secciones[sec], hechos) for sec in pendientes))))
+    revisadas = {sec: nuevas[sec] if sec in nuevas else previas[sec] for sec in orden}
+
+    frases = "\n\n".join(f"### {sec}\n" + "\n".join(frases_con_cifras(texto)) for sec, texto in revisadas.items())
+    entrada = {"hechos": hechos, "frases": frases}
+    tokens = estimar_tokens(REVISION_COHERENCIA.template) + estimar_tokens(hechos) + 2 * estimar_tokens(frases)
+    async with sem_secciones():
+        with metricas.etapa("coherencia"):
+            raw = await pasarela_gemini().llamar(lambda: (REVISION_COHERENCIA | obtener_llm()).ainvoke(entrada), tokens=tokens)
+    correcciones = leer_correcciones(raw.content)
+    return aplicar_parches(revisadas, correcciones["parches"]), correcciones["advertencias"]
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 7 · Cuestionario interactivo completo
 # ──────────────────────────────────────────────────────────────────────────────
@@ -519,17 +936,51 @@ def imprimir_pliego(sec: Dict[str, str]):
 # 9 · main
 # ──────────────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Genera un pliego modular por secciones.")
+    parser = argparse.ArgumentParser(prog="python -m app_adm.LiciZen_adm", description="Genera un pliego modular por secciones.")
     parser.add_argument("--json", type=Path, help="Ruta a archivo JSON con datos (opcional)")
+    parser.add_argument("--lote", type=Path, help="Carpeta con varios JSON de datos: genera todos los pliegos a la vez")
+    parser.add_argument("--salida", type=Path, help="Carpeta donde escribir los pliegos del lote (por defecto, la del lote)")
     args = parser.parse_args()
 
+    if args.lote:
+        # Importación diferida: core_adm importa este módulo como app_adm.LiciZen_adm
+        from .core_adm import generar_lote
+
+        async def generar_carpeta(carpeta: Path, salida: Path):
+            salida.mkdir(parents=True, exist_ok=True)
+            rutas = sorted(carpeta.glob("*.json"))
+            lote = []
+            for ruta in rutas:
+                try:
+                    lote.append((ruta, Datos.parse_file(ruta)))
+                except Exception as e:
+                    print(f"❗ {ruta.name}: datos no válidos ({e})", file=sys.stderr)
+            print(f"⏳ Generando {len(lote)} pliegos…", file=sys.stderr, flush=True)
+            async for evento in generar_lote([d for _, d in lote]):
+                ruta = lote[evento["indice"]][0]
+                if "error" in evento:
+                    print(f"❗ {ruta.name}: {evento['error']}", file=sys.stderr, flush=True)
+                    continue
+                destino = salida / f"{ruta.stem}.pliego.md"
+                destino.write_text(evento["resultado"]["pliego_final"], encoding="utf-8")
+                print(f"✅ {ruta.name} → {destino.name} ({evento['estado']})", file=sys.stderr, flush=True)
+
+        asyncio.run(generar_carpeta(args.lote, args.salida or args.lote))
+        sys.exit(0)
+
     datos = Datos.parse_file(args.json) if args.json else preguntar_interactivo()
 
-    print("\n⏳ Redactando secciones…\n")
-    pliego = asyncio.run(redactar_secciones(datos))
+    async def redactar_y_revisar(datos: Datos):
+        # Cada sección se anuncia en cuanto está lista y la revisión final se imprime según llega
+        secciones = {}
+        async for sec, texto in redactar_secciones_stream(datos):
+            secciones[sec] = texto
+            print(f"✅ {sec} ({len(secciones)}/{len(SECCIONES)})", file=sys.stderr, flush=True)
 
-    texto_pliego = "\n\n".join(f"## {sec}\n\n{contenido}" for sec, contenido in pliego.items())
-    revisado = REVISION_FINAL | llm
-    pliego_revisado = revisado.invoke({"pliego": texto_pliego}).content
+        print("\n⏳ Revisión final…\n", file=sys.stderr, flush=True)
+        async for trozo in revision_final_stream(secciones, datos):
+            print(trozo, end="", flush=True)
+        print()
 
-    print(pliego_revisado)
\ No newline at end of file
+    print("\n⏳ Redactando secciones…\n", file=sys.stderr)
+    asyncio.run(redactar_y_revisar(datos))
@@ -1,20 +1,176 @@
-from .core_adm import generar_pliego_administrativo
-from .model_adm import Datos
-from fastapi import APIRouter
-from .LiciZen_adm import Datos  
+import json
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from .core_adm import (
+    generar_pliego_administrativo_con_cache, generar_pliego_administrativo_stream,
+    crear_borrador, obtener_borrador, actualizar_borrador, generar_lote, COLA_TRABAJOS,
+)
+from .LiciZen_adm import SECCIONES
+from .LiciZen_adm import Datos
+from .model_adm import Datos as DatosSimple
+from fastapi import APIRouter, Body, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from comun.exportacion import pliego_exportable, respuesta_descarga, respuesta_texto
+from comun.sse import evento_sse
 
 
 router = APIRouter()
 
 
+class LoteDatos(BaseModel):
+    documentos: List[Datos]
+
+
+class PliegoAdministrativo(BaseModel):
+    objeto: str
+    indice: List[str]
+    secciones: Dict[str, str]
+    pliego_final: Optional[str] = None
+
+
+TITULO_PLIEGO = "Pliego de cláusulas administrativas particulares"
+
+
 # 📄 Pliego administrativo
 @router.post("/administrativo")
-async def generar_administrativo(datos: Datos):
-    print("Datos:", datos)
-    resultado = await generar_pliego_administrativo(datos)
+async def generar_administrativo(datos: Datos, response: Response):
+    resultado, estado = await generar_pliego_administrativo_con_cache(datos)
+    response.headers["X-Cache"] = estado  # HIT si el mismo pliego ya estaba generado, MISS si se ha generado ahora
     return resultado
 
-from .model_adm import Datos as DatosSimple
+
+# 📄 Pliego administrativo en streaming (Server-Sent Events): borradores por sección
+# según terminan y, después, la revisión final trozo a trozo. El evento "fin" lleva en "cache"
+# el mismo estado que /administrativo envía en la cabecera X-Cache
+@router.post("/administrativo/stream")
+async def generar_administrativo_stream(datos: Datos):
+    async def eventos():
+        try:
+            async for tipo, contenido in generar_pliego_administrativo_stream(datos):
+                yield evento_sse(tipo, contenido)
+        except Exception as e:
+            yield evento_sse("error", {"detalle": str(e)})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# 📦 Lote de pliegos (p. ej. los lotes de una misma licitación): se generan todos con un límite
+# de concurrencia global y contexto normativo compartido, y cada uno se devuelve en cuanto
+# termina, como una línea JSON (NDJSON) con su "indice" en la lista enviada
+@router.post("/administrativo/lote")
+async def generar_administrativo_lote(lote: LoteDatos):
+    async def lineas():
+        async for evento in generar_lote(lote.documentos):
+            yield json.dumps(evento, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+# ⏳ Trabajos: POST devuelve un ID al momento (202) y el pliego se genera en la cola de trabajos.
+# El cliente consulta el estado (polling) o se suscribe a los eventos de progreso por sección
+@router.post("/administrativo/trabajos", status_code=202)
+async def encolar_administrativo(datos: Datos):
+    # Se guardan los campos tal como llegaron: los calculados se vuelven a calcular al ejecutar
+    id_trabajo = await COLA_TRABAJOS.encolar(
+        {"datos": datos.model_dump(mode="json", exclude_unset=True)}, total=len(SECCIONES)
+    )
+    return {"id": id_trabajo, "estado": "pendiente"}
+
+
+# 📊 Profundidad de la cola y tiempos de espera y de ejecución
+@router.get("/administrativo/trabajos/estadisticas")
+async def estadisticas_trabajos():
+    return await COLA_TRABAJOS.estadisticas()
+
+
+@router.get("/administrativo/trabajos/{id_trabajo}")
+async def consultar_trabajo(id_trabajo: str):
+    trabajo = await COLA_TRABAJOS.obtener(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+
+@router.get("/administrativo/trabajos/{id_trabajo}/eventos")
+async def eventos_trabajo(id_trabajo: str):
+    if await COLA_TRABAJOS.obtener(id_trabajo) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def eventos():
+        async for tipo, contenido in COLA_TRABAJOS.suscribir(id_trabajo):
+            yield evento_sse(tipo, contenido)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# 📝 Borradores: el pliego se genera una vez y se guarda con un ID. Un PATCH con solo los campos
+# de Datos que han cambiado (p. ej. {"garantias": {"garantia_provisional": true}}) vuelve a
+# redactar únicamente las secciones que dependen de ellos, más la revisión final
+@router.post("/administrativo/borradores")
+async def crear_borrador_administrativo(datos: Datos, response: Response):
+    borrador, estado = await crear_borrador(datos)
+    response.headers["X-Cache"] = estado
+    return borrador
+
+
+@router.get("/administrativo/borradores/{id_borrador}")
+async def leer_borrador_administrativo(id_borrador: str):
+    borrador = await obtener_borrador(id_borrador)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return borrador
+
+
+@router.patch("/administrativo/borradores/{id_borrador}")
+async def actualizar_borrador_administrativo(id_borrador: str, cambios: Dict[str, Any] = Body(...)):
+    try:
+        borrador = await actualizar_borrador(id_borrador, cambios)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return borrador
+
+
+# 📥 Exportación a DOCX o PDF (con índice) de un pliego ya generado, sin llamar a Gemini: se renderiza
+# en un pool de procesos, se guarda en caché por contenido y se descarga en streaming (304 con el mismo ETag)
+@router.post("/administrativo/exportar/{formato}")
+async def exportar_administrativo(formato: Literal["docx", "pdf"], pliego: PliegoAdministrativo,
+                                  if_none_match: Optional[str] = Header(None)):
+    return await respuesta_descarga(pliego_exportable(TITULO_PLIEGO, pliego.model_dump()), formato, if_none_match)
+
+
+@router.get("/administrativo/borradores/{id_borrador}/exportar/{formato}")
+async def exportar_borrador_administrativo(id_borrador: str, formato: Literal["docx", "pdf"],
+                                           if_none_match: Optional[str] = Header(None)):
+    borrador = await obtener_borrador(id_borrador)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return await respuesta_descarga(pliego_exportable(TITULO_PLIEGO, borrador), formato, if_none_match)
+
+
+# 📝 Texto, markdown o HTML del pliego ya generado (o de un borrador), sin llamar a Gemini, sección a sección
+@router.post("/administrativo/render/{formato}")
+async def renderizar_administrativo(formato: Literal["texto", "markdown", "html"], pliego: PliegoAdministrativo):
+    return respuesta_texto(pliego_exportable(TITULO_PLIEGO, pliego.model_dump()), formato)
+
+
+@router.get("/administrativo/borradores/{id_borrador}/render/{formato}")
+async def renderizar_borrador_administrativo(id_borrador: str, formato: Literal["texto", "markdown", "html"]):
+    borrador = await obtener_borrador(id_borrador)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return respuesta_texto(pliego_exportable(TITULO_PLIEGO, borrador), formato)
+
 
 @router.post("/administrativo_simple")
 async def generar_basico(datos: DatosSimple):
@@ -1,27 +1,257 @@
 # app/admin_core.py
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
-from .model_adm import Datos
-from .LiciZen_adm import redactar_secciones, REVISION_FINAL, SECCIONES, llm
+from comun.borradores import fusionar
+from comun.metricas import etapa, registrar_servicio
+from comun.cache_resultados import MISS, CacheResultados, clave_canonica
+from comun.pasarela_llm import estimar_tokens
+from comun.trabajos import ColaTrabajos
+from .LiciZen_adm import (
+    Datos, redactar_secciones, redactar_secciones_stream, revision_final_stream, unir_secciones, proyectar_datos,
+    obtener_llm, pasarela_gemini, recursos, sem_secciones, CAMPOS_POR_SECCION, COLECCIONES, MODELO_EMBEDDINGS,
+    MODELO_LLM, MODO_REVISION, PAUTAS, PROMPT, REVISION_COHERENCIA, REVISION_FINAL, REVISION_SECCION, SECCIONES,
+    TEMPERATURA_LLM, apartado_advertencias, revision_por_secciones, separar_secciones,
+)
+from .resumenes_adm import PROMPT_RESUMEN, VERSION_PROMPT_RESUMEN
 
+# Caché de pliegos completos (ADM_CACHE_MAX, ADM_CACHE_TTL y, opcional, ADM_CACHE_DISCO)
+CACHE_PLIEGOS = CacheResultados.desde_entorno("ADM")
 
-async def generar_pliego_administrativo(datos: Datos) -> dict:
+
+def clave_pliego(datos: Datos) -> str:
+    """Clave de caché: datos validados + versión de prompts, secciones y colecciones + modelos."""
+    return clave_canonica(
+        "adm", datos.model_dump(mode="json"),
+        PROMPT.template, REVISION_FINAL.template, MODO_REVISION, REVISION_SECCION.template, REVISION_COHERENCIA.template, PROMPT_RESUMEN, VERSION_PROMPT_RESUMEN, SECCIONES, PAUTAS,
+        CAMPOS_POR_SECCION, COLECCIONES, MODELO_LLM, TEMPERATURA_LLM, MODELO_EMBEDDINGS,
+    )
+
+
+async def generar_pliego_administrativo(datos: Datos, memo_contexto: Optional[dict] = None) -> dict:
     """
     Procesa los datos enviados por el usuario, redacta cada sección del pliego administrativo,
     y devuelve un diccionario con la información estructurada.
     """
     # Generar todas las secciones (async)
-    secciones = await redactar_secciones(datos)
-
-    # Unir las secciones en texto completo en markdown
-    texto_completo = "\n\n".join(f"## {titulo}\n\n{contenido}" for titulo, contenido in secciones.items())
-
-    # Aplicar revisión final con modelo Gemini
-    revisado = REVISION_FINAL | llm
-    pliego_final = revisado.invoke({"pliego": texto_completo}).content
+    secciones = await redactar_secciones(datos, memo_contexto=memo_contexto)
 
     return {
         "objeto": datos.objeto_contrato,
         "indice": list(secciones.keys()),
         "secciones": secciones,
-        "pliego_final": pliego_final
+        "pliego_final": await revisar_pliego(secciones, datos)
+    }
+
+
+async def revisar_pliego(secciones: Dict[str, str], datos: Datos, modo: Optional[str] = None,
+                         previas: Optional[Dict[str, str]] = None) -> str:
+    """
+    Aplica la revisión final con Gemini (sin bloquear el bucle de eventos). El modo (por defecto
+    ADM_MODO_REVISION) elige entre una llamada con el pliego completo y la revisión por secciones.
+    En la revisión por secciones, las de `previas` ya están revisadas y solo pasan por la coherencia.
+    """
+    if (modo or MODO_REVISION) == "secciones":
+        with etapa("revision"):
+            revisadas, advertencias = await revision_por_secciones(secciones, datos, previas)
+        return unir_secciones(revisadas) + apartado_advertencias(advertencias)
+
+    revisado = REVISION_FINAL | obtener_llm()
+    pliego = unir_secciones(secciones)
+    tokens = estimar_tokens(REVISION_FINAL.template) + 2 * estimar_tokens(pliego)  # Entrada y salida, de tamaño parecido
+    # La revisión cuenta para el mismo límite que las secciones: en un lote no se disparan todas a la vez
+    async with sem_secciones():
+        with etapa("revision"):
+            return (await pasarela_gemini().llamar(lambda: revisado.ainvoke({"pliego": pliego}), tokens=tokens)).content
+
+
+async def generar_pliego_administrativo_con_cache(datos: Datos) -> tuple:
+    """generar_pliego_administrativo con la caché delante. Devuelve (resultado, estado de la caché)."""
+    return await CACHE_PLIEGOS.obtener_o_generar(clave_pliego(datos), lambda: generar_pliego_administrativo(datos))
+
+
+async def generar_pliego_administrativo_stream(datos: Datos):
+    """
+    Versión en streaming de generar_pliego_administrativo. Devuelve eventos (tipo, datos):
+    primero un "seccion" por cada borrador según termina, después los "fragmento" de la
+    revisión final según los genera Gemini y, por último, "fin" con el objeto, el índice y el
+    estado de la caché. El pliego terminado se guarda en la caché, como en /generar.
+    """
+    clave = clave_pliego(datos)
+    # Si el pliego ya está en caché se reenvía tal cual, sin llamar a Gemini
+    cacheado, estado = await CACHE_PLIEGOS.obtener(clave)
+    if cacheado is not None:
+        for titulo, contenido in cacheado["secciones"].items():
+            yield "seccion", {"titulo": titulo, "posicion": SECCIONES.index(titulo), "contenido": contenido}
+        yield "fragmento", {"texto": cacheado["pliego_final"]}
+        yield "fin", {"objeto": cacheado["objeto"], "indice": cacheado["indice"], "cache": estado}
+        return
+
+    secciones = {}
+    async for titulo, contenido in redactar_secciones_stream(datos):
+        secciones[titulo] = contenido
+        yield "seccion", {"titulo": titulo, "posicion": SECCIONES.index(titulo), "contenido": contenido}
+
+    trozos = []
+    async for trozo in revision_final_stream(secciones, datos):
+        trozos.append(trozo)
+        yield "fragmento", {"texto": trozo}
+
+    indice = [s for s in SECCIONES if s in secciones]
+    await CACHE_PLIEGOS.guardar(clave, {
+        "objeto": datos.objeto_contrato,
+        "indice": indice,
+        "secciones": {sec: secciones[sec] for sec in indice},
+        "pliego_final": "".join(trozos),
+    })
+    yield "fin", {"objeto": datos.objeto_contrato, "indice": indice, "cache": MISS}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Lotes: varios pliegos con planificación conjunta
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def generar_lote(lote: List[Datos]):
+    """
+    Genera varios pliegos a la vez y los va devolviendo según terminan, como diccionarios
+    {"indice", "estado", "resultado"} o {"indice", "error"}.
+
+    Las secciones de todos los documentos compiten por el mismo sem_secciones() (el límite es
+    global, no por documento), el contexto normativo recuperado se comparte entre documentos
+    y cada pliego pasa por la caché, así que los repetidos no se generan dos veces.
+    """
+    memo_contexto: dict = {}
+
+    async def documento(i: int, datos: Datos) -> dict:
+        try:
+            resultado, estado = await CACHE_PLIEGOS.obtener_o_generar(
+                clave_pliego(datos), lambda: generar_pliego_administrativo(datos, memo_contexto)
+            )
+            return {"indice": i, "estado": estado, "resultado": resultado}
+        except Exception as e:
+            return {"indice": i, "error": str(e) or type(e).__name__}
+
+    tareas = [asyncio.create_task(documento(i, datos)) for i, datos in enumerate(lote)]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            yield await siguiente
+    finally:
+        for t in tareas:
+            t.cancel()
+        for futuro in memo_contexto.values():
+            futuro.cancel()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Borradores: regeneración incremental por sección
+# ──────────────────────────────────────────────────────────────────────────────
+
+def huellas_secciones(datos: Datos) -> Dict[str, str]:
+    """
+    Huella de la entrada de cada sección: los datos que recibe su prompt (proyectar_datos) junto
+    con las versiones de prompts, colecciones y modelos. Si no cambia, el texto ya redactado sigue valiendo.
+    """
+    proyeccion = proyectar_datos(datos)
+    comunes = (PROMPT.template, PROMPT_RESUMEN, VERSION_PROMPT_RESUMEN, COLECCIONES,
+               MODELO_LLM, TEMPERATURA_LLM, MODELO_EMBEDDINGS)
+    return {sec: clave_canonica("adm", sec, PAUTAS.get(sec, ""), proyeccion[sec], *comunes) for sec in SECCIONES}
+
+
+def _borrador(id_borrador: str, resultado: dict, regeneradas: list) -> dict:
+    return {"id": id_borrador, **resultado, "regeneradas": regeneradas}
+
+
+async def crear_borrador(datos: Datos) -> tuple:
+    """Genera el pliego completo (pasando por la caché) y lo guarda como borrador. Devuelve (borrador, estado)."""
+    resultado, estado = await generar_pliego_administrativo_con_cache(datos)
+    # Se guardan los campos tal como los envió el usuario: los calculados (vec, procedimiento...)
+    # se vuelven a calcular al validar la versión actualizada
+    id_borrador = await asyncio.to_thread(
+        recursos.obtener("borradores").crear, "adm", datos.model_dump(mode="json", exclude_unset=True),
+        huellas_secciones(datos), resultado,
+    )
+    return _borrador(id_borrador, resultado, list(resultado["secciones"])), estado
+
+
+async def obtener_borrador(id_borrador: str) -> Optional[dict]:
+    borrador = await asyncio.to_thread(recursos.obtener("borradores").obtener, id_borrador, "adm")
+    return None if borrador is None else _borrador(id_borrador, borrador["resultado"], [])
+
+
+async def actualizar_borrador(id_borrador: str, cambios: Dict[str, Any]) -> Optional[dict]:
+    """
+    Aplica un subconjunto de campos de Datos sobre el borrador y vuelve a redactar solo las
+    secciones cuya huella ha cambiado. La revisión final solo se repite si alguna sección cambió
+    y, en el modo de revisión por secciones, solo se revisan esas (más la pasada de coherencia).
+    Lanza ValidationError si los datos resultantes no son válidos.
+    """
+    almacen = recursos.obtener("borradores")
+    async with almacen.candado(id_borrador):
+        borrador = await asyncio.to_thread(almacen.obtener, id_borrador, "adm")
+        if borrador is None:
+            return None
+
+        entrada = fusionar(borrador["entrada"], cambios)
+        datos = Datos(**entrada)
+        huellas = huellas_secciones(datos)
+        cambiadas = [sec for sec in SECCIONES if huellas[sec] != borrador["huellas"].get(sec)]
+        anterior = borrador["resultado"]
+        if not cambiadas:
+            return _borrador(id_borrador, anterior, [])
+
+        nuevas = await redactar_secciones(datos, cambiadas)
+        secciones = {sec: nuevas.get(sec, anterior["secciones"].get(sec)) for sec in SECCIONES}
+        previas = None
+        if MODO_REVISION == "secciones":
+            # Las secciones que no cambian conservan su revisión, que se recupera del pliego final guardado
+            revisadas = separar_secciones(anterior.get("pliego_final") or "")
+            previas = {sec: texto for sec, texto in revisadas.items() if sec not in cambiadas}
+        resultado = {
+            "objeto": datos.objeto_contrato,
+            "indice": list(secciones.keys()),
+            "secciones": secciones,
+            "pliego_final": await revisar_pliego(secciones, datos, previas=previas),
+        }
+        await asyncio.to_thread(almacen.actualizar, id_borrador, entrada, huellas, resultado)
+        await CACHE_PLIEGOS.guardar(clave_pliego(datos), resultado)
+
+    return _borrador(id_borrador, resultado, cambiadas)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cola de trabajos
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def ejecutar_trabajo(entrada: Dict[str, Any]):
+    """
+    Ejecuta un trabajo de la cola: redacta el pliego en streaming, avisa de cada sección terminada
+    y del inicio de la revisión final, y acaba con el pliego completo (el stream ya lo guarda en la caché).
+    """
+    datos = Datos(**entrada["datos"])
+    secciones, trozos, final = {}, [], {}
+    async for tipo, contenido in generar_pliego_administrativo_stream(datos):
+        if tipo == "seccion":
+            secciones[contenido["titulo"]] = contenido["contenido"]
+            yield tipo, contenido
+        elif tipo == "fragmento":
+            if not trozos:
+                yield "revision", {}
+            trozos.append(contenido["texto"])
+        elif tipo == "fin":
+            final = contenido
+    resultado = {
+        "objeto": final["objeto"],
+        "indice": final["indice"],
+        "secciones": {sec: secciones[sec] for sec in SECCIONES if sec in secciones},
+        "pliego_final": "".join(trozos),
     }
+    yield "resultado", resultado
+
+
+# Cola de trabajos del proceso (ADM_TRABAJOS para la ruta SQLite, ADM_TRABAJADORES para el nº de workers).
+# La arranca y la para el lifespan de main_adm
+COLA_TRABAJOS = ColaTrabajos.desde_entorno(
+    "ADM", str(Path(__file__).resolve().parent / "trabajos.sqlite3"), ejecutar_trabajo
+)
+registrar_servicio("adm", CACHE_PLIEGOS, COLA_TRABAJOS)  # Caché y cola en /metrics
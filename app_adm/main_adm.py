@@ -1,13 +1,39 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from .api_adm import router
+from .core_adm import COLA_TRABAJOS
+from .recursos_adm import recursos
 from fastapi.middleware.cors import CORSMiddleware #Compartición de recursos entre dominios distintos
+from comun import metricas
+from comun.exportacion import cerrar_exportacion
+from comun.metricas import MiddlewareMetricas, RespuestaJSONMedida
+from comun.pasarela_llm import MiddlewarePlazo
+
+
+#Ciclo de vida de la app: los clientes (Gemini, embeddings, Qdrant, caché) se crean en segundo plano
+#al arrancar, sin retrasar que el worker empiece a aceptar peticiones, y se cierran al apagar.
+#La cola de trabajos arranca sus workers (y reanuda los pendientes) y se para antes de cerrar los clientes
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    calentamiento = asyncio.create_task(asyncio.to_thread(recursos.iniciar))
+    await COLA_TRABAJOS.iniciar()
+    yield
+    await COLA_TRABAJOS.cerrar()
+    cerrar_exportacion() #Pool de procesos de las exportaciones DOCX/PDF, si se llegó a crear
+    await calentamiento
+    await recursos.cerrar()
+
 
 #Crea una instancia de FastAPI
 app = FastAPI(
     title="API de Pliegos Administrativos",
     description="Genera pliegos Administrativos a partir de respuestas usando Gemini.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=RespuestaJSONMedida, #Mide la serialización de las respuestas JSON
 )
 
 # Permitir CORS si lo usarás desde frontend
@@ -18,5 +44,10 @@ app.add_middleware(
     allow_methods=["*"], #Métodos HTTP permitidos
     allow_headers=["*"], #Qué cabeceras están permitidas en la petición
 )
+#Plazo máximo por petición (LICIZEN_PLAZO_PETICION, en segundos): las llamadas a Gemini no se reintentan más allá
+app.add_middleware(MiddlewarePlazo)
+#Tiempo por petición y etapa (GET /metrics) y una línea JSON por petición con su desglose (LICIZEN_LOG_PETICIONES=0 la quita)
+app.add_middleware(MiddlewareMetricas, servicio="adm")
 # ¡¡Comentar que en desarrollo se permite usar *, sin embargo, en producción se recomienda especificar los dominios permitidos para mayor seguridad!!
+app.include_router(metricas.router) #GET /metrics
 app.include_router(router)
@@ -0,0 +1,130 @@
+# app/admin_precalculo.py
+"""
+Job de mantenimiento que precalcula el resumen de cada fragmento normativo y lo guarda
+en el payload del punto de Qdrant (metadata.resumen), junto a metadata.titulo.
+Así contexto_para lee el resumen directamente del resultado de la búsqueda y no llama a Gemini.
+
+Antes de empezar se asegura de que cada colección tiene el índice de texto sobre
+metadata.titulo que usa el filtro por palabra clave de contexto_para.
+
+Es incremental: se saltan los puntos que ya tienen resumen para VERSION_PROMPT_RESUMEN.
+Guarda por dónde va en cada colección, así que si se interrumpe continúa donde lo dejó.
+
+Uso:
+    python -m app_adm.precalculo_adm [--colecciones ...] [--lote 64] [--concurrencia 8] [--reiniciar]
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from qdrant_client.http import models
+
+from .LiciZen_adm import COLECCIONES, obtener_recuperacion, resumir_fragmentos
+from .resumenes_adm import VERSION_PROMPT_RESUMEN
+
+CLAVE_CONTENIDO = "page_content"  # Claves de payload que usa langchain_qdrant
+CLAVE_METADATOS = "metadata"
+RUTA_PROGRESO = Path(__file__).resolve().parent / "precalculo_progreso.json"
+
+
+def cargar_progreso(ruta: Path) -> dict:
+    return json.loads(ruta.read_text(encoding="utf-8")) if ruta.exists() else {}
+
+
+def guardar_progreso(ruta: Path, progreso: dict) -> None:
+    ruta.write_text(json.dumps(progreso, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+async def precalcular_coleccion(client, col: str, lote: int, limite: asyncio.Semaphore,
+                                progreso: dict, ruta_progreso: Path) -> dict:
+    """Recorre la colección con scroll y escribe los resúmenes que falten. Devuelve contadores."""
+    estado = progreso.setdefault(col, {"offset": None, "terminada": False})
+    if estado["terminada"]:
+        print(f"⏭️  '{col}' ya estaba completa")
+        return {"revisados": 0, "resumidos": 0}
+
+    revisados = resumidos = 0
+    inicio = time.perf_counter()
+    offset = estado["offset"]
+
+    while True:
+        puntos, siguiente = await asyncio.to_thread(
+            client.scroll, collection_name=col, limit=lote, offset=offset,
+            with_payload=True, with_vectors=False,
+        )
+        pendientes = [
+            p for p in puntos
+            if (p.payload.get(CLAVE_METADATOS) or {}).get("resumen_version") != VERSION_PROMPT_RESUMEN
+            and p.payload.get(CLAVE_CONTENIDO)
+        ]
+
+        # Los resúmenes pasan por la caché SQLite y por el semáforo del job (concurrencia acotada)
+        resumenes = await resumir_fragmentos([p.payload[CLAVE_CONTENIDO] for p in pendientes], limite)
+        # Una sola petición a Qdrant por lote, con un set_payload por punto
+        operaciones = [
+            models.SetPayloadOperation(set_payload=models.SetPayload(
+                payload={"resumen": resumen, "resumen_version": VERSION_PROMPT_RESUMEN},
+                points=[punto.id], key=CLAVE_METADATOS,
+            ))
+            for punto, resumen in zip(pendientes, resumenes)
+        ]
+        if operaciones:
+            await asyncio.to_thread(client.batch_update_points, collection_name=col, update_operations=operaciones)
+
+        revisados += len(puntos)
+        resumidos += len(pendientes)
+        transcurrido = time.perf_counter() - inicio
+        print(f"   {col}: {revisados} revisados, {resumidos} resumidos "
+              f"({revisados / transcurrido:.1f} puntos/s, {resumidos / transcurrido:.1f} resúmenes/s)")
+
+        # Checkpoint tras cada lote: si el job se corta, se reanuda desde aquí
+        estado["offset"] = siguiente
+        estado["terminada"] = siguiente is None
+        guardar_progreso(ruta_progreso, progreso)
+        if siguiente is None:
+            return {"revisados": revisados, "resumidos": resumidos}
+        offset = siguiente
+
+
+async def precalcular(colecciones, lote: int, concurrencia: int, ruta_progreso: Path, reiniciar: bool) -> None:
+    recuperacion = obtener_recuperacion()
+    client = recuperacion.client
+    if client is None:
+        raise SystemExit("❗ El precálculo escribe en Qdrant: usa ADM_BACKEND_VECTORIAL=qdrant o qdrant_local.")
+    limite = asyncio.Semaphore(concurrencia)
+    progreso = {} if reiniciar else cargar_progreso(ruta_progreso)
+    if progreso.get("version") != VERSION_PROMPT_RESUMEN:
+        progreso = {"version": VERSION_PROMPT_RESUMEN}  # Prompt nuevo: hay que volver a recorrerlo todo
+
+    await asyncio.to_thread(recuperacion.asegurar_indices, colecciones)
+
+    inicio = time.perf_counter()
+    total = {"revisados": 0, "resumidos": 0}
+    for col in colecciones:
+        print(f"📚 Colección '{col}'")
+        try:
+            contadores = await precalcular_coleccion(client, col, lote, limite, progreso, ruta_progreso)
+        except Exception as e:
+            print(f"⚠️ Error en '{col}': {e}")
+            continue
+        for clave in total:
+            total[clave] += contadores[clave]
+
+    transcurrido = time.perf_counter() - inicio
+    print(f"\n✅ {total['revisados']} puntos revisados, {total['resumidos']} resumidos en {transcurrido:.1f} s "
+          f"({total['resumidos'] / transcurrido if transcurrido else 0:.1f} resúmenes/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app_adm.precalculo_adm",
+                                     description="Precalcula los resúmenes de los fragmentos normativos en Qdrant.")
+    parser.add_argument("--colecciones", nargs="*", default=COLECCIONES, help="Colecciones a procesar (por defecto, todas)")
+    parser.add_argument("--lote", type=int, default=64, help="Puntos por página de scroll")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Resúmenes simultáneos contra Gemini")
+    parser.add_argument("--progreso", type=Path, default=RUTA_PROGRESO, help="Fichero de checkpoint")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora el checkpoint y recorre todo de nuevo")
+    args = parser.parse_args()
+
+    asyncio.run(precalcular(args.colecciones, args.lote, args.concurrencia, args.progreso, args.reiniciar))
@@ -0,0 +1,129 @@
+# app/admin_recuperacion.py
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from comun.metricas import etapa
+
+log = logging.getLogger(__name__)
+
+CAMPO_TITULO = "metadata.titulo"
+_PALABRA = re.compile(r"\w+")
+
+
+def palabras(texto: str) -> List[str]:
+    """Palabras en minúsculas, como las separa el índice de texto de Qdrant (tokenizer WORD, lowercase)."""
+    return _PALABRA.findall(str(texto or "").lower())
+
+
+def contiene_palabras(texto: str, keyword: str) -> bool:
+    """True si todas las palabras de `keyword` aparecen enteras en `texto`: la semántica de MatchText en Qdrant."""
+    return set(palabras(keyword)) <= set(palabras(texto))
+
+
+def filtro_titulo(keyword: str):
+    """
+    Filtro de Qdrant por palabra clave en metadata.titulo, resuelto en el servidor. Con el índice de
+    texto de asegurar_indices, MatchText compara palabras enteras (no subcadenas): equivale a
+    contiene_palabras(titulo, keyword), que es lo que aplican el índice NumPy y la búsqueda de respaldo.
+    """
+    from qdrant_client.http import models  # Importación diferida: qdrant_client tarda en cargar
+
+    return models.Filter(must=[models.FieldCondition(key=CAMPO_TITULO, match=models.MatchText(text=keyword))])
+
+
+class ServicioRecuperacion:
+    """
+    Recuperación de contexto normativo sobre varias colecciones vectoriales.
+
+    Se crea una vez por proceso y reutiliza un almacén por colección (creados por
+    vectoriales_adm.crear_almacenes según el backend configurado). Las colecciones se
+    consultan en paralelo, cada una con su timeout, y los resultados se mezclan por
+    puntuación. También guarda los embeddings de consultas recientes.
+    """
+
+    def __init__(self, almacenes: Dict[str, object], emb, cuotas: Dict[str, int],
+                 k_por_coleccion: int = 3, k_respaldo: int = 40, timeout: float = 10.0,
+                 max_busquedas: int = 8, cache_embeddings: int = 256,
+                 client=None, async_client=None):
+        self.almacenes = almacenes
+        self.emb = emb
+        self.colecciones = list(almacenes)
+        self.cuotas = {col: cuotas.get(col, k_por_coleccion) for col in self.colecciones}
+        self.k_respaldo = k_respaldo
+        self.timeout = timeout
+        self.client = client  # Solo los backends Qdrant tienen cliente (para índices y mantenimiento)
+        self.async_client = async_client
+        self._semaforo = asyncio.Semaphore(max_busquedas)
+        self._embeddings: LRUCache = LRUCache(maxsize=cache_embeddings)
+
+    async def vector_consulta(self, consulta: str) -> List[float]:
+        """Embedding de la consulta, calculado una sola vez y reutilizado desde la caché LRU."""
+        vector = self._embeddings.get(consulta)
+        if vector is None:
+            with etapa("embedding"):
+                vector = await self.emb.aembed_query(consulta)
+            self._embeddings[consulta] = vector
+        return vector
+
+    async def _buscar(self, col: str, vector: List[float], k: int, filtro):
+        async with self._semaforo:
+            try:
+                with etapa("busqueda", coleccion=col.strip()):
+                    return await asyncio.wait_for(
+                        self.almacenes[col].asimilarity_search_with_score_by_vector(vector, k=k, filter=filtro),
+                        timeout=self.timeout,
+                    )
+            except asyncio.TimeoutError:
+                log.warning("Búsqueda en '%s' sin respuesta tras %.1f s", col, self.timeout)
+            except Exception:
+                log.exception("Error al buscar en '%s'", col)
+            return []
+
+    async def buscar(self, vector: List[float], filtro=None,
+                     k: Optional[int] = None) -> List[Tuple[object, float]]:
+        """Busca en todas las colecciones a la vez y devuelve (documento, score) de mayor a menor score."""
+        resultados = await asyncio.gather(*(
+            self._buscar(col, vector, k or self.cuotas[col], filtro) for col in self.colecciones
+        ))
+        return sorted((hit for hits in resultados for hit in hits), key=lambda hit: hit[1], reverse=True)
+
+    async def buscar_por_palabra(self, keyword: str, vector: List[float], k: int) -> list:
+        """
+        Documentos cuyo título contiene la palabra clave entera (filtro en Qdrant, cuota por colección).
+        Si no hay ninguno, búsqueda amplia sin filtro y la misma coincidencia por palabra en Python.
+        """
+        candidatos = [doc for doc, _ in await self.buscar(vector, filtro_titulo(keyword))]
+        if candidatos:
+            return candidatos[:k]
+
+        docs = [doc for doc, _ in await self.buscar(vector, k=self.k_respaldo)]
+        candidatos = [d for d in docs if contiene_palabras(d.metadata.get("titulo", ""), keyword)]
+        return (candidatos or docs)[:k]  # si no hay coincidencia por keyword, devolvemos cualquiera
+
+    def asegurar_indices(self, colecciones: Optional[List[str]] = None) -> None:
+        """Crea (si falta) el índice de texto sobre metadata.titulo que usa el filtro por palabra clave."""
+        if self.client is None:
+            return  # El índice NumPy filtra en memoria, no necesita índices de payload
+        from qdrant_client.http import models
+
+        for col in colecciones or self.colecciones:
+            try:
+                self.client.create_payload_index(
+                    collection_name=col,
+                    field_name=CAMPO_TITULO,
+                    field_schema=models.TextIndexParams(
+                        type=models.TextIndexType.TEXT,
+                        tokenizer=models.TokenizerType.WORD,
+                        lowercase=True,
+                    ),
+                )
+            except Exception as e:
+                log.warning("No se pudo crear el índice en '%s': %s", col, e)
+
+    async def cerrar(self) -> None:
+        if self.async_client is not None:
+            await self.async_client.close()
@@ -0,0 +1,76 @@
+# app/admin_recursos.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class Recursos:
+    """
+    Registro perezoso de recursos caros del proceso (clientes de LLM, embeddings, Qdrant...).
+
+    Cada recurso se registra con una fábrica y solo se construye la primera vez que se pide,
+    así importar el módulo no cuesta nada. iniciar() los construye todos por adelantado (lo
+    llama el lifespan de FastAPI en segundo plano) y cerrar() los libera al apagar.
+    El registro es por proceso: si el proceso se bifurca (workers con preload) el hijo
+    vuelve a construir sus propios clientes en lugar de heredar conexiones del padre.
+    """
+
+    def __init__(self):
+        self._fabricas: Dict[str, Callable[[], Any]] = {}
+        self._cierres: Dict[str, Callable[[Any], Any]] = {}
+        self._objetos: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self.tiempos: Dict[str, float] = {}  # Segundos que tardó en construirse cada recurso
+
+    def registrar(self, nombre: str, fabrica: Callable[[], Any], cierre: Optional[Callable[[Any], Any]] = None) -> None:
+        self._fabricas[nombre] = fabrica
+        if cierre is not None:
+            self._cierres[nombre] = cierre
+
+    def obtener(self, nombre: str) -> Any:
+        if self._pid != os.getpid():
+            with self._lock:
+                self._objetos, self._pid = {}, os.getpid()
+        objeto = self._objetos.get(nombre)
+        if objeto is None:
+            with self._lock:
+                objeto = self._objetos.get(nombre)
+                if objeto is None:
+                    inicio = time.perf_counter()
+                    objeto = self._fabricas[nombre]()
+                    self.tiempos[nombre] = time.perf_counter() - inicio
+                    self._objetos[nombre] = objeto
+        return objeto
+
+    def iniciar(self) -> None:
+        """Construye todos los recursos registrados. Un fallo no impide arrancar: se reintenta al usarlo."""
+        for nombre in self._fabricas:
+            try:
+                self.obtener(nombre)
+            except Exception as e:
+                log.warning("No se pudo iniciar '%s' (se reintentará al usarlo): %s", nombre, e)
+        log.info("Recursos iniciados: %s", {n: round(t, 3) for n, t in self.tiempos.items()})
+
+    async def cerrar(self) -> None:
+        """Libera los recursos construidos en orden inverso y vacía el registro."""
+        with self._lock:
+            objetos, self._objetos = self._objetos, {}
+        for nombre, objeto in reversed(list(objetos.items())):
+            cierre = self._cierres.get(nombre)
+            if cierre is None:
+                continue
+            try:
+                resultado = cierre(objeto)
+                if asyncio.iscoroutine(resultado):
+                    await resultado
+            except Exception as e:
+                log.warning("Error al cerrar '%s': %s", nombre, e)
+
+
+recursos = Recursos()
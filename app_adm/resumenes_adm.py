@@ -0,0 +1,64 @@
+# app/admin_resumenes.py
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+# Si se cambia el prompt de resumen hay que subir la versión: las claves cambian y
+# los resúmenes antiguos dejan de usarse sin tener que borrar la caché.
+VERSION_PROMPT_RESUMEN = "v1"
+PROMPT_RESUMEN = "Resume en dos líneas:\n{texto}"
+
+RUTA_CACHE_RESUMENES = Path(os.getenv(
+    "ADM_CACHE_RESUMENES", Path(__file__).resolve().parent / "cache_resumenes.sqlite3"
+))
+
+
+def clave_resumen(texto: str) -> str:
+    """Clave direccionada por contenido: hash del fragmento y de la versión del prompt."""
+    return hashlib.sha256(f"{VERSION_PROMPT_RESUMEN}\n{texto}".encode("utf-8")).hexdigest()
+
+
+class CacheResumenes:
+    """
+    Caché persistente (SQLite) de resúmenes de fragmentos normativos.
+    Sobrevive a reinicios y, gracias al modo WAL, la comparten varios workers.
+    Los métodos son bloqueantes: desde código async se llaman con asyncio.to_thread.
+    """
+
+    def __init__(self, ruta: Path = RUTA_CACHE_RESUMENES):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(self.ruta, check_same_thread=False, timeout=30)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS resumenes (clave TEXT PRIMARY KEY, resumen TEXT NOT NULL)"
+        )
+        self._conexion.commit()
+
+    def obtener_varios(self, claves: Iterable[str]) -> Dict[str, str]:
+        claves = list(set(claves))
+        if not claves:
+            return {}
+        marcas = ",".join("?" * len(claves))
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT clave, resumen FROM resumenes WHERE clave IN ({marcas})", claves
+            ).fetchall()
+        return dict(filas)
+
+    def guardar_varios(self, pares: List[Tuple[str, str]]) -> None:
+        if not pares:
+            return
+        with self._lock:
+            self._conexion.executemany(
+                "INSERT OR REPLACE INTO resumenes (clave, resumen) VALUES (?, ?)", pares
+            )
+            self._conexion.commit()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conexion.close()
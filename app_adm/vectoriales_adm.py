@@ -0,0 +1,164 @@
+# app/admin_vectoriales.py
+"""
+Backends de almacén vectorial para ServicioRecuperacion, elegibles con ADM_BACKEND_VECTORIAL:
+
+- "qdrant":       Qdrant remoto (QDRANT_URL / QDRANT_API_KEY). Es el de producción.
+- "qdrant_local": Qdrant en modo local, dentro del proceso (ADM_QDRANT_RUTA o ":memory:").
+- "numpy":        índice en memoria con búsqueda coseno por lotes sobre una matriz float32
+                  (se carga de ADM_INDICE_NUMPY si existe).
+
+Todos exponen lo que usa ServicioRecuperacion: asimilarity_search_with_score_by_vector(vector, k, filter).
+"""
+import json
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import qdrant_client
+from qdrant_client.http import models
+from langchain_core.documents import Document
+from langchain_qdrant import Qdrant
+
+from .recuperacion_adm import contiene_palabras, palabras
+
+BACKENDS = ("qdrant", "qdrant_local", "numpy")
+
+
+def _valor(metadata: dict, clave: str):
+    """Lee 'metadata.titulo' (clave de payload de Qdrant) de los metadatos de un Document."""
+    return metadata.get(clave.split(".", 1)[1] if clave.startswith("metadata.") else clave)
+
+
+def cumple_filtro(metadata: dict, filtro: Optional[models.Filter]) -> bool:
+    """
+    Evalúa en Python las condiciones `must` de coincidencia que usamos (MatchText y MatchValue).
+    MatchText compara palabras enteras, como Qdrant con el índice de texto (ver recuperacion_adm.filtro_titulo).
+    """
+    if filtro is None:
+        return True
+    for condicion in filtro.must or []:
+        valor = _valor(metadata, condicion.key)
+        if isinstance(condicion.match, models.MatchText):
+            if not contiene_palabras(valor, condicion.match.text):
+                return False
+        elif isinstance(condicion.match, models.MatchValue):
+            if valor != condicion.match.value:
+                return False
+        else:
+            raise ValueError(f"Condición no soportada por el índice NumPy: {condicion}")
+    return True
+
+
+class IndiceNumpy:
+    """
+    Índice vectorial en memoria de una colección: matriz float32 (n × d) de vectores normalizados
+    y la lista de Documents correspondiente. La similitud coseno es un producto matricial.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.matriz = np.empty((0, dimension), dtype=np.float32)
+        self.documentos: List[Document] = []
+        self._columnas = {}  # clave de metadatos → array de " palabra palabra " por documento (para filtrar rápido)
+
+    @staticmethod
+    def _normalizar(vectores) -> np.ndarray:
+        vectores = np.atleast_2d(np.asarray(vectores, dtype=np.float32))
+        normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+        return vectores / np.maximum(normas, 1e-12)
+
+    def anadir(self, vectores, documentos: List[Document]) -> None:
+        self.matriz = np.vstack([self.matriz, self._normalizar(vectores)])
+        self.documentos.extend(documentos)
+        self._columnas.clear()
+
+    def _mascara(self, filtro: models.Filter) -> np.ndarray:
+        """
+        Filas que cumplen el filtro. MatchText se resuelve vectorizado sobre una columna precalculada con las
+        palabras de cada valor separadas por espacios: buscar " palabra " solo encuentra palabras enteras.
+        """
+        mascara = np.ones(len(self.documentos), dtype=bool)
+        for condicion in filtro.must or []:
+            if isinstance(condicion.match, models.MatchText):
+                if condicion.key not in self._columnas:
+                    self._columnas[condicion.key] = np.array(
+                        [" " + " ".join(palabras(_valor(d.metadata, condicion.key))) + " " for d in self.documentos]
+                    )
+                for palabra in palabras(condicion.match.text):
+                    mascara &= np.char.find(self._columnas[condicion.key], f" {palabra} ") >= 0
+            else:
+                unica = models.Filter(must=[condicion])
+                mascara &= np.array([cumple_filtro(d.metadata, unica) for d in self.documentos], dtype=bool)
+        return mascara
+
+    def buscar_lote(self, consultas, k: int, filtro: Optional[models.Filter] = None) -> List[List[Tuple[Document, float]]]:
+        """Busca varias consultas a la vez (una multiplicación de matrices para todas)."""
+        if not self.documentos:
+            return [[] for _ in np.atleast_2d(consultas)]
+        if filtro is not None:
+            indices = np.flatnonzero(self._mascara(filtro))
+        else:
+            indices = np.arange(len(self.documentos))
+        if indices.size == 0:
+            return [[] for _ in np.atleast_2d(consultas)]
+
+        puntuaciones = self._normalizar(consultas) @ self.matriz[indices].T
+        k = min(k, indices.size)
+        mejores = np.argpartition(-puntuaciones, k - 1, axis=1)[:, :k]
+        resultados = []
+        for fila, candidatos in zip(puntuaciones, mejores):
+            ordenados = candidatos[np.argsort(-fila[candidatos])]
+            resultados.append([(self.documentos[indices[i]], float(fila[i])) for i in ordenados])
+        return resultados
+
+    async def asimilarity_search_with_score_by_vector(self, embedding, k: int = 4, filter: Optional[models.Filter] = None, **_):
+        return self.buscar_lote([embedding], k, filter)[0]
+
+    def guardar(self, ruta: Path) -> None:
+        ruta.mkdir(parents=True, exist_ok=True)
+        np.save(ruta / "vectores.npy", self.matriz)
+        with open(ruta / "documentos.jsonl", "w", encoding="utf-8") as f:
+            for d in self.documentos:
+                f.write(json.dumps({"page_content": d.page_content, "metadata": d.metadata}, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def cargar(cls, ruta: Path) -> "IndiceNumpy":
+        matriz = np.load(ruta / "vectores.npy")
+        indice = cls(matriz.shape[1])
+        indice.matriz = matriz.astype(np.float32, copy=False)
+        with open(ruta / "documentos.jsonl", encoding="utf-8") as f:
+            indice.documentos = [Document(**json.loads(linea)) for linea in f]
+        indice._columnas = {}
+        return indice
+
+
+def crear_almacenes(backend: str, colecciones: List[str], emb, url: Optional[str] = None,
+                    api_key: Optional[str] = None, ruta_local: str = ":memory:",
+                    ruta_numpy: Optional[str] = None, dimension: int = 768):
+    """
+    Crea los almacenes por colección para el backend elegido.
+    Devuelve (almacenes, client, async_client); los clientes son None si el backend no los usa.
+    """
+    if backend == "qdrant":
+        client = qdrant_client.QdrantClient(url=url, api_key=api_key)
+        async_client = qdrant_client.AsyncQdrantClient(url=url, api_key=api_key)
+    elif backend == "qdrant_local":
+        # En modo local el fichero queda bloqueado por un único cliente: las llamadas async
+        # de langchain se ejecutan entonces con el cliente síncrono en un hilo
+        client = qdrant_client.QdrantClient(location=ruta_local) if ruta_local == ":memory:" else qdrant_client.QdrantClient(path=ruta_local)
+        async_client = None
+    elif backend == "numpy":
+        base = Path(ruta_numpy) if ruta_numpy else None
+        almacenes = {
+            col: IndiceNumpy.cargar(base / col.strip()) if base and (base / col.strip()).exists() else IndiceNumpy(dimension)
+            for col in colecciones
+        }
+        return almacenes, None, None
+    else:
+        raise ValueError(f"Backend vectorial desconocido: {backend!r} (opciones: {', '.join(BACKENDS)})")
+
+    almacenes = {
+        col: Qdrant(client=client, async_client=async_client, collection_name=col, embeddings=emb)
+        for col in colecciones
+    }
+    return almacenes, client, async_client
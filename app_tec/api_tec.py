@@ -1,9 +1,20 @@
 # app/api.py
-from fastapi import APIRouter
-from .model_tec import PreguntasRequest, SeccionesResponse
-from .core_tec import procesar_pliego
+import json
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response
+from .model_tec import PreguntasRequest, SeccionesResponse, BorradorResponse, CambiosBorrador, LoteRequest
+from .core_tec import (
+    procesar_pliego_con_cache, procesar_pliego_stream, procesar_lote, crear_borrador, obtener_borrador, actualizar_borrador,
+    COLA_TRABAJOS,
+)
 from .utils import obtener_preguntas
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from comun.exportacion import pliego_exportable, respuesta_descarga, respuesta_texto
+from comun.sse import evento_sse
+
+TITULO_PLIEGO = "Pliego de prescripciones técnicas"
+TITULO_TEXTO = "Pliego técnico" #Cabecera de siempre de /generar/texto ("PLIEGO TÉCNICO PARA: ...")
 
 #Creamos la instancia del router
 router = APIRouter()
@@ -15,24 +26,143 @@ def listar_preguntas():
 
 #Definimos un endpoint para generar el pliego técnico
 @router.post("/generar", response_model=SeccionesResponse)
-def generar_pliego(request: PreguntasRequest):
-    resultado = procesar_pliego(request.respuestas) #Se extraen las respuestas del usuario, se pasa a procesar_pliego y devuelve respuesta JSON
+async def generar_pliego(request: PreguntasRequest, response: Response):
+    resultado, estado = await procesar_pliego_con_cache(request.respuestas) #Se extraen las respuestas del usuario, se pasa a procesar_pliego y devuelve respuesta JSON
+    response.headers["X-Cache"] = estado #HIT si el mismo pliego ya estaba generado, MISS si se ha generado ahora
     return resultado
 
 
-@router.post("/generar/texto", response_class=PlainTextResponse)
-def generar_pliego_texto(request: PreguntasRequest):
-    resultado = procesar_pliego(request.respuestas)
+#Igual que /generar pero en streaming (Server-Sent Events): envía cada sección en cuanto termina
+#(y sus fragmentos mientras se redacta) y acaba con un evento "fin" con el objeto, el índice y
+#el estado de la caché en "cache" (el mismo valor que /generar envía en la cabecera X-Cache)
+@router.post("/generar/stream")
+async def generar_pliego_stream(request: PreguntasRequest):
+    async def eventos():
+        try:
+            async for tipo, datos in procesar_pliego_stream(request.respuestas):
+                yield evento_sse(tipo, datos)
+        except Exception as e:
+            yield evento_sse("error", {"detalle": str(e)})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, #Evita que un proxy acumule la respuesta
+    )
+
+
+#Lote de pliegos: se generan todos con un límite de concurrencia común y cada uno se devuelve
+#en cuanto termina, como una línea JSON (NDJSON) con su "indice" en la lista enviada
+@router.post("/generar/lote")
+async def generar_lote(request: LoteRequest):
+    async def lineas():
+        async for evento in procesar_lote(request.documentos):
+            yield json.dumps(evento, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+#Trabajos: POST devuelve un ID al momento (202) y el pliego se genera en la cola de trabajos.
+#El cliente consulta el estado (polling) o se suscribe a los eventos de progreso por sección
+@router.post("/generar/trabajos", status_code=202)
+async def encolar_pliego(request: PreguntasRequest):
+    id_trabajo = await COLA_TRABAJOS.encolar({"respuestas": request.respuestas}, total=len(request.respuestas))
+    return {"id": id_trabajo, "estado": "pendiente"}
+
+
+#Profundidad de la cola y tiempos de espera y de ejecución
+@router.get("/generar/trabajos/estadisticas")
+async def estadisticas_trabajos():
+    return await COLA_TRABAJOS.estadisticas()
+
+
+@router.get("/generar/trabajos/{id_trabajo}")
+async def consultar_trabajo(id_trabajo: str):
+    trabajo = await COLA_TRABAJOS.obtener(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+
+@router.get("/generar/trabajos/{id_trabajo}/eventos")
+async def eventos_trabajo(id_trabajo: str):
+    if await COLA_TRABAJOS.obtener(id_trabajo) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def eventos():
+        async for tipo, datos in COLA_TRABAJOS.suscribir(id_trabajo):
+            yield evento_sse(tipo, datos)
 
-    # Construir el texto plano final
-    texto = f"PLIEGO TÉCNICO PARA: {resultado['objeto']}\n\n"
-    texto += "ÍNDICE:\n"
-    for item in resultado["indice"]:
-        texto += f"- {item}\n"
-    texto += "\n"
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    for titulo, contenido in resultado["secciones"].items():
-        texto += f"{titulo.strip().upper()}\n"
-        texto += f"{contenido.strip()}\n\n"
 
-    return texto
\ No newline at end of file
+#Borradores: se genera el pliego una vez y se guarda con un ID. Después, PATCH con solo las respuestas
+#que han cambiado vuelve a redactar únicamente las secciones afectadas
+@router.post("/borradores", response_model=BorradorResponse)
+async def crear_borrador_pliego(request: PreguntasRequest, response: Response):
+    borrador, estado = await crear_borrador(request.respuestas)
+    response.headers["X-Cache"] = estado
+    return borrador
+
+
+@router.get("/borradores/{id_borrador}", response_model=BorradorResponse)
+async def leer_borrador_pliego(id_borrador: str):
+    borrador = await obtener_borrador(id_borrador)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return borrador
+
+
+@router.patch("/borradores/{id_borrador}", response_model=BorradorResponse)
+async def actualizar_borrador_pliego(id_borrador: str, cambios: CambiosBorrador):
+    borrador = await actualizar_borrador(id_borrador, cambios.respuestas)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return borrador
+
+
+#Exportación a DOCX o PDF (con índice) de un pliego ya generado, sin llamar a Gemini. Se renderiza en un pool
+#de procesos, se guarda en caché por contenido y se descarga en streaming; con el mismo ETag responde 304
+@router.post("/exportar/{formato}")
+async def exportar_pliego(formato: Literal["docx", "pdf"], pliego: SeccionesResponse,
+                          if_none_match: Optional[str] = Header(None)):
+    return await respuesta_descarga(pliego_exportable(TITULO_PLIEGO, pliego.model_dump()), formato, if_none_match)
+
+
+@router.get("/borradores/{id_borrador}/exportar/{formato}")
+async def exportar_borrador_pliego(id_borrador: str, formato: Literal["docx", "pdf"],
+                                   if_none_match: Optional[str] = Header(None)):
+    borrador = await obtener_borrador(id_borrador)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return await respuesta_descarga(pliego_exportable(TITULO_PLIEGO, borrador), formato, if_none_match)
+
+
+#Texto, markdown o HTML de un pliego ya generado, sin llamar a Gemini: el cliente que ya tiene el JSON de /generar
+#lo envía tal cual, o se pide el de un borrador guardado (POST /borradores lo guarda con un ID).
+#Se envía en streaming, una sección cada vez
+@router.post("/render/{formato}")
+async def renderizar_pliego(formato: Literal["texto", "markdown", "html"], pliego: SeccionesResponse):
+    return respuesta_texto(pliego_exportable(TITULO_PLIEGO, pliego.model_dump()), formato)
+
+
+@router.get("/borradores/{id_borrador}/render/{formato}")
+async def renderizar_borrador_pliego(id_borrador: str, formato: Literal["texto", "markdown", "html"]):
+    borrador = await obtener_borrador(id_borrador)
+    if borrador is None:
+        raise HTTPException(status_code=404, detail="Borrador no encontrado")
+    return respuesta_texto(pliego_exportable(TITULO_PLIEGO, borrador), formato)
+
+
+@router.post("/generar/texto", response_class=PlainTextResponse)
+async def generar_pliego_texto(request: PreguntasRequest):
+    #Usa la misma caché que /generar: si el pliego ya se generó en JSON no se vuelve a generar
+    #(para no depender de la caché, mejor POST /render/texto con ese JSON o el render de un borrador)
+    resultado, estado = await procesar_pliego_con_cache(request.respuestas)
+    respuesta = respuesta_texto(pliego_exportable(TITULO_TEXTO, resultado), "texto")
+    respuesta.headers["X-Cache"] = estado #HIT si el mismo pliego ya estaba generado, MISS si se ha generado ahora
+    return respuesta
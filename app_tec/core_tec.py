@@ -1,34 +1,284 @@
 # app/core.py
-from .utils import inicializar_gemini
-from .prompts import generar_prompt_por_seccion
+import asyncio
+import os
+from pathlib import Path
+
+from comun.borradores import AlmacenBorradores, fusionar
+from comun.cache_resultados import MISS, CacheResultados, clave_canonica
+from comun.metricas import etapa, registrar_servicio
+from comun.pasarela_llm import estimar_tokens, pasarela
+from comun.trabajos import ColaTrabajos
+from .utils import inicializar_gemini, obtener_preguntas, configuracion_gemini
+from .prompts import generar_prompt_por_seccion, huella_prompt
+
+#Número máximo de secciones que se redactan a la vez contra Gemini (configurable por entorno)
+MAX_CONCURRENCIA = int(os.getenv("TEC_MAX_CONCURRENCIA", "6"))
+
+#Caché de pliegos completos (TEC_CACHE_MAX, TEC_CACHE_TTL y, opcional, TEC_CACHE_DISCO)
+CACHE_PLIEGOS = CacheResultados.desde_entorno("TEC")
+
+#Borradores guardados para regenerar solo las secciones que cambian (ruta configurable con TEC_BORRADORES)
+RUTA_BORRADORES = str(Path(__file__).resolve().parent / "borradores.sqlite3")
+_BORRADORES = {} #Un almacén por proceso (la conexión SQLite no se comparte entre workers)
+
+
+#Pasarela de llamadas del modelo (límite RPM/TPM, concurrencia adaptativa y reintentos ante 429/503),
+#compartida por todas las peticiones del proceso
+def pasarela_de(modelo):
+    return pasarela(getattr(modelo, "model_name", "gemini").removeprefix("models/"))
+
+
+#Redacta una única sección respetando el límite de concurrencia
+async def redactar_seccion(modelo, titulo: str, contenido: dict, limite: asyncio.Semaphore) -> str:
+    prompt = generar_prompt_por_seccion(titulo, contenido) #Crea el prompt para la sección con su respuesta
+    async with limite:
+        #Llama al modelo Gemini sin bloquear el bucle de eventos; si hay un 429 se reintenta en lugar de fallar el pliego
+        with etapa("seccion", seccion=titulo.strip()): #Tiempo y tokens por sección, para /metrics
+            respuesta = await pasarela_de(modelo).llamar(lambda: modelo.generate_content_async(prompt), tokens=estimar_tokens(prompt))
+    return respuesta.text
+
+
+#Extrae el objeto del contrato de las respuestas para usarlo en el título del pliego
+def obtener_objeto(respuestas: dict) -> str:
+    objeto_pregunta = "¿Cuál es el objeto principal del contrato? (por ejemplo: escaneo de documentos, desarrollo de software, suministro de material…)"
+    return respuestas.get(" Objeto del Contrato", {}).get(objeto_pregunta, "").capitalize()
+
+
+#Genera el índice del pliego a partir de los títulos de las secciones
+def generar_indice(titulos) -> list:
+    return [titulo.split(". ", 1)[-1].capitalize() for titulo in titulos]
 
 
 #Es como si fuese el generador del pliego, ya que:
     # - Recibe respuestas
-    # - Crea los prompts para cada sección y genera el contenido
+    # - Crea los prompts para cada sección y los lanza en paralelo (con un máximo de MAX_CONCURRENCIA a la vez)
     # - Devuelve un pliego téncico estrucutrado y rellenado
-def procesar_pliego(respuestas: dict) -> dict:
+async def procesar_pliego(respuestas: dict, max_concurrencia: int = MAX_CONCURRENCIA) -> dict:
     #Cargamos la clave del modelo Gemini
     modelo = inicializar_gemini()
-    secciones_redactadas = {}
-     
-    #Itera por cada sección y genera el contenido del pliego
-    for titulo, contenido in respuestas.items():
-        prompt = generar_prompt_por_seccion(titulo, contenido) #Crea el prompt para la sección con su respuesta
-        respuesta = modelo.generate_content(prompt) #Llama al modelo Gemini para generar el contenido de la sección
-        secciones_redactadas[titulo] = respuesta.text #Guarda el contenido generado
-
-    #Para añadir el objeto del contrato y usarlo para el título del pliego
-    objeto_pregunta = "¿Cuál es el objeto principal del contrato? (por ejemplo: escaneo de documentos, desarrollo de software, suministro de material…)"
-    objeto = respuestas.get(" Objeto del Contrato", {}).get(objeto_pregunta, "").capitalize()
+    limite = asyncio.Semaphore(max(1, max_concurrencia))
 
-    #Genera el índice del pliego
-    indice = [titulo.split(". ", 1)[-1].capitalize() for titulo in secciones_redactadas]
+    #Lanza todas las secciones a la vez; gather devuelve los textos en el mismo orden que las respuestas
+    titulos = list(respuestas)
+    textos = await asyncio.gather(*(
+        redactar_seccion(modelo, titulo, respuestas[titulo], limite) for titulo in titulos
+    ))
+    secciones_redactadas = dict(zip(titulos, textos))
 
     #Devuelve un diccionario con los resultados
     return {
-        "objeto": objeto,
-        "indice": indice,
+        "objeto": obtener_objeto(respuestas),
+        "indice": generar_indice(secciones_redactadas),
         "secciones": secciones_redactadas
     }
 
+
+#Clave de caché de un pliego: respuestas + versión del prompt + modelo y parámetros de generación
+def clave_pliego(respuestas: dict) -> str:
+    return clave_canonica("tec", respuestas, huella_prompt(), configuracion_gemini())
+
+
+#procesar_pliego con caché delante: devuelve (resultado, estado de la caché).
+#Si ya se generó el mismo pliego (p. ej. el usuario recarga o reintenta) no se llama a Gemini
+async def procesar_pliego_con_cache(respuestas: dict) -> tuple:
+    return await CACHE_PLIEGOS.obtener_o_generar(clave_pliego(respuestas), lambda: procesar_pliego(respuestas))
+
+
+#Versión en streaming de procesar_pliego. Es un generador asíncrono que va devolviendo eventos (tipo, datos):
+    # - ("fragmento", {...}) con cada trozo de texto según lo va generando Gemini
+    # - ("seccion", {...}) cuando una sección está terminada, con su título, posición y contenido
+    # - ("fin", {...}) al acabar todas, con el objeto, el índice del pliego y el estado de la caché
+#Las secciones se redactan en paralelo, así que sus eventos llegan en el orden en que terminan;
+#la "posicion" (orden en obtener_preguntas) permite al cliente colocarlas en su sitio.
+#Al terminar, el pliego completo se guarda en la caché, así que reenviar el mismo formulario no vuelve a llamar a Gemini
+async def procesar_pliego_stream(respuestas: dict, max_concurrencia: int = MAX_CONCURRENCIA):
+    clave = clave_pliego(respuestas)
+    #Si el pliego ya está en caché se reenvían sus secciones sin llamar a Gemini
+    cacheado, estado = await CACHE_PLIEGOS.obtener(clave)
+    if cacheado is not None:
+        orden_preguntas = [titulo for titulo, _ in obtener_preguntas()]
+        for i, (titulo, contenido) in enumerate(cacheado["secciones"].items()):
+            posicion = orden_preguntas.index(titulo) if titulo in orden_preguntas else len(orden_preguntas) + i
+            yield "seccion", {"titulo": titulo, "posicion": posicion, "contenido": contenido}
+        yield "fin", {"objeto": cacheado["objeto"], "indice": cacheado["indice"], "cache": estado}
+        return
+
+    modelo = inicializar_gemini()
+    limite = asyncio.Semaphore(max(1, max_concurrencia))
+    cola = asyncio.Queue()
+
+    titulos = list(respuestas)
+    orden_preguntas = [titulo for titulo, _ in obtener_preguntas()]
+    posiciones = {
+        titulo: orden_preguntas.index(titulo) if titulo in orden_preguntas else len(orden_preguntas) + i
+        for i, titulo in enumerate(titulos)
+    }
+
+    async def redactar_en_streaming(titulo: str):
+        prompt = generar_prompt_por_seccion(titulo, respuestas[titulo])
+        trozos = [] #Solo se guarda la sección en curso, nunca el pliego completo
+
+        async def abrir():
+            respuesta = await modelo.generate_content_async(prompt, stream=True)
+            async for chunk in respuesta:
+                yield chunk.text
+
+        try:
+            async with limite:
+                with etapa("seccion", seccion=titulo.strip()):
+                    async for texto in pasarela_de(modelo).transmitir(abrir, tokens=estimar_tokens(prompt)):
+                        trozos.append(texto)
+                        await cola.put(("fragmento", {"titulo": titulo, "posicion": posiciones[titulo], "texto": texto}))
+            await cola.put(("seccion", {"titulo": titulo, "posicion": posiciones[titulo], "contenido": "".join(trozos)}))
+        except Exception as e:
+            await cola.put(("error", e)) #El error se relanza desde el generador principal
+
+    tareas = [asyncio.create_task(redactar_en_streaming(titulo)) for titulo in titulos]
+    secciones = {}
+    try:
+        while len(secciones) < len(tareas):
+            tipo, datos = await cola.get()
+            if tipo == "error":
+                raise datos
+            if tipo == "seccion":
+                secciones[datos["titulo"]] = datos["contenido"]
+            yield tipo, datos
+    finally:
+        #Si el cliente se desconecta o algo falla, no dejamos llamadas a Gemini colgando
+        for tarea in tareas:
+            tarea.cancel()
+
+    resultado = {
+        "objeto": obtener_objeto(respuestas),
+        "indice": generar_indice(titulos),
+        "secciones": {titulo: secciones[titulo] for titulo in titulos}, #Mismo orden que procesar_pliego
+    }
+    await CACHE_PLIEGOS.guardar(clave, resultado)
+    yield "fin", {"objeto": resultado["objeto"], "indice": resultado["indice"], "cache": MISS}
+
+
+#Genera varios pliegos a la vez y los va devolviendo según terminan, como diccionarios
+#{"indice", "estado", "resultado"} o {"indice", "error"}:
+    # - Las secciones de todos los documentos van a una misma bolsa con un único límite de concurrencia,
+    #   así el tiempo total depende de la cuota de Gemini y no del número de documentos
+    # - Una sección con la misma entrada en varios documentos (misma huella) se redacta una sola vez
+    # - Cada pliego pasa por la caché, así que los repetidos no se generan dos veces
+async def procesar_lote(lote: list, max_concurrencia: int = MAX_CONCURRENCIA):
+    modelo = inicializar_gemini()
+    limite = asyncio.Semaphore(max(1, max_concurrencia)) #Compartido por todo el lote
+    secciones_compartidas = {} #huella de la sección -> tarea que la redacta
+
+    def redactar_compartida(huella: str, titulo: str, contenido: dict):
+        if huella not in secciones_compartidas:
+            secciones_compartidas[huella] = asyncio.ensure_future(redactar_seccion(modelo, titulo, contenido, limite))
+        return asyncio.shield(secciones_compartidas[huella]) #Si un documento se cancela, la sección sigue para los demás
+
+    async def generar(respuestas: dict) -> dict:
+        huellas = huellas_secciones(respuestas)
+        titulos = list(respuestas)
+        textos = await asyncio.gather(*(redactar_compartida(huellas[t], t, respuestas[t]) for t in titulos))
+        secciones_redactadas = dict(zip(titulos, textos))
+        return {"objeto": obtener_objeto(respuestas), "indice": generar_indice(secciones_redactadas), "secciones": secciones_redactadas}
+
+    async def documento(i: int, respuestas: dict) -> dict:
+        try:
+            resultado, estado = await CACHE_PLIEGOS.obtener_o_generar(clave_pliego(respuestas), lambda: generar(respuestas))
+            return {"indice": i, "estado": estado, "resultado": resultado}
+        except Exception as e:
+            return {"indice": i, "error": str(e) or type(e).__name__}
+
+    tareas = [asyncio.create_task(documento(i, respuestas)) for i, respuestas in enumerate(lote)]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            yield await siguiente
+    finally:
+        for tarea in tareas + list(secciones_compartidas.values()):
+            tarea.cancel()
+
+
+#Almacén de borradores del proceso; se abre la primera vez que se usa
+def obtener_borradores() -> AlmacenBorradores:
+    pid = os.getpid()
+    if pid not in _BORRADORES:
+        _BORRADORES.clear()
+        _BORRADORES[pid] = AlmacenBorradores.desde_entorno("TEC", RUTA_BORRADORES)
+    return _BORRADORES[pid]
+
+
+#Huella de la entrada de cada sección (sus respuestas + versión del prompt y del modelo).
+#Mientras la huella no cambie, el texto ya redactado de la sección sigue valiendo
+def huellas_secciones(respuestas: dict) -> dict:
+    prompt, configuracion = huella_prompt(), configuracion_gemini()
+    return {titulo: clave_canonica("tec", titulo, contenido, prompt, configuracion) for titulo, contenido in respuestas.items()}
+
+
+#Genera el pliego completo (pasando por la caché) y lo guarda como borrador. Devuelve (borrador, estado de la caché)
+async def crear_borrador(respuestas: dict) -> tuple:
+    resultado, estado = await procesar_pliego_con_cache(respuestas)
+    id_borrador = await asyncio.to_thread(
+        obtener_borradores().crear, "tec", respuestas, huellas_secciones(respuestas), resultado
+    )
+    return {"id": id_borrador, **resultado, "regeneradas": list(resultado["secciones"])}, estado
+
+
+#Devuelve el borrador guardado o None si no existe
+async def obtener_borrador(id_borrador: str):
+    borrador = await asyncio.to_thread(obtener_borradores().obtener, id_borrador, "tec")
+    if borrador is None:
+        return None
+    return {"id": id_borrador, **borrador["resultado"], "regeneradas": []}
+
+
+#Aplica un subconjunto de respuestas sobre el borrador y vuelve a redactar solo las secciones
+#cuya huella ha cambiado; las demás se conservan tal cual. Si solo cambia una respuesta, es una llamada a Gemini
+async def actualizar_borrador(id_borrador: str, cambios: dict, max_concurrencia: int = MAX_CONCURRENCIA):
+    almacen = obtener_borradores()
+    async with almacen.candado(id_borrador):
+        borrador = await asyncio.to_thread(almacen.obtener, id_borrador, "tec")
+        if borrador is None:
+            return None
+
+        respuestas = fusionar(borrador["entrada"], cambios)
+        huellas = huellas_secciones(respuestas)
+        cambiadas = [titulo for titulo in respuestas if huellas[titulo] != borrador["huellas"].get(titulo)]
+
+        modelo = inicializar_gemini()
+        limite = asyncio.Semaphore(max(1, max_concurrencia))
+        textos = await asyncio.gather(*(
+            redactar_seccion(modelo, titulo, respuestas[titulo], limite) for titulo in cambiadas
+        ))
+        nuevas = dict(zip(cambiadas, textos))
+        secciones = {titulo: nuevas.get(titulo, borrador["resultado"]["secciones"].get(titulo)) for titulo in respuestas}
+
+        resultado = {"objeto": obtener_objeto(respuestas), "indice": generar_indice(secciones), "secciones": secciones}
+        await asyncio.to_thread(almacen.actualizar, id_borrador, respuestas, huellas, resultado)
+        await CACHE_PLIEGOS.guardar(clave_pliego(respuestas), resultado) #El pliego completo ya no hay que generarlo otra vez
+
+    return {"id": id_borrador, **resultado, "regeneradas": cambiadas}
+
+
+#Ejecuta un trabajo de la cola: redacta el pliego en streaming, va avisando de cada sección terminada
+#y acaba con el pliego completo (procesar_pliego_stream ya lo deja en la caché)
+async def ejecutar_trabajo(entrada: dict):
+    respuestas = entrada["respuestas"]
+    secciones, final = {}, {}
+    async for tipo, datos in procesar_pliego_stream(respuestas):
+        if tipo == "seccion":
+            secciones[datos["titulo"]] = datos["contenido"]
+            yield tipo, datos
+        elif tipo == "fin":
+            final = datos
+    resultado = {
+        "objeto": final["objeto"],
+        "indice": final["indice"],
+        "secciones": {titulo: secciones[titulo] for titulo in respuestas}, #Mismo orden que procesar_pliego
+    }
+    yield "resultado", resultado
+
+
+#Cola de trabajos del proceso (TEC_TRABAJOS para la ruta SQLite, TEC_TRABAJADORES para el nº de workers).
+#La arranca y la para el lifespan de main_tec
+COLA_TRABAJOS = ColaTrabajos.desde_entorno(
+    "TEC", str(Path(__file__).resolve().parent / "trabajos.sqlite3"), ejecutar_trabajo
+)
+registrar_servicio("tec", CACHE_PLIEGOS, COLA_TRABAJOS) #Caché y cola en /metrics
@@ -1,13 +1,36 @@
 # app/main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from .api_tec import router
+from .core_tec import COLA_TRABAJOS
+from .utils import inicializar_gemini, cerrar_gemini
 from fastapi.middleware.cors import CORSMiddleware #Compartición de recursos entre dominios distintos
+from comun import metricas
+from comun.exportacion import cerrar_exportacion
+from comun.metricas import MiddlewareMetricas, RespuestaJSONMedida
+from comun.pasarela_llm import MiddlewarePlazo
+
+
+#Ciclo de vida de la app: el modelo Gemini se crea una vez al arrancar y lo comparten todas las peticiones.
+#También arranca los workers de la cola de trabajos (y reanuda los que quedaron pendientes)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    inicializar_gemini()
+    await COLA_TRABAJOS.iniciar()
+    yield
+    await COLA_TRABAJOS.cerrar()
+    cerrar_exportacion() #Pool de procesos de las exportaciones DOCX/PDF, si se llegó a crear
+    cerrar_gemini()
+
 
 #Crea una instancia de FastAPI
 app = FastAPI(
     title="API de Pliegos Técnicos",
     description="Genera pliegos técnicos a partir de respuestas usando Gemini.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=RespuestaJSONMedida, #Mide la serialización de las respuestas JSON
 )
 
 # Permitir CORS si lo usarás desde frontend
@@ -18,5 +41,10 @@ app.add_middleware(
     allow_methods=["*"], #Métodos HTTP permitidos
     allow_headers=["*"], #Qué cabeceras están permitidas en la petición
 )
+#Plazo máximo por petición (LICIZEN_PLAZO_PETICION, en segundos): las llamadas a Gemini no se reintentan más allá
+app.add_middleware(MiddlewarePlazo)
+#Tiempo por petición y etapa (GET /metrics) y una línea JSON por petición con su desglose (LICIZEN_LOG_PETICIONES=0 la quita)
+app.add_middleware(MiddlewareMetricas, servicio="tec")
 # ¡¡Comentar que en desarrollo se permite usar *, sin embargo, en producción se recomienda especificar los dominios permitidos para mayor seguridad!!
+app.include_router(metricas.router) #GET /metrics
 app.include_router(router)
@@ -1,6 +1,6 @@
 # app/models.py
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, List
 
 #Aquí se definen los modelos de datos que se usan para validar las entradas y estructurar y documentar las salidas de la API
 
@@ -16,3 +16,17 @@ class SeccionesResponse(BaseModel):
     objeto: str #Objeto del contrato
     indice: list[str] #índice del pliego
     secciones: Dict[str, str] #Secciones del pliego con su contenido
+
+
+#BorradorResponse es un pliego guardado como borrador, con su ID y las secciones que se acaban de redactar
+class BorradorResponse(SeccionesResponse):
+    id: str #Identificador del borrador, para actualizarlo después
+    regeneradas: list[str] = [] #Secciones redactadas en esta petición (las demás se han conservado)
+
+#CambiosBorrador recoge solo las respuestas que el usuario ha modificado, con la misma forma que PreguntasRequest
+class CambiosBorrador(BaseModel):
+    respuestas: Dict[str, Dict[str, str]]
+
+#LoteRequest recoge varios pliegos a generar a la vez: cada documento son sus respuestas, como en PreguntasRequest
+class LoteRequest(BaseModel):
+    documentos: List[Dict[str, Dict[str, str]]]
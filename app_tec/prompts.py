@@ -15,4 +15,10 @@ def generar_prompt_por_seccion(titulo_seccion, pares):
         f"Respeta el tono administrativo y profesional habitual en un pliego técnico."
     )
 
-    return prompt
\ No newline at end of file
+    return prompt
+
+
+#Huella del prompt: el prompt renderizado con marcadores en lugar de respuestas reales.
+#Si cambia la redacción del prompt cambia la huella (y con ella la clave de la caché de pliegos)
+def huella_prompt():
+    return generar_prompt_por_seccion("{titulo}", {"{pregunta}": "{respuesta}"})
@@ -1,13 +1,55 @@
 # Mantenemos tal cual el código del propio pliego técnico
 import os
+import threading
 from dotenv import load_dotenv
 import google.generativeai as genai
+from comun.casete import modelo_con_casete
+
+#Nombre del modelo y parámetros de generación, leídos de la configuración (.env / variables de entorno).
+#Se leen una sola vez: las claves de caché lo consultan en cada petición y no debe volver a leer el .env
+_configuracion = None
+
+def configuracion_gemini():
+    global _configuracion
+    if _configuracion is None:
+        load_dotenv()
+        configuracion = {}
+        if os.getenv("GEMINI_TEMPERATURA"):
+            configuracion["temperature"] = float(os.getenv("GEMINI_TEMPERATURA"))
+        if os.getenv("GEMINI_MAX_TOKENS"):
+            configuracion["max_output_tokens"] = int(os.getenv("GEMINI_MAX_TOKENS"))
+        _configuracion = (os.getenv("GEMINI_MODELO", "gemini-2.5-flash"), configuracion)
+    return _configuracion
+
+#Modelo Gemini compartido por todo el proceso: se crea una sola vez (en el arranque de la API o en el
+#primer uso) y todas las peticiones reutilizan el mismo cliente y sus conexiones
+_modelo = None
+_pid_modelo = None
+_lock_modelo = threading.Lock()
 
 def inicializar_gemini():
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("gemini-2.5-flash")
+    global _modelo, _pid_modelo
+    #Si el proceso se ha bifurcado (varios workers) cada hijo crea su propio cliente
+    if _modelo is None or _pid_modelo != os.getpid():
+        with _lock_modelo:
+            if _modelo is None or _pid_modelo != os.getpid():
+                load_dotenv()
+                nombre, configuracion = configuracion_gemini()
+
+                def crear():
+                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport=os.getenv("GEMINI_TRANSPORTE") or None)
+                    return genai.GenerativeModel(nombre, generation_config=configuracion or None)
+
+                #Con LICIZEN_LLM_MODO=grabar/reproducir las respuestas pasan por el casete (comun.casete)
+                _modelo = modelo_con_casete(crear, nombre, configuracion)
+                _pid_modelo = os.getpid()
+    return _modelo
+
+#Olvida el modelo compartido y su configuración (al apagar la API); el siguiente uso los vuelve a leer
+def cerrar_gemini():
+    global _modelo, _pid_modelo, _configuracion
+    with _lock_modelo:
+        _modelo = _pid_modelo = _configuracion = None
 
 def obtener_preguntas():
     return [
@@ -0,0 +1,32 @@
+# app_unificada/gunicorn_conf.py
+#Configuración de gunicorn para la app unificada con varios workers uvicorn:
+#
+#   gunicorn -c app_unificada/gunicorn_conf.py app_unificada.main_unificada:app
+#
+#Con precarga (LICIZEN_PRECARGA=1, por defecto) la app se importa una vez en el proceso maestro y los
+#workers la heredan al bifurcarse: los módulos, prompts y modelos de pydantic se comparten por copy-on-write
+#en lugar de cargarse en cada worker. Los clientes (Gemini, Qdrant, SQLite) no se crean al importar sino en el
+#lifespan de cada worker, y los registros por proceso (recursos, modelo Gemini, borradores, caché en disco)
+#comprueban el pid, así que ninguna conexión cruza el fork.
+#
+#Los workers comparten la base SQLite de trabajos: cada trabajo lo reclama un solo worker (de forma atómica) y,
+#mientras lo ejecuta, da señales de vida; si un worker muere, otro retoma sus trabajos al dejar de recibirlas
+#(ver comun.trabajos.ColaTrabajos), y un worker que arranca no repite lo que otro sigue ejecutando.
+#El estado se consulta desde cualquier worker, pero GET .../trabajos/{id}/eventos solo emite en vivo en el que lo ejecuta.
+import gc
+import os
+
+bind = os.getenv("LICIZEN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("LICIZEN_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("LICIZEN_PRECARGA", "1") == "1"
+timeout = int(os.getenv("LICIZEN_TIMEOUT", "300")) #Un pliego administrativo con revisión puede tardar minutos
+graceful_timeout = 30 #Al apagar, los lifespans cierran colas y clientes
+keepalive = 5
+
+
+#Justo antes de crear los workers: los objetos que ya existen pasan a la generación permanente del GC,
+#que así no los recorre ni toca sus cabeceras en cada worker (lo que rompería el copy-on-write)
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
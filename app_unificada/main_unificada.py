@@ -0,0 +1,56 @@
+# app_unificada/main_unificada.py
+#Un solo servicio ASGI con las rutas técnicas (/preguntas, /generar...) y las administrativas (/administrativo...).
+#Frente a las dos apps por separado (main_tec en el 8001 y main_adm en el 8000), cada réplica carga una sola vez
+#FastAPI, langchain y google.generativeai, y comparte la pasarela de Gemini (un único límite de cuota por proceso),
+#el pool de hilos, la caché de pliegos y los clientes de embeddings y Qdrant.
+#
+#   uvicorn app_unificada.main_unificada:app --port 8000
+#   gunicorn -c app_unificada/gunicorn_conf.py app_unificada.main_unificada:app   (varios workers con precarga)
+import os
+from contextlib import asynccontextmanager
+
+#Una sola caché de pliegos para los dos servicios (LICIZEN_CACHE_*): tiene que fijarse antes de importar core_tec y core_adm
+os.environ.setdefault("LICIZEN_CACHE_COMPARTIDA", "1")
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware #Compartición de recursos entre dominios distintos
+
+from app_tec.api_tec import router as router_tec
+from app_tec.main_tec import lifespan as lifespan_tec
+from app_adm.api_adm import router as router_adm
+from app_adm.main_adm import lifespan as lifespan_adm
+from comun import metricas
+from comun.metricas import MiddlewareMetricas, RespuestaJSONMedida
+from comun.pasarela_llm import MiddlewarePlazo
+
+
+#Un único ciclo de vida: arranca el modelo Gemini y la cola de trabajos técnicos, los recursos
+#administrativos (en segundo plano) y su cola; al apagar se cierran en orden inverso
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with lifespan_tec(app), lifespan_adm(app):
+        yield
+
+
+app = FastAPI(
+    title="API de LiciZen",
+    description="Genera pliegos técnicos y administrativos a partir de respuestas usando Gemini.",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=RespuestaJSONMedida, #Mide la serialización de las respuestas JSON
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"], #Dominios permitidos
+    allow_credentials=True, #Permite incluir cookies o autenticación
+    allow_methods=["*"], #Métodos HTTP permitidos
+    allow_headers=["*"], #Qué cabeceras están permitidas en la petición
+)
+#Plazo máximo por petición (LICIZEN_PLAZO_PETICION, en segundos): las llamadas a Gemini no se reintentan más allá
+app.add_middleware(MiddlewarePlazo)
+#Tiempo por petición y etapa (GET /metrics) y una línea JSON por petición con su desglose (LICIZEN_LOG_PETICIONES=0 la quita)
+app.add_middleware(MiddlewareMetricas, servicio="licizen")
+app.include_router(metricas.router) #GET /metrics, una sola vez para los dos servicios
+app.include_router(router_tec)
+app.include_router(router_adm)
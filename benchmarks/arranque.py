@@ -0,0 +1,62 @@
+# benchmarks/arranque.py
+"""
+Mide el arranque en frío de las APIs, cada medición en un proceso Python nuevo:
+
+- importacion_s:      importar el módulo de la app (lo que paga cada worker y cada test)
+- primera_respuesta_s: importar + lifespan + primera petición a una ruta ligera
+- recursos_s:         construir todos los recursos del registro (clientes Gemini/Qdrant...)
+
+Uso:
+    python -m benchmarks.arranque [--repeticiones 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+APPS = {
+    "adm": ("app_adm.main_adm", "/openapi.json", "app_adm.recursos_adm"),
+    "tec": ("app_tec.main_tec", "/preguntas", None),
+}
+
+CODIGO = """
+import json, time
+inicio = time.perf_counter()
+import {modulo} as m
+importacion = time.perf_counter() - inicio
+from fastapi.testclient import TestClient
+with TestClient(m.app) as cliente:
+    cliente.get("{ruta}")
+    primera = time.perf_counter() - inicio
+{medir_recursos}
+print(json.dumps({{"importacion_s": importacion, "primera_respuesta_s": primera, "recursos_s": recursos}}))
+"""
+MEDIR_RECURSOS = """
+import {registro} as r
+r.recursos.iniciar()
+recursos = sum(r.recursos.tiempos.values())
+"""
+
+
+def medir(modulo: str, ruta: str, registro: str) -> dict:
+    salida = subprocess.run(
+        [sys.executable, "-c", CODIGO.format(
+            modulo=modulo, ruta=ruta,
+            medir_recursos=MEDIR_RECURSOS.format(registro=registro) if registro else "recursos = 0.0",
+        )],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.arranque", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--apps", nargs="+", default=list(APPS))
+    args = parser.parse_args()
+
+    for nombre in args.apps:
+        medidas = [medir(*APPS[nombre]) for _ in range(args.repeticiones)]
+        resumen = {clave: round(statistics.median(m[clave] for m in medidas), 3) for clave in medidas[0]}
+        print(f"{nombre}: " + ", ".join(f"{clave}={valor}" for clave, valor in resumen.items()))
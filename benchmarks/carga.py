@@ -0,0 +1,247 @@
+# benchmarks/carga.py
+"""
+Benchmark de carga de extremo a extremo de las dos APIs, en el mismo proceso y sin red.
+
+Levanta main_tec.app y main_adm.app (con su lifespan) detrás de httpx.ASGITransport y les lanza
+peticiones concurrentes a /generar y /administrativo. Gemini, los embeddings y Qdrant se sustituyen
+por los falsos de comun.falsos, con latencia (mediana[:dispersión], log-normal) y tasa de errores
+configurables; los errores del modelo son 503 que la pasarela reintenta.
+
+Para cada app y nivel de concurrencia mide:
+- peticiones por segundo y latencia p50/p95/p99
+- tasa de errores (respuestas >= 400 o excepciones)
+- memoria residente máxima y retraso del bucle de eventos (p99 y máximo)
+- tiempo medio por etapa según comun.metricas: seccion (procesar_pliego / redactar_secciones),
+  contexto (contexto_para), busqueda, revision...
+
+Cada petición lleva datos distintos para no acertar en la caché de pliegos. --guardar escribe los
+resultados como línea base en JSON; --comparar los contrasta con una línea base anterior y termina
+con código 1 si las peticiones/s bajan o el p95 sube más que --tolerancia.
+
+Uso:
+    python -m benchmarks.carga [--apps tec adm] [--concurrencias 1 4 16] [--peticiones 32]
+                               [--latencia-llm 0.2:0.3] [--errores-llm 0] [--latencia-qdrant 0.01:0.5]
+                               [--guardar carga_base.json] [--comparar carga_base.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from comun import metricas
+from comun.falsos import AlmacenFalso, ChatFalso, Latencia, ModeloFalso
+from benchmarks.recuperacion import PALABRAS, percentil, rss_mb
+
+TEXTO = "Texto de la sección generado por el modelo falso para el benchmark de carga."
+
+
+def preparar_entorno(directorio: Path) -> None:
+    """Ficheros SQLite de colas, borradores y resúmenes en un directorio temporal, y sin log por petición."""
+    os.environ.setdefault("LICIZEN_LOG_PETICIONES", "0")
+    os.environ.setdefault("GOOGLE_API_KEY", "falsa")
+    for prefijo in ("TEC", "ADM"):
+        os.environ[f"{prefijo}_TRABAJOS"] = str(directorio / f"{prefijo.lower()}_trabajos.sqlite3")
+        os.environ[f"{prefijo}_BORRADORES"] = str(directorio / f"{prefijo.lower()}_borradores.sqlite3")
+    os.environ["ADM_CACHE_RESUMENES"] = str(directorio / "cache_resumenes.sqlite3")
+
+
+def instalar_falsos(args) -> dict:
+    """
+    Sustituye Gemini, los embeddings y Qdrant por los falsos. Devuelve las apps a medir.
+    Las apps se importan aquí, después de preparar_entorno, porque leen las rutas al importarse.
+    """
+    import app_tec.core_tec as core_tec
+    import app_tec.main_tec as main_tec
+    import app_adm.main_adm as main_adm
+    from app_adm import LiciZen_adm
+    from app_adm.recuperacion_adm import ServicioRecuperacion
+    from app_adm.recursos_adm import recursos
+    from app_adm.resumenes_adm import VERSION_PROMPT_RESUMEN
+    from benchmarks.tokens_secciones import DATOS_EJEMPLO
+
+    # Los 503 de los falsos se registran en recuperacion_adm como errores de búsqueda: no interesan aquí
+    logging.getLogger("app_adm.recuperacion_adm").setLevel(logging.CRITICAL)
+
+    modelo = ModeloFalso(texto=TEXTO, latencia=args.latencia_llm, tasa_error=args.errores_llm)
+    core_tec.inicializar_gemini = main_tec.inicializar_gemini = lambda: modelo
+
+    documentos = [
+        Document(page_content=f"Fragmento normativo {n} sobre {palabra}.",
+                 metadata={"titulo": f"{palabra.capitalize()} — artículo {n}",
+                           "resumen": f"Resumen del artículo {n} sobre {palabra}.",
+                           "resumen_version": VERSION_PROMPT_RESUMEN})
+        for palabra in PALABRAS for n in range(1, 6)
+    ]
+    recursos.registrar("llm", lambda: ChatFalso(responses=[TEXTO], latencia=args.latencia_llm,
+                                                tasa_error=args.errores_llm))
+    recursos.registrar("emb", lambda: FakeEmbeddings(size=768))
+    recursos.registrar("recuperacion", lambda: ServicioRecuperacion(
+        {col: AlmacenFalso(documentos, args.latencia_qdrant, args.errores_qdrant) for col in LiciZen_adm.COLECCIONES},
+        recursos.obtener("emb"), LiciZen_adm.CUOTAS_COLECCION,
+        k_por_coleccion=LiciZen_adm.K_POR_COLECCION, k_respaldo=LiciZen_adm.K_RESPALDO,
+        timeout=LiciZen_adm.TIMEOUT_BUSQUEDA, max_busquedas=LiciZen_adm.MAX_BUSQUEDAS,
+    ))
+
+    preguntas = core_tec.obtener_preguntas()
+    return {
+        "tec": (main_tec.app, "/generar", lambda n: {"respuestas": {
+            titulo: {p: f"Respuesta de ejemplo {n}" for p in lista} for titulo, lista in preguntas
+        }}),
+        "adm": (main_adm.app, "/administrativo", lambda n: {
+            **DATOS_EJEMPLO, "objeto_contrato": f"{DATOS_EJEMPLO['objeto_contrato']} (lote {n})",
+        }),
+    }
+
+
+class MonitorBucle:
+    """Retraso del bucle de eventos (cuánto se pasa un sleep de `intervalo`) y memoria residente máxima."""
+
+    def __init__(self, intervalo: float = 0.01):
+        self.intervalo = intervalo
+        self.retrasos = []
+        self.memoria_max = rss_mb()
+
+    async def ejecutar(self) -> None:
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(self.intervalo)
+            self.retrasos.append(max(0.0, time.perf_counter() - inicio - self.intervalo))
+            self.memoria_max = max(self.memoria_max, rss_mb())
+
+
+def tiempos_etapas(antes: dict, despues: dict) -> dict:
+    """Tiempo medio (ms) por etapa entre dos instantáneas de metricas.ETAPAS, sumando secciones y colecciones."""
+    acumulado = {}
+    for clave, (cuenta, suma) in despues.items():
+        cuenta_antes, suma_antes = antes.get(clave, (0, 0.0))
+        total = acumulado.setdefault(dict(clave)["etapa"], [0, 0.0])
+        total[0] += cuenta - cuenta_antes
+        total[1] += suma - suma_antes
+    return {etapa: round(1000 * suma / cuenta, 1) for etapa, (cuenta, suma) in sorted(acumulado.items()) if cuenta}
+
+
+async def nivel(cliente, ruta: str, cuerpo, concurrencia: int, peticiones: int, numeros) -> dict:
+    """`concurrencia` clientes en bucle cerrado hasta completar `peticiones` peticiones."""
+    latencias, errores = [], 0
+    pendientes = iter(range(peticiones))
+
+    async def cliente_en_bucle():
+        nonlocal errores
+        for _ in pendientes:  # Iterador compartido: cada petición la hace un solo cliente
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.post(ruta, json=cuerpo(next(numeros)))
+                errores += respuesta.status_code >= 400
+            except Exception:
+                errores += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    monitor = MonitorBucle()
+    vigilancia = asyncio.create_task(monitor.ejecutar())
+    etapas_antes = metricas.ETAPAS.totales()
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente_en_bucle() for _ in range(concurrencia)))
+    transcurrido = time.perf_counter() - inicio
+    vigilancia.cancel()
+
+    return {
+        "concurrencia": concurrencia, "peticiones": peticiones,
+        "rps": round(peticiones / transcurrido, 2),
+        "p50_s": round(percentil(latencias, 50), 3), "p95_s": round(percentil(latencias, 95), 3),
+        "p99_s": round(percentil(latencias, 99), 3),
+        "errores": round(errores / peticiones, 4),
+        "memoria_max_mb": round(monitor.memoria_max, 1),
+        "retraso_bucle_p99_ms": round(1000 * percentil(monitor.retrasos, 99), 2),
+        "retraso_bucle_max_ms": round(1000 * max(monitor.retrasos, default=0.0), 2),
+        "etapas_ms": tiempos_etapas(etapas_antes, metricas.ETAPAS.totales()),
+    }
+
+
+async def medir_app(nombre: str, app, ruta: str, cuerpo, concurrencias, peticiones: int, numeros) -> list:
+    resultados = []
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga", timeout=None) as cliente:
+            await cliente.post(ruta, json=cuerpo(next(numeros)))  # Calentamiento: recursos y primeras importaciones
+            for concurrencia in concurrencias:
+                r = {"app": nombre, **await nivel(cliente, ruta, cuerpo, concurrencia, peticiones, numeros)}
+                print(f"{nombre:<4}{r['concurrencia']:>6}{r['rps']:>9.2f}{r['p50_s']:>8.2f}{r['p95_s']:>8.2f}"
+                      f"{r['p99_s']:>8.2f}{r['errores']:>8.1%}{r['memoria_max_mb']:>9.0f}"
+                      f"{r['retraso_bucle_p99_ms']:>10.1f}{r['retraso_bucle_max_ms']:>9.1f}   "
+                      + " ".join(f"{k}={v:g}" for k, v in r["etapas_ms"].items()))
+                resultados.append(r)
+    return resultados
+
+
+def comparar(resultados: list, base: dict, tolerancia: float) -> bool:
+    """Imprime la variación frente a la línea base. Devuelve True si hay alguna regresión."""
+    anteriores = {(r["app"], r["concurrencia"]): r for r in base["resultados"]}
+    regresion = False
+    print(f"\nComparación con la línea base del {base.get('fecha', '?')} (tolerancia {tolerancia:.0%})")
+    for r in resultados:
+        b = anteriores.get((r["app"], r["concurrencia"]))
+        if b is None or not b["rps"] or not b["p95_s"]:
+            continue
+        var_rps = r["rps"] / b["rps"] - 1
+        var_p95 = r["p95_s"] / b["p95_s"] - 1
+        peor = var_rps < -tolerancia or var_p95 > tolerancia
+        regresion |= peor
+        print(f"{r['app']:<4}{r['concurrencia']:>6}  rps {b['rps']:.2f} → {r['rps']:.2f} ({var_rps:+.0%})  "
+              f"p95 {b['p95_s']:.2f} → {r['p95_s']:.2f} s ({var_p95:+.0%}){'   ❗ REGRESIÓN' if peor else ''}")
+    return regresion
+
+
+async def ejecutar(args) -> list:
+    apps = instalar_falsos(args)
+    numeros = itertools.count()
+    print(f"{'app':<4}{'conc':>6}{'pet/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'error':>8}{'RSS MB':>9}"
+          f"{'bucle p99':>10}{'máx':>9}   etapas (ms)")
+    resultados = []
+    for nombre in args.apps:
+        app, ruta, cuerpo = apps[nombre]
+        resultados += await medir_app(nombre, app, ruta, cuerpo, args.concurrencias, args.peticiones, numeros)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.carga", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--apps", nargs="+", choices=["tec", "adm"], default=["tec", "adm"])
+    parser.add_argument("--concurrencias", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--peticiones", type=int, default=32, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--latencia-llm", type=Latencia.desde_texto, default=Latencia(0.2, 0.3),
+                        help="Latencia de cada llamada a Gemini: mediana[:dispersión] en segundos")
+    parser.add_argument("--errores-llm", type=float, default=0.0, help="Fracción de llamadas a Gemini que dan 503")
+    parser.add_argument("--latencia-qdrant", type=Latencia.desde_texto, default=Latencia(0.01, 0.5),
+                        help="Latencia de cada búsqueda en Qdrant: mediana[:dispersión] en segundos")
+    parser.add_argument("--errores-qdrant", type=float, default=0.0, help="Fracción de búsquedas que fallan")
+    parser.add_argument("--guardar", type=Path, help="Guarda los resultados como línea base (JSON)")
+    parser.add_argument("--comparar", type=Path, help="Línea base con la que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Empeoramiento admitido frente a la línea base")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="licizen_carga_") as directorio:
+        preparar_entorno(Path(directorio))
+        resultados = asyncio.run(ejecutar(args))
+
+    if args.guardar:
+        configuracion = {k: (repr(v) if isinstance(v, Latencia) else v) for k, v in vars(args).items()
+                         if k not in ("guardar", "comparar")}
+        args.guardar.write_text(json.dumps({
+            "fecha": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "configuracion": configuracion, "resultados": resultados,
+        }, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"\nLínea base guardada en {args.guardar}")
+    if args.comparar and comparar(resultados, json.loads(args.comparar.read_text(encoding="utf-8")), args.tolerancia):
+        sys.exit(1)
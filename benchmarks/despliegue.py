@@ -0,0 +1,123 @@
+# benchmarks/despliegue.py
+"""
+Compara memoria y arranque de los despliegues posibles con gunicorn y N workers uvicorn:
+
+- separadas:          main_tec y main_adm en dos servidores (el despliegue actual, puertos 8001 y 8000)
+- unificada:          app_unificada.main_unificada en un servidor, cada worker importa la app
+- unificada_precarga: lo mismo con --preload: la app se importa en el maestro y los workers la heredan
+
+Para cada uno mide el tiempo hasta que todos los workers han terminado su lifespan y, después,
+la memoria de todos los procesos (maestros y workers): RSS y PSS. PSS reparte las páginas compartidas
+entre los procesos que las usan, así que es la que refleja lo que se ahorra con la precarga (RSS las
+cuenta una vez por worker).
+
+Los servidores arrancan sin red: LICIZEN_LLM_MODO=reproducir (no se crean clientes de Gemini) y
+ADM_BACKEND_VECTORIAL=numpy. Solo Linux (lee /proc).
+
+Uso:
+    python -m benchmarks.despliegue [--trabajadores 2] [--repeticiones 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+CONFIG = str(Path(__file__).resolve().parent.parent / "app_unificada" / "gunicorn_conf.py")
+DESPLIEGUES = {
+    "separadas": [("app_tec.main_tec:app", "0"), ("app_adm.main_adm:app", "0")],
+    "unificada": [("app_unificada.main_unificada:app", "0")],
+    "unificada_precarga": [("app_unificada.main_unificada:app", "1")],
+}
+LISTO = "Application startup complete"
+
+
+def arbol(pid: int) -> list:
+    """El proceso y todos sus descendientes."""
+    pids = [pid]
+    for hilo in Path(f"/proc/{pid}/task").iterdir():
+        for hijo in (hilo / "children").read_text().split():
+            pids += arbol(int(hijo))
+    return pids
+
+
+def memoria_mb(pid: int) -> dict:
+    """RSS y PSS (MB) de un proceso, de /proc/<pid>/smaps_rollup."""
+    valores = {}
+    for linea in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        campo, _, resto = linea.partition(":")
+        if campo in ("Rss", "Pss"):
+            valores[campo.lower()] = int(resto.split()[0]) / 1024
+    return valores
+
+
+def lanzar(app: str, precarga: str, puerto: int, trabajadores: int, directorio: Path) -> subprocess.Popen:
+    entorno = {
+        **os.environ, "LICIZEN_BIND": f"127.0.0.1:{puerto}", "LICIZEN_WORKERS": str(trabajadores),
+        "LICIZEN_PRECARGA": precarga, "LICIZEN_LLM_MODO": "reproducir", "LICIZEN_LOG_PETICIONES": "0",
+        "LICIZEN_LLM_CASETE": str(directorio / "casete.sqlite3"), "ADM_BACKEND_VECTORIAL": "numpy",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "falsa"),
+        "TEC_TRABAJOS": str(directorio / f"tec_{puerto}.sqlite3"), "ADM_TRABAJOS": str(directorio / f"adm_{puerto}.sqlite3"),
+        "TEC_BORRADORES": str(directorio / "tec_borradores.sqlite3"),
+        "ADM_BORRADORES": str(directorio / "adm_borradores.sqlite3"),
+        "ADM_CACHE_RESUMENES": str(directorio / "cache_resumenes.sqlite3"),
+    }
+    return subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", CONFIG, app], env=entorno,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def medir(nombre: str, trabajadores: int, espera: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="licizen_despliegue_") as directorio:
+        inicio = time.perf_counter()
+        servidores = [lanzar(app, precarga, 18000 + i, trabajadores, Path(directorio))
+                      for i, (app, precarga) in enumerate(DESPLIEGUES[nombre])]
+        try:
+            for servidor in servidores:  # Cada worker escribe LISTO al terminar su lifespan
+                listos = 0
+                while listos < trabajadores:
+                    linea = servidor.stderr.readline()
+                    if not linea:
+                        raise RuntimeError(f"gunicorn terminó antes de arrancar ({nombre})")
+                    listos += LISTO in linea
+            arranque = time.perf_counter() - inicio
+            time.sleep(espera)  # Los recursos de app_adm se crean en segundo plano tras el arranque
+            procesos = [pid for servidor in servidores for pid in arbol(servidor.pid)]
+            memorias = [memoria_mb(pid) for pid in procesos]
+        finally:
+            for servidor in servidores:
+                servidor.terminate()
+            for servidor in servidores:
+                servidor.wait(timeout=60)
+    return {
+        "arranque_s": arranque, "procesos": len(procesos),
+        "rss_mb": sum(m["rss"] for m in memorias), "pss_mb": sum(m["pss"] for m in memorias),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.despliegue", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--trabajadores", type=int, default=2, help="Workers por servidor gunicorn")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--espera", type=float, default=2.0, help="Segundos tras el arranque antes de medir memoria")
+    parser.add_argument("--salida", type=Path, help="Guarda los resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = {}
+    print(f"{'despliegue':<20}{'procesos':>9}{'arranque s':>12}{'RSS MB':>10}{'PSS MB':>10}")
+    for nombre in DESPLIEGUES:
+        medidas = [medir(nombre, args.trabajadores, args.espera) for _ in range(args.repeticiones)]
+        resultados[nombre] = {clave: round(statistics.median(m[clave] for m in medidas), 2) for clave in medidas[0]}
+        r = resultados[nombre]
+        print(f"{nombre:<20}{r['procesos']:>9.0f}{r['arranque_s']:>12.2f}{r['rss_mb']:>10.0f}{r['pss_mb']:>10.0f}")
+
+    base = resultados["separadas"]
+    for nombre in ("unificada", "unificada_precarga"):
+        r = resultados[nombre]
+        print(f"{nombre} frente a separadas: PSS {r['pss_mb'] / base['pss_mb'] - 1:+.0%}, "
+              f"arranque {r['arranque_s'] / base['arranque_s'] - 1:+.0%}")
+    if args.salida:
+        args.salida.write_text(json.dumps(resultados, indent=2), encoding="utf-8")
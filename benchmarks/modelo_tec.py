@@ -0,0 +1,50 @@
+# benchmarks/modelo_tec.py
+"""
+Micro-benchmark del coste de preparar el modelo Gemini en cada petición de app_tec.
+
+- antes:   lo que hacía inicializar_gemini() en cada llamada a procesar_pliego
+           (load_dotenv + genai.configure + GenerativeModel nuevo)
+- despues: inicializar_gemini() actual, que devuelve el modelo compartido del proceso
+
+No llama a la API de Gemini: solo mide la preparación previa a generate_content.
+
+Uso:
+    python -m benchmarks.modelo_tec [--iteraciones 2000]
+"""
+import argparse
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+from app_tec.utils import inicializar_gemini
+
+
+def preparar_antes():
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel("gemini-2.5-flash")
+
+
+def medir(funcion, iteraciones: int) -> list:
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    return tiempos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.modelo_tec", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iteraciones", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_API_KEY", "clave-de-benchmark")
+    for nombre, funcion in (("antes", preparar_antes), ("despues", inicializar_gemini)):
+        funcion()  # Calentamiento (importaciones y primera configuración)
+        tiempos = medir(funcion, args.iteraciones)
+        print(f"{nombre:<8} media={statistics.fmean(tiempos):9.1f} µs  "
+              f"p50={statistics.median(tiempos):9.1f} µs  p99={sorted(tiempos)[int(len(tiempos) * 0.99) - 1]:9.1f} µs")
@@ -0,0 +1,61 @@
+# benchmarks/pasarela.py
+"""
+Benchmark de la pasarela de llamadas a Gemini (comun.pasarela_llm) frente a una ráfaga de peticiones,
+contra un modelo falso con cuota (comun.falsos) que responde 429 al superarla. No usa la red.
+
+- directo:   todas las llamadas a la vez con gather, sin pasarela (lo que había antes)
+- aimd:      pasarela sin límite de ritmo: concurrencia adaptativa + reintentos con jitter
+- cubeta:    pasarela con la cuota configurada (RPM) además de AIMD y reintentos
+
+Para cada modo se cuentan las llamadas completadas y fallidas, los 429 recibidos y el
+rendimiento (llamadas completadas por segundo), que debería quedarse en el techo de la cuota.
+
+Uso:
+    python -m benchmarks.pasarela [--llamadas 200] [--cuota 20] [--ventana 1] [--latencia 0.05]
+"""
+import argparse
+import asyncio
+import time
+
+from comun.falsos import CuotaFalsa, ModeloFalso
+from comun.pasarela_llm import PasarelaLLM
+
+
+async def ejecutar(modo: str, llamadas: int, cuota: int, ventana: float, latencia: float) -> dict:
+    modelo = ModeloFalso(latencia=latencia, cuota=CuotaFalsa(cuota, ventana))
+    rpm = cuota * 60 / ventana if modo == "cubeta" else 0
+    pasarela = PasarelaLLM(modo, rpm=rpm, concurrencia=64, reintentos=30,
+                           espera_base=ventana / 10, espera_max=ventana * 2, rafaga=ventana)
+
+    async def una():
+        if modo == "directo":
+            return await modelo.generate_content_async("prompt")
+        return await pasarela.llamar(lambda: modelo.generate_content_async("prompt"))
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(una() for _ in range(llamadas)), return_exceptions=True)
+    transcurrido = time.perf_counter() - inicio
+    completadas = sum(not isinstance(r, BaseException) for r in resultados)
+    return {
+        "modo": modo,
+        "completadas": completadas,
+        "fallidas": llamadas - completadas,
+        "429": modelo.cuota.rechazadas,
+        "segundos": transcurrido,
+        "por_segundo": completadas / transcurrido,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pasarela", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--llamadas", type=int, default=200)
+    parser.add_argument("--cuota", type=int, default=20, help="Llamadas permitidas por ventana")
+    parser.add_argument("--ventana", type=float, default=1.0, help="Segundos de la ventana de cuota del modelo falso")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"Techo de la cuota: {args.cuota / args.ventana:.1f} llamadas/s")
+    for modo in ("directo", "aimd", "cubeta"):
+        r = asyncio.run(ejecutar(modo, args.llamadas, args.cuota, args.ventana, args.latencia))
+        print(f"{r['modo']:<8} completadas={r['completadas']:4d}  fallidas={r['fallidas']:4d}  429={r['429']:5d}  "
+              f"{r['segundos']:6.2f} s  {r['por_segundo']:6.1f} llamadas/s")
@@ -0,0 +1,155 @@
+# benchmarks/recuperacion.py
+"""
+Benchmark de recuperación por backend vectorial (vectoriales_adm), sin Gemini ni Qdrant remoto.
+
+Carga un corpus legal sintético repartido entre las colecciones de LiciZen_adm y mide, para
+cada backend y tamaño, el tiempo de carga, la memoria residente y la latencia de
+ServicioRecuperacion.buscar_por_palabra (el mismo camino que usa contexto_para).
+
+Uso:
+    python -m benchmarks.recuperacion --tamanos 10000 100000 1000000 --backends numpy qdrant_local
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from qdrant_client.http import models
+
+from app_adm.recuperacion_adm import ServicioRecuperacion
+from app_adm.vectoriales_adm import crear_almacenes
+
+COLECCIONES = [
+    "Prevencion_de_blanqueo_y_finanzas_sensibles",
+    " Normativa General y Contratación Pública",
+    "proteccion_de_datos_y_seguridad_digital",
+    "sostenibilidad_recuperacion_y_fondos_europeos",
+]
+# Primeras palabras de los títulos de SECCIONES (las que usa contexto_para como keyword)
+PALABRAS = ["portada", "objeto", "procedimiento", "condiciones", "garantías", "solvencia",
+            "criterios", "obligaciones", "cláusula", "firma"]
+TITULOS = [f"{p.capitalize()} — artículo {n}" for p in PALABRAS for n in range(1, 6)] + \
+          [f"Disposición adicional {n}" for n in range(1, 21)]
+
+
+def rss_mb() -> float:
+    """Memoria residente actual del proceso (MB)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def corpus(rng, n: int, dimension: int, lote: int = 50_000):
+    """Genera (vectores, documentos) sintéticos por lotes para no duplicar la memoria."""
+    for inicio in range(0, n, lote):
+        m = min(lote, n - inicio)
+        vectores = rng.standard_normal((m, dimension), dtype=np.float32)
+        titulos = rng.choice(TITULOS, size=m)
+        documentos = [
+            Document(page_content=f"Fragmento normativo {inicio + i}: {t}. Texto de ejemplo para el benchmark.",
+                     metadata={"titulo": str(t)})
+            for i, t in enumerate(titulos)
+        ]
+        yield vectores, documentos
+
+
+def cargar(backend: str, n: int, dimension: int, rng):
+    almacenes, client, async_client = crear_almacenes(
+        backend, COLECCIONES, FakeEmbeddings(size=dimension), ruta_local=":memory:", dimension=dimension,
+    )
+    por_coleccion = n // len(COLECCIONES)
+    for col in COLECCIONES:
+        if backend == "numpy":
+            for vectores, documentos in corpus(rng, por_coleccion, dimension):
+                almacenes[col].anadir(vectores, documentos)
+        else:
+            client.create_collection(col, vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE))
+            siguiente_id = 0
+            for vectores, documentos in corpus(rng, por_coleccion, dimension, lote=2_000):
+                client.upload_points(col, [
+                    models.PointStruct(id=siguiente_id + i, vector=v.tolist(),
+                                       payload={"page_content": d.page_content, "metadata": d.metadata})
+                    for i, (v, d) in enumerate(zip(vectores, documentos))
+                ])
+                siguiente_id += len(documentos)
+    servicio = ServicioRecuperacion(almacenes, None, {}, k_por_coleccion=3, client=client, async_client=async_client)
+    servicio.asegurar_indices()
+    return servicio, almacenes
+
+
+def percentil(valores, p: float) -> float:
+    return float(np.percentile(valores, p)) if valores else 0.0
+
+
+async def medir_consultas(servicio, consultas, palabras, k: int):
+    latencias = []
+    for vector, palabra in zip(consultas, palabras):
+        inicio = time.perf_counter()
+        await servicio.buscar_por_palabra(palabra, vector.tolist(), k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+
+def ejecutar(backend: str, n: int, dimension: int, n_consultas: int, k: int, semilla: int) -> dict:
+    rng = np.random.default_rng(semilla)
+    memoria_inicial = rss_mb()
+    inicio = time.perf_counter()
+    servicio, almacenes = cargar(backend, n, dimension, rng)
+    carga_s = time.perf_counter() - inicio
+    memoria_mb = rss_mb() - memoria_inicial
+
+    consultas = rng.standard_normal((n_consultas, dimension), dtype=np.float32)
+    palabras = rng.choice(PALABRAS, size=n_consultas)
+    asyncio.run(medir_consultas(servicio, consultas[:5], palabras[:5], k))  # Calentamiento
+    latencias = asyncio.run(medir_consultas(servicio, consultas, palabras, k))
+
+    resultado = {
+        "backend": backend, "chunks": n, "dimension": dimension, "carga_s": round(carga_s, 2),
+        "memoria_mb": round(memoria_mb, 1), "p50_ms": round(percentil(latencias, 50), 2),
+        "p95_ms": round(percentil(latencias, 95), 2), "p99_ms": round(percentil(latencias, 99), 2),
+        "media_ms": round(statistics.fmean(latencias), 2), "consultas_s": round(1000 / statistics.fmean(latencias), 1),
+    }
+
+    if backend == "numpy":
+        # Búsqueda por lotes: todas las consultas en una multiplicación de matrices por colección
+        inicio = time.perf_counter()
+        for indice in almacenes.values():
+            indice.buscar_lote(consultas, k)
+        resultado["lote_consultas_s"] = round(n_consultas / (time.perf_counter() - inicio), 1)
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.recuperacion", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--backends", nargs="+", default=["numpy", "qdrant_local"])
+    parser.add_argument("--dimension", type=int, default=768, help="Dimensión de models/embedding-001")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", type=Path, help="Guarda los resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = []
+    print(f"{'backend':<13}{'chunks':>10}{'carga s':>9}{'MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'cons/s':>9}{'lote/s':>9}")
+    for n in args.tamanos:
+        for backend in args.backends:
+            # Cada medición en un proceso nuevo para que la memoria de una no se sume a la siguiente
+            with ProcessPoolExecutor(max_workers=1) as proceso:
+                r = proceso.submit(ejecutar, backend, n, args.dimension, args.consultas, args.k, args.semilla).result()
+            resultados.append(r)
+            print(f"{r['backend']:<13}{r['chunks']:>10}{r['carga_s']:>9}{r['memoria_mb']:>9}{r['p50_ms']:>9}"
+                  f"{r['p95_ms']:>9}{r['p99_ms']:>9}{r['consultas_s']:>9}{r.get('lote_consultas_s', '-'):>9}", flush=True)
+
+    if args.salida:
+        args.salida.write_text(json.dumps(resultados, indent=2), encoding="utf-8")
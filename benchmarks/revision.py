@@ -0,0 +1,157 @@
+# benchmarks/revision.py
+"""
+Compara los dos modos de la revisión final del pliego administrativo (ADM_MODO_REVISION):
+
+- unica:     REVISION_FINAL con el pliego completo, en una sola llamada
+- secciones: cada sección revisada en paralelo con los datos clave comunes + una pasada de coherencia con parches
+
+Para cada modo mide la latencia de la revisión (core_adm.revisar_pliego), las llamadas y los tokens de entrada
+y salida (los que anota la pasarela), y la salida más larga de una sola llamada, que es la que se acerca al
+límite de tokens de salida del modelo.
+
+Por defecto usa un modelo falso que devuelve el texto que recibe y tarda lo que tardaría en generarlo:
+primer token + tokens de salida / velocidad. Es lo que domina una revisión: la única reescribe el pliego
+entero en una respuesta, la de secciones reparte lo mismo entre llamadas en paralelo (tantas a la vez
+como ADM_MAX_SECCIONES). Con --real se usa el modelo configurado (Gemini, o el casete según LICIZEN_LLM_MODO).
+
+Uso:
+    python -m benchmarks.revision [--pliego resultado.json] [--json datos.json] [--repeticiones 3]
+                                  [--palabras 500] [--primer-token 0.6] [--velocidad 150] [--max-salida 8192] [--real]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from comun import metricas
+from comun.pasarela_llm import estimar_tokens
+from benchmarks.tokens_secciones import DATOS_EJEMPLO
+
+MODOS = ("unica", "secciones")
+MARCAS = ("Texto de la sección:\n", "Texto del pliego:\n")  # Lo que sigue es lo que se revisa
+
+
+class ChatEco(BaseChatModel):
+    """Devuelve el texto a revisar tal cual (o JSON sin parches a la pasada de coherencia), con latencia según su longitud."""
+
+    primer_token: float = 0.6
+    velocidad: float = 150.0  # Tokens de salida por segundo
+    max_salida: int = 8192
+    salida_maxima: int = 0  # La respuesta más larga que se ha pedido, en tokens
+    truncadas: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "eco"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError("ChatEco solo admite llamadas async")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = messages[-1].content
+        texto = '{"parches": [], "advertencias": []}'
+        for marca in MARCAS:
+            if marca in prompt:
+                texto = prompt.split(marca, 1)[1]
+        salida = estimar_tokens(texto)
+        self.salida_maxima = max(self.salida_maxima, salida)
+        if salida > self.max_salida:  # El modelo cortaría la respuesta: el pliego revisado quedaría incompleto
+            self.truncadas += 1
+            salida, texto = self.max_salida, texto[:self.max_salida * 4]
+        await asyncio.sleep(self.primer_token + salida / self.velocidad)
+        mensaje = AIMessage(content=texto, usage_metadata={
+            "input_tokens": estimar_tokens(prompt), "output_tokens": salida, "total_tokens": estimar_tokens(prompt) + salida,
+        })
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+
+def secciones_sinteticas(datos, palabras: int) -> dict:
+    """Secciones de unas `palabras` palabras que repiten las cifras del contrato, como las que redacta Gemini."""
+    from app_adm.LiciZen_adm import SECCIONES
+
+    frase = (f"El presupuesto base de licitación asciende a {datos.pbl_sin_iva:g} euros sin IVA, con una duración "
+             f"de {datos.duracion_meses} meses y prórrogas de {datos.prorrogas} meses, conforme a la LCSP. "
+             "El adjudicatario ejecutará el contrato con sujeción a lo establecido en este pliego y en el de prescripciones técnicas. ")
+    repeticiones = max(1, palabras // len(frase.split()))
+    return {sec: f"### {sec}\n\n" + frase * repeticiones for sec in SECCIONES}
+
+
+async def medir(modo: str, secciones: dict, datos, repeticiones: int, llm) -> dict:
+    from app_adm.core_adm import revisar_pliego
+
+    def tokens(tipo: str) -> float:
+        return metricas.TOKENS.suma(tipo=tipo)
+
+    tiempos, llamadas, entrada, salida = [], [], [], []
+    for _ in range(repeticiones):
+        antes = (metricas.LLAMADAS.suma(), tokens("entrada"), tokens("salida"))
+        if llm is not None:
+            llm.salida_maxima = 0
+        inicio = time.perf_counter()
+        await revisar_pliego(secciones, datos, modo=modo)
+        tiempos.append(time.perf_counter() - inicio)
+        llamadas.append(metricas.LLAMADAS.suma() - antes[0])
+        entrada.append(tokens("entrada") - antes[1])
+        salida.append(tokens("salida") - antes[2])
+    return {
+        "latencia_s": statistics.median(tiempos), "llamadas": statistics.median(llamadas),
+        "tokens_entrada": statistics.median(entrada), "tokens_salida": statistics.median(salida),
+        "salida_maxima": llm.salida_maxima if llm is not None else None,
+    }
+
+
+async def comparar(args) -> dict:
+    from app_adm.LiciZen_adm import Datos
+    from app_adm.recursos_adm import recursos
+
+    datos = Datos(**(json.loads(args.json.read_text(encoding="utf-8")) if args.json else DATOS_EJEMPLO))
+    if args.pliego:
+        secciones = json.loads(args.pliego.read_text(encoding="utf-8"))["secciones"]
+    else:
+        secciones = secciones_sinteticas(datos, args.palabras)
+
+    llm = None
+    if not args.real:
+        llm = ChatEco(primer_token=args.primer_token, velocidad=args.velocidad, max_salida=args.max_salida)
+        recursos.registrar("llm", lambda: llm)
+    try:
+        resultados = {modo: await medir(modo, secciones, datos, args.repeticiones, llm) for modo in MODOS}
+    finally:
+        await recursos.cerrar()
+    if llm is not None:
+        resultados["unica"]["truncadas"] = llm.truncadas
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.revision", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pliego", type=Path, help="JSON devuelto por /administrativo (usa sus secciones)")
+    parser.add_argument("--json", type=Path, help="Datos del pliego (por defecto, el ejemplo de tokens_secciones)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--palabras", type=int, default=500, help="Palabras por sección sintética (sin --pliego)")
+    parser.add_argument("--primer-token", type=float, default=0.6, help="Segundos hasta el primer token (modelo falso)")
+    parser.add_argument("--velocidad", type=float, default=150.0, help="Tokens de salida por segundo (modelo falso)")
+    parser.add_argument("--max-salida", type=int, default=8192, help="Límite de tokens de salida (modelo falso)")
+    parser.add_argument("--real", action="store_true", help="Usa el modelo configurado en lugar del falso")
+    parser.add_argument("--salida", type=Path, help="Guarda los resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(comparar(args))
+    print(f"{'modo':<11}{'latencia s':>11}{'llamadas':>10}{'tok. entrada':>14}{'tok. salida':>13}{'salida máx.':>13}")
+    for modo, r in resultados.items():
+        maxima = "-" if r["salida_maxima"] is None else f"{r['salida_maxima']:.0f}"
+        print(f"{modo:<11}{r['latencia_s']:>11.2f}{r['llamadas']:>10.0f}{r['tokens_entrada']:>14.0f}"
+              f"{r['tokens_salida']:>13.0f}{maxima:>13}")
+    unica, secciones = resultados["unica"], resultados["secciones"]
+    print(f"secciones frente a unica: latencia {secciones['latencia_s'] / unica['latencia_s'] - 1:+.0%}, "
+          f"tokens {(secciones['tokens_entrada'] + secciones['tokens_salida']) / (unica['tokens_entrada'] + unica['tokens_salida']) - 1:+.0%}")
+    if unica.get("truncadas"):
+        print(f"⚠️ La revisión única superó el límite de salida ({args.max_salida} tokens) en {unica['truncadas']} llamadas")
+    if args.salida:
+        args.salida.write_text(json.dumps(resultados, indent=2), encoding="utf-8")
@@ -0,0 +1,81 @@
+# benchmarks/tokens_secciones.py
+"""
+Informe de tokens de entrada por sección del pliego administrativo, antes y después de proyectar Datos.
+
+- antes:   el prompt de cada sección llevaba el Datos completo con json.dumps(..., indent=2)
+- despues: cada sección lleva solo sus campos (CAMPOS_POR_SECCION) en JSON compacto (proyectar_datos)
+
+Cuenta con tiktoken (cl100k_base, aproximación del tokenizador de Gemini). Si la codificación no
+está disponible (se descarga la primera vez), usa la estimación de la pasarela (≈ 4 caracteres por
+token). El contexto normativo recuperado no cambia entre ambas versiones y no se incluye.
+
+Uso:
+    python -m benchmarks.tokens_secciones [--json datos.json] [--precio-millon 0.30]
+"""
+import argparse
+import json
+from pathlib import Path
+
+from comun.pasarela_llm import estimar_tokens
+from app_adm.LiciZen_adm import PAUTAS, PROMPT, SECCIONES, Datos, proyectar_datos
+
+DATOS_EJEMPLO = {
+    "objeto_contrato": "Servicio de digitalización y gestión documental del archivo municipal",
+    "necesidad_resuelta": "Digitalizar el fondo histórico y dar acceso electrónico a la ciudadanía",
+    "responsable_contrato": "Jefa del Servicio de Archivo",
+    "lugar_prestacion": "Dependencias del Archivo Municipal",
+    "pbl_sin_iva": 180000, "iva": 21, "duracion_meses": 24, "prorrogas": 12,
+    "documentacion": {"declaracion_responsable": True, "oferta_economica": True, "aceptacion_pliego": True,
+                      "equipo_cumple": True, "fecha": "25 de mayo de 2025"},
+    "proteccion_datos": {"trata_datos": True, "subcontrata_servidores": "Alojamiento en nube con servidores en la UE"},
+    "subcontratacion": {"subcontratara": True, "subcontratas_no_vinculadas": True},
+    "criterios": {"precio_ofertado": 170000, "anormalmente_bajo": False},
+    "nextgen": {"cumple_prtr": True, "modelos_b1b2c": True, "titular_real": "Empresa Ejemplo S.L."},
+    "garantias": {"garantia_provisional": False},
+    "solvencia": {"volumen_anual_negocios_min": 270000, "importe_anual_similares_min": 126000, "seguro_rcp_min": 300000},
+    "ponderacion": {"metodologia_plan": 30, "equipo_experiencia": 20, "dnsh_sostenibilidad": 10, "oferta_economica": 40},
+}
+
+
+def contador():
+    """Devuelve (nombre, función que cuenta tokens)."""
+    try:
+        import tiktoken
+        codificacion = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken cl100k_base", lambda texto: len(codificacion.encode(texto))
+    except Exception as e:
+        print(f"⚠️ tiktoken no disponible ({type(e).__name__}); se usa la estimación de ≈ 4 caracteres por token")
+        return "estimación", estimar_tokens
+
+
+def prompt_seccion(sec: str, datos_json: str) -> str:
+    return PROMPT.format(titulo=sec, pautas=PAUTAS.get(sec, ""), datos=datos_json, contexto="")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.tokens_secciones", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--json", type=Path, help="Datos de un pliego (por defecto, un ejemplo)")
+    parser.add_argument("--precio-millon", type=float, default=0.30, help="Precio en $ por millón de tokens de entrada")
+    args = parser.parse_args()
+
+    datos = Datos(**json.loads(args.json.read_text(encoding="utf-8"))) if args.json else Datos(**DATOS_EJEMPLO)
+    nombre, contar = contador()
+    antes_json = json.dumps(datos.model_dump(), ensure_ascii=False, indent=2)
+    despues_json = proyectar_datos(datos)
+
+    print(f"Tokens de entrada por sección ({nombre}), sin contexto normativo\n")
+    print(f"{'Sección':<56}{'datos antes':>12}{'datos después':>15}{'prompt antes':>14}{'prompt después':>16}")
+    total_antes = total_despues = datos_antes = datos_despues = 0
+    for sec in SECCIONES:
+        fila = (contar(antes_json), contar(despues_json[sec]),
+                contar(prompt_seccion(sec, antes_json)), contar(prompt_seccion(sec, despues_json[sec])))
+        datos_antes += fila[0]
+        datos_despues += fila[1]
+        total_antes += fila[2]
+        total_despues += fila[3]
+        print(f"{sec:<56}{fila[0]:>12}{fila[1]:>15}{fila[2]:>14}{fila[3]:>16}")
+
+    print(f"{'Total':<56}{datos_antes:>12}{datos_despues:>15}{total_antes:>14}{total_despues:>16}")
+    print(f"\nDatos: −{1 - datos_despues / datos_antes:.0%}   Prompt completo: −{1 - total_despues / total_antes:.0%}   "
+          f"Coste de entrada por pliego: ${total_antes * args.precio_millon / 1e6:.5f} → "
+          f"${total_despues * args.precio_millon / 1e6:.5f}")
@@ -0,0 +1,93 @@
+# comun/borradores.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Dict, Optional
+
+
+def fusionar(base: Dict[str, Any], cambios: Dict[str, Any]) -> Dict[str, Any]:
+    """Fusión profunda: aplica un subconjunto de campos (anidados) sobre una copia de `base`."""
+    resultado = dict(base)
+    for clave, valor in cambios.items():
+        if isinstance(valor, dict) and isinstance(resultado.get(clave), dict):
+            resultado[clave] = fusionar(resultado[clave], valor)
+        else:
+            resultado[clave] = valor
+    return resultado
+
+
+class AlmacenBorradores:
+    """
+    Borradores de pliegos persistidos en SQLite, identificados por un ID.
+
+    Cada borrador guarda la entrada del usuario (respuestas o Datos), el resultado generado y
+    la huella de entrada de cada sección, para regenerar después solo las secciones cuya
+    entrada haya cambiado. Los métodos son bloqueantes: desde async, con asyncio.to_thread.
+    """
+
+    def __init__(self, ruta: str):
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS borradores ("
+            " id TEXT PRIMARY KEY, tipo TEXT NOT NULL, entrada TEXT NOT NULL, huellas TEXT NOT NULL,"
+            " resultado TEXT NOT NULL, creado REAL NOT NULL, actualizado REAL NOT NULL)"
+        )
+        self._conexion.commit()
+        self._candados: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @classmethod
+    def desde_entorno(cls, prefijo: str, ruta_por_defecto: str) -> "AlmacenBorradores":
+        """Ruta configurable con <PREFIJO>_BORRADORES."""
+        return cls(os.getenv(f"{prefijo}_BORRADORES", ruta_por_defecto))
+
+    def crear(self, tipo: str, entrada: Any, huellas: Dict[str, str], resultado: Any) -> str:
+        id_borrador = uuid.uuid4().hex
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "INSERT INTO borradores VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (id_borrador, tipo, json.dumps(entrada, ensure_ascii=False), json.dumps(huellas),
+                 json.dumps(resultado, ensure_ascii=False), ahora, ahora),
+            )
+            self._conexion.commit()
+        return id_borrador
+
+    def obtener(self, id_borrador: str, tipo: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT id, tipo, entrada, huellas, resultado, creado, actualizado FROM borradores WHERE id = ?",
+                (id_borrador,),
+            ).fetchone()
+        if fila is None or (tipo is not None and fila[1] != tipo):
+            return None
+        return {
+            "id": fila[0], "tipo": fila[1], "entrada": json.loads(fila[2]), "huellas": json.loads(fila[3]),
+            "resultado": json.loads(fila[4]), "creado": fila[5], "actualizado": fila[6],
+        }
+
+    def actualizar(self, id_borrador: str, entrada: Any, huellas: Dict[str, str], resultado: Any) -> None:
+        with self._lock:
+            self._conexion.execute(
+                "UPDATE borradores SET entrada = ?, huellas = ?, resultado = ?, actualizado = ? WHERE id = ?",
+                (json.dumps(entrada, ensure_ascii=False), json.dumps(huellas),
+                 json.dumps(resultado, ensure_ascii=False), time.time(), id_borrador),
+            )
+            self._conexion.commit()
+
+    def candado(self, id_borrador: str) -> asyncio.Lock:
+        """Lock por borrador: dos actualizaciones del mismo borrador no se pisan entre sí."""
+        candado = self._candados.get(id_borrador)
+        if candado is None:
+            candado = self._candados[id_borrador] = asyncio.Lock()
+        return candado
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conexion.close()
@@ -0,0 +1,139 @@
+# comun/cache_resultados.py
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from cachetools import TTLCache
+
+# Estados que se devuelven al cliente en la cabecera X-Cache
+HIT, HIT_DISCO, COMPARTIDO, MISS = "HIT", "HIT-DISK", "HIT-INFLIGHT", "MISS"
+
+
+def clave_canonica(*partes: Any) -> str:
+    """Hash estable de las partes (JSON con claves ordenadas y sin espacios)."""
+    texto = json.dumps(partes, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class _Disco:
+    """Segundo nivel opcional en SQLite: sobrevive a reinicios y lo comparten los workers."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion_pid: Optional[Tuple[sqlite3.Connection, int]] = None
+
+    @property
+    def _conexion(self) -> sqlite3.Connection:
+        # La conexión se abre en el primer uso y una por proceso: con gunicorn --preload la caché se
+        # crea en el maestro y una conexión SQLite no debe cruzar un fork
+        if self._conexion_pid is None or self._conexion_pid[1] != os.getpid():
+            conexion = sqlite3.connect(self.ruta, check_same_thread=False, timeout=30)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS resultados (clave TEXT PRIMARY KEY, valor TEXT NOT NULL, caduca REAL NOT NULL)"
+            )
+            conexion.commit()
+            self._conexion_pid = (conexion, os.getpid())
+        return self._conexion_pid[0]
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT valor FROM resultados WHERE clave = ? AND caduca > ?", (clave, time.time())
+            ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def guardar(self, clave: str, valor: Any, ttl: float) -> None:
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO resultados (clave, valor, caduca) VALUES (?, ?, ?)",
+                (clave, json.dumps(valor, ensure_ascii=False), time.time() + ttl),
+            )
+            self._conexion.execute("DELETE FROM resultados WHERE caduca <= ?", (time.time(),))
+            self._conexion.commit()
+
+
+class CacheResultados:
+    """
+    Caché de pliegos completos direccionada por contenido.
+
+    La clave es un hash canónico de la petición validada junto con la versión de los prompts
+    y del modelo. Primer nivel en memoria (LRU con caducidad), segundo nivel opcional en disco.
+    Si llegan a la vez dos peticiones iguales, la segunda espera a la primera en lugar de generar.
+    """
+
+    def __init__(self, max_entradas: int = 128, ttl: float = 3600, ruta_disco: Optional[str] = None):
+        self.ttl = ttl
+        self._memoria: TTLCache = TTLCache(maxsize=max_entradas, ttl=ttl)
+        self._disco = _Disco(ruta_disco) if ruta_disco else None
+        self._en_curso: dict = {}
+        self.aciertos = self.fallos = 0
+
+    @classmethod
+    def desde_entorno(cls, prefijo: str) -> "CacheResultados":
+        """
+        Configuración por variables <PREFIJO>_CACHE_MAX, <PREFIJO>_CACHE_TTL y <PREFIJO>_CACHE_DISCO.
+        Con LICIZEN_CACHE_COMPARTIDA=1 (app unificada) todos los servicios del proceso comparten una
+        sola caché, configurada con el prefijo LICIZEN: las claves son hashes de peticiones distintas.
+        """
+        global _COMPARTIDA
+        if os.getenv("LICIZEN_CACHE_COMPARTIDA") == "1" and prefijo != "LICIZEN":
+            if _COMPARTIDA is None:
+                _COMPARTIDA = cls.desde_entorno("LICIZEN")
+            return _COMPARTIDA
+        return cls(
+            max_entradas=int(os.getenv(f"{prefijo}_CACHE_MAX", "128")),
+            ttl=float(os.getenv(f"{prefijo}_CACHE_TTL", "3600")),
+            ruta_disco=os.getenv(f"{prefijo}_CACHE_DISCO") or None,
+        )
+
+    async def obtener(self, clave: str) -> Tuple[Optional[Any], str]:
+        """Solo consulta (memoria y disco), sin generar. Devuelve (resultado o None, estado)."""
+        if clave in self._memoria:
+            return self._memoria[clave], HIT
+        if self._disco is not None:
+            valor = await asyncio.to_thread(self._disco.obtener, clave)
+            if valor is not None:
+                self._memoria[clave] = valor
+                return valor, HIT_DISCO
+        return None, MISS
+
+    async def guardar(self, clave: str, valor: Any) -> None:
+        self._memoria[clave] = valor
+        if self._disco is not None:
+            await asyncio.to_thread(self._disco.guardar, clave, valor, self.ttl)
+
+    async def obtener_o_generar(self, clave: str, generar: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Devuelve (resultado, estado); solo llama a `generar` si no está en caché ni generándose ya."""
+        valor, estado = await self.obtener(clave)
+        if valor is not None:
+            self.aciertos += 1
+            return valor, estado
+
+        if clave in self._en_curso:
+            self.aciertos += 1
+            return await asyncio.shield(self._en_curso[clave]), COMPARTIDO
+
+        self.fallos += 1
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        try:
+            valor = await generar()
+            await self.guardar(clave, valor)
+            futuro.set_result(valor)
+            return valor, MISS
+        except BaseException as e:
+            futuro.set_exception(e if isinstance(e, Exception) else RuntimeError("Generación cancelada"))
+            futuro.exception()  # Marcado como leído: si nadie más esperaba, no se avisa en el log
+            raise
+        finally:
+            del self._en_curso[clave]
+
+
+_COMPARTIDA: Optional[CacheResultados] = None
@@ -0,0 +1,243 @@
+# comun/casete.py
+"""
+Casete de llamadas a Gemini: graba cada prompt con su respuesta y la reproduce después sin red.
+
+Modo según LICIZEN_LLM_MODO:
+- directo    (por defecto) se llama al modelo real y no se graba nada
+- grabar     se llama al modelo real y se guarda la respuesta (trozos del stream, latencia, tokens)
+- reproducir se sirve la respuesta grabada; si falta, FaltaEnCasete. No hace falta clave de API
+
+La clave es un hash del modelo, sus parámetros y el prompt, así que un cambio en un prompt solo
+invalida las secciones afectadas. Las grabaciones viven en SQLite (LICIZEN_LLM_CASETE) con el texto
+comprimido; también se graban los embeddings de las consultas de app_adm, de modo que con un índice
+vectorial local (ADM_BACKEND_VECTORIAL=numpy o qdrant_local) los dos pipelines corren sin red.
+
+Al reproducir, LICIZEN_LLM_LATENCIA escala la latencia grabada: 0 (por defecto) responde al
+instante y 1 reproduce la original, primer trozo incluido.
+
+Los envoltorios de langchain (app_adm) están en comun.casete_langchain y solo se importan al grabar o
+reproducir: app_tec, que no depende de langchain, puede importar este módulo.
+
+El casete va por debajo de la pasarela (comun.pasarela_llm): al grabar se siguen aplicando los
+límites y reintentos, y al reproducir las métricas de tokens salen de los tokens grabados.
+"""
+import array
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from . import metricas
+from .cache_resultados import clave_canonica
+from .pasarela_llm import uso_tokens
+
+DIRECTO, GRABAR, REPRODUCIR = "directo", "grabar", "reproducir"
+RUTA_POR_DEFECTO = str(Path(__file__).resolve().parent / "casete_llm.sqlite3")
+
+USOS = metricas.Contador("licizen_casete_total", "Llamadas a Gemini grabadas, reproducidas o que faltaban en el casete")
+metricas.registrar_colector(USOS.exponer)
+
+
+class FaltaEnCasete(LookupError):
+    """El modo reproducir no tiene grabada la respuesta a este prompt."""
+
+
+class Casete:
+    """
+    Grabaciones prompt → respuesta en SQLite. Los métodos son bloqueantes: desde async,
+    con asyncio.to_thread (como AlmacenBorradores).
+    """
+
+    def __init__(self, ruta: str, modo: str, escala_latencia: float = 0.0):
+        if modo not in (GRABAR, REPRODUCIR):
+            raise ValueError(f"Modo de casete no válido: {modo!r} (grabar o reproducir)")
+        self.modo = modo
+        self.escala_latencia = escala_latencia
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS grabaciones ("
+            " clave TEXT PRIMARY KEY, modelo TEXT NOT NULL, trozos BLOB NOT NULL, latencia REAL NOT NULL,"
+            " primer_trozo REAL NOT NULL, entrada INTEGER, salida INTEGER, creado REAL NOT NULL)"
+        )
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS vectores (clave TEXT PRIMARY KEY, modelo TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conexion.commit()
+
+    @classmethod
+    def desde_entorno(cls) -> Optional["Casete"]:
+        """None en modo directo; si no, el casete de LICIZEN_LLM_CASETE con LICIZEN_LLM_LATENCIA."""
+        modo = os.getenv("LICIZEN_LLM_MODO") or DIRECTO
+        if modo == DIRECTO:
+            return None
+        return cls(os.getenv("LICIZEN_LLM_CASETE") or RUTA_POR_DEFECTO, modo,
+                   float(os.getenv("LICIZEN_LLM_LATENCIA") or 0))
+
+    def leer(self, clave: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT trozos, latencia, primer_trozo, entrada, salida FROM grabaciones WHERE clave = ?", (clave,)
+            ).fetchone()
+        USOS.sumar(1, resultado="reproducida" if fila else "falta")
+        if fila is None:
+            return None
+        return {"trozos": json.loads(zlib.decompress(fila[0])), "latencia": fila[1], "primer_trozo": fila[2],
+                "uso": (fila[3], fila[4]) if fila[3] is not None else None}
+
+    def grabar(self, clave: str, modelo: str, trozos: List[str], latencia: float, primer_trozo: float,
+               uso: Optional[tuple]) -> None:
+        entrada, salida = uso or (None, None)
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO grabaciones VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (clave, modelo, zlib.compress(json.dumps(trozos, ensure_ascii=False).encode("utf-8")),
+                 latencia, primer_trozo, entrada, salida, time.time()),
+            )
+            self._conexion.commit()
+        USOS.sumar(1, resultado="grabada")
+
+    def leer_vector(self, clave: str) -> Optional[List[float]]:
+        with self._lock:
+            fila = self._conexion.execute("SELECT vector FROM vectores WHERE clave = ?", (clave,)).fetchone()
+        return array.array("f", fila[0]).tolist() if fila else None
+
+    def grabar_vector(self, clave: str, modelo: str, vector: List[float]) -> None:
+        with self._lock:
+            self._conexion.execute("INSERT OR REPLACE INTO vectores VALUES (?, ?, ?)",
+                                   (clave, modelo, array.array("f", vector).tobytes()))
+            self._conexion.commit()
+
+    async def reproducir(self, clave: str) -> Dict[str, Any]:
+        grabacion = await asyncio.to_thread(self.leer, clave)
+        if grabacion is None:
+            raise FaltaEnCasete(f"Prompt {clave[:12]} sin grabar: ejecútalo antes con LICIZEN_LLM_MODO=grabar")
+        return grabacion
+
+    async def trozos_reproducidos(self, grabacion: Dict[str, Any]):
+        """Los trozos grabados, con la latencia original (primer trozo y resto repartido) escalada."""
+        trozos = grabacion["trozos"] or [""]
+        resto = max(0.0, grabacion["latencia"] - grabacion["primer_trozo"]) / max(1, len(trozos) - 1)
+        for i, trozo in enumerate(trozos):
+            if self.escala_latencia:
+                await asyncio.sleep((grabacion["primer_trozo"] if i == 0 else resto) * self.escala_latencia)
+            yield trozo
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conexion.close()
+
+
+# Un casete por proceso (la conexión SQLite no se comparte entre workers)
+_CASETES: Dict[int, Optional[Casete]] = {}
+_lock_casetes = threading.Lock()
+
+
+def obtener_casete() -> Optional[Casete]:
+    pid = os.getpid()
+    if pid not in _CASETES:
+        with _lock_casetes:
+            if pid not in _CASETES:
+                _CASETES[pid] = Casete.desde_entorno()
+    return _CASETES[pid]
+
+
+class _Cronometro:
+    """Tiempo hasta el primer trozo y total de una llamada que se está grabando."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.primer_trozo = None
+
+    def trozo(self) -> None:
+        if self.primer_trozo is None:
+            self.primer_trozo = time.perf_counter() - self.inicio
+
+    def total(self) -> float:
+        return time.perf_counter() - self.inicio
+
+
+# ── google.generativeai (app_tec) ─────────────────────────────────────────────
+def _respuesta_genai(texto: str, uso: Optional[tuple]):
+    return SimpleNamespace(text=texto, usage_metadata=SimpleNamespace(
+        prompt_token_count=uso[0], candidates_token_count=uso[1]) if uso else None)
+
+
+class ModeloCasete:
+    """Sustituye a genai.GenerativeModel: generate_content_async (con y sin stream) pasando por el casete."""
+
+    def __init__(self, crear: Callable[[], Any], nombre: str, parametros: Dict[str, Any], casete: Casete):
+        self.model_name = nombre  # pasarela_de() usa el nombre del modelo
+        self.parametros = parametros
+        self.casete = casete
+        self._modelo = crear() if casete.modo == GRABAR else None
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        clave = clave_canonica("genai", self.model_name, self.parametros, prompt)
+        if self.casete.modo == REPRODUCIR:
+            grabacion = await self.casete.reproducir(clave)
+            if stream:
+                return self._stream_reproducido(grabacion)
+            async for _ in self.casete.trozos_reproducidos(grabacion):
+                pass
+            return _respuesta_genai("".join(grabacion["trozos"]), grabacion["uso"])
+
+        cronometro = _Cronometro()
+        respuesta = await self._modelo.generate_content_async(prompt, stream=stream, **kwargs)
+        if stream:
+            return self._stream_grabado(clave, respuesta, cronometro)
+        cronometro.trozo()
+        await asyncio.to_thread(self.casete.grabar, clave, self.model_name, [respuesta.text],
+                                cronometro.total(), cronometro.primer_trozo, uso_tokens(respuesta))
+        return respuesta
+
+    async def _stream_reproducido(self, grabacion):
+        trozos = grabacion["trozos"]
+        i = 0
+        async for trozo in self.casete.trozos_reproducidos(grabacion):
+            i += 1
+            yield _respuesta_genai(trozo, grabacion["uso"] if i == len(trozos) else None)
+
+    async def _stream_grabado(self, clave: str, respuesta, cronometro: _Cronometro):
+        trozos, uso = [], None
+        async for chunk in respuesta:
+            cronometro.trozo()
+            trozos.append(chunk.text)
+            uso = uso_tokens(chunk) or uso
+            yield chunk
+        await asyncio.to_thread(self.casete.grabar, clave, self.model_name, trozos,
+                                cronometro.total(), cronometro.primer_trozo or 0.0, uso)
+
+
+def modelo_con_casete(crear: Callable[[], Any], nombre: str, parametros: Dict[str, Any]):
+    """El modelo real en modo directo; si no, un ModeloCasete que lo graba o lo sustituye."""
+    casete = obtener_casete()
+    return crear() if casete is None else ModeloCasete(crear, nombre, parametros, casete)
+
+
+# ── langchain (app_adm) ───────────────────────────────────────────────────────
+def chat_con_casete(crear: Callable[[], Any], nombre: str, parametros: Dict[str, Any]):
+    """El chat real en modo directo; si no, un ChatCasete que lo graba o lo sustituye."""
+    casete = obtener_casete()
+    if casete is None:
+        return crear()
+    from .casete_langchain import ChatCasete
+
+    return ChatCasete(modelo=crear() if casete.modo == GRABAR else None, nombre=nombre,
+                      parametros=parametros, casete=casete)
+
+
+def embeddings_con_casete(crear: Callable[[], Any], nombre: str):
+    casete = obtener_casete()
+    if casete is None:
+        return crear()
+    from .casete_langchain import EmbeddingsCasete
+
+    return EmbeddingsCasete(crear() if casete.modo == GRABAR else None, nombre, casete)
@@ -0,0 +1,130 @@
+# comun/casete_langchain.py
+"""
+Envoltorios de langchain del casete (comun.casete) para app_adm: el chat y los embeddings de consulta.
+Se importan desde chat_con_casete y embeddings_con_casete solo al grabar o reproducir.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .cache_resultados import clave_canonica
+from .casete import REPRODUCIR, Casete, FaltaEnCasete, _Cronometro
+from .pasarela_llm import uso_tokens
+
+
+def _uso_langchain(uso: Optional[tuple]) -> Optional[dict]:
+    return {"input_tokens": uso[0], "output_tokens": uso[1], "total_tokens": uso[0] + uso[1]} if uso else None
+
+
+class ChatCasete(BaseChatModel):
+    """Sustituye al ChatGoogleGenerativeAI de app_adm: invocación y stream pasando por el casete."""
+
+    modelo: Optional[BaseChatModel] = None  # None al reproducir
+    nombre: str
+    parametros: Dict[str, Any] = {}
+    casete: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "casete"
+
+    def _clave(self, messages, stop) -> str:
+        return clave_canonica("langchain", self.nombre, self.parametros, [(m.type, m.content) for m in messages], stop)
+
+    @staticmethod
+    def _reproducido(grabacion: Dict[str, Any]) -> ChatResult:
+        mensaje = AIMessage(content="".join(grabacion["trozos"]), usage_metadata=_uso_langchain(grabacion["uso"]))
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # Versión síncrona (invoke), como EmbeddingsCasete.embed_query: lee o graba directamente en SQLite
+        clave = self._clave(messages, stop)
+        if self.casete.modo == REPRODUCIR:
+            grabacion = self.casete.leer(clave)
+            if grabacion is None:
+                raise FaltaEnCasete(f"Prompt {clave[:12]} sin grabar: ejecútalo antes con LICIZEN_LLM_MODO=grabar")
+            time.sleep(grabacion["latencia"] * self.casete.escala_latencia)
+            return self._reproducido(grabacion)
+
+        cronometro = _Cronometro()
+        mensaje = self.modelo.invoke(messages, stop=stop, **kwargs)
+        cronometro.trozo()
+        self.casete.grabar(clave, self.nombre, [mensaje.content], cronometro.total(), cronometro.primer_trozo,
+                           uso_tokens(mensaje))
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        clave = self._clave(messages, stop)
+        if self.casete.modo == REPRODUCIR:
+            grabacion = await self.casete.reproducir(clave)
+            async for _ in self.casete.trozos_reproducidos(grabacion):
+                pass
+            return self._reproducido(grabacion)
+
+        cronometro = _Cronometro()
+        mensaje = await self.modelo.ainvoke(messages, stop=stop, **kwargs)
+        cronometro.trozo()
+        await asyncio.to_thread(self.casete.grabar, clave, self.nombre, [mensaje.content],
+                                cronometro.total(), cronometro.primer_trozo, uso_tokens(mensaje))
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        clave = self._clave(messages, stop)
+        if self.casete.modo == REPRODUCIR:
+            grabacion = await self.casete.reproducir(clave)
+            trozos = grabacion["trozos"]
+            i = 0
+            async for trozo in self.casete.trozos_reproducidos(grabacion):
+                i += 1
+                uso = _uso_langchain(grabacion["uso"]) if i == len(trozos) else None
+                yield ChatGenerationChunk(message=AIMessageChunk(content=trozo, usage_metadata=uso))
+            return
+
+        cronometro = _Cronometro()
+        trozos, uso = [], None
+        async for chunk in self.modelo.astream(messages, stop=stop, **kwargs):
+            cronometro.trozo()
+            trozos.append(chunk.content)
+            uso = uso_tokens(chunk) or uso
+            yield ChatGenerationChunk(message=chunk)
+        await asyncio.to_thread(self.casete.grabar, clave, self.nombre, trozos,
+                                cronometro.total(), cronometro.primer_trozo or 0.0, uso)
+
+
+class EmbeddingsCasete(Embeddings):
+    """Embeddings de consulta grabados (app_adm), para recuperar contexto sin llamar a la API."""
+
+    def __init__(self, modelo: Optional[Embeddings], nombre: str, casete: Casete):
+        self.modelo = modelo
+        self.nombre = nombre
+        self.casete = casete
+
+    def embed_query(self, text: str) -> List[float]:
+        clave = clave_canonica("embedding", self.nombre, text)
+        if self.casete.modo == REPRODUCIR:
+            vector = self.casete.leer_vector(clave)
+            if vector is None:
+                raise FaltaEnCasete(f"Embedding {clave[:12]} sin grabar: ejecútalo antes con LICIZEN_LLM_MODO=grabar")
+            return vector
+        vector = self.modelo.embed_query(text)
+        self.casete.grabar_vector(clave, self.nombre, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Solo se graban las consultas: los documentos se indexan una vez, fuera de las peticiones
+        if self.modelo is None:
+            raise FaltaEnCasete("Los embeddings de documentos no se graban: indexa con LICIZEN_LLM_MODO=directo")
+        return self.modelo.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.casete.modo == REPRODUCIR:
+            return await asyncio.to_thread(self.embed_query, text)
+        vector = await self.modelo.aembed_query(text)
+        await asyncio.to_thread(self.casete.grabar_vector, clave_canonica("embedding", self.nombre, text),
+                                self.nombre, vector)
+        return vector
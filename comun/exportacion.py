@@ -0,0 +1,370 @@
+# comun/exportacion.py
+"""
+Exportación de pliegos (técnicos y administrativos) a DOCX y PDF, con índice generado.
+
+- renderizar() convierte el pliego {objeto, indice, secciones[, pliego_final]} en el documento.
+  Es una función pura que se ejecuta en un pool de procesos (LICIZEN_EXPORTAR_PROCESOS), así que
+  un documento grande no bloquea el bucle de eventos ni compite por el GIL con las peticiones.
+- exportar() la envuelve con una caché por hash del contenido (LICIZEN_EXPORTAR_CACHE_MAX
+  documentos): descargar otra vez el mismo pliego no vuelve a renderizarlo, y dos descargas
+  iguales a la vez comparten el mismo render.
+- respuesta_descarga() lo devuelve en streaming, con ETag: si el cliente ya lo tiene, 304 sin renderizar.
+
+- respuesta_texto() da el pliego como texto plano, markdown o HTML, también sin llamar a Gemini:
+  no pasa por el pool ni por la caché, se genera y envía sección a sección (trozos_texto()).
+
+Si hay pliego_final (revisión del administrativo) se exporta ese texto; si no, las secciones.
+El texto de Gemini viene en markdown: se respetan títulos, listas y negritas.
+"""
+import asyncio
+import html
+import io
+import multiprocessing
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from .cache_resultados import CacheResultados, clave_canonica
+from .metricas import etapa
+
+VERSION_EXPORTACION = "2"  # Súbela si cambia el aspecto de los documentos: invalida la caché
+FORMATOS = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+FORMATOS_TEXTO = {
+    "texto": "text/plain; charset=utf-8",
+    "markdown": "text/markdown; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+}
+TROZO = 64 * 1024
+
+CACHE_EXPORTACIONES = CacheResultados(
+    max_entradas=int(os.getenv("LICIZEN_EXPORTAR_CACHE_MAX", "64")),
+    ttl=float(os.getenv("LICIZEN_EXPORTAR_CACHE_TTL", "3600")),
+)
+
+# Un pool por proceso. "spawn" y no fork: el proceso de la API ya tiene hilos (gRPC, to_thread)
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+
+
+def _pool() -> ProcessPoolExecutor:
+    pid = os.getpid()
+    if pid not in _POOLS:
+        _POOLS[pid] = ProcessPoolExecutor(
+            max_workers=int(os.getenv("LICIZEN_EXPORTAR_PROCESOS", "2")),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _POOLS[pid]
+
+
+def cerrar_exportacion() -> None:
+    """Para el pool de procesos del proceso actual (al apagar la API)."""
+    pool = _POOLS.pop(os.getpid(), None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ── Del pliego a bloques ──────────────────────────────────────────────────────
+_TITULO = re.compile(r"^(#{1,6})\s+(.*)")
+_VINETA = re.compile(r"^\s*[-*•]\s+(.*)")
+_NUMERADO = re.compile(r"^\s*\d+[.)]\s+(.*)")
+_NEGRITA = re.compile(r"\*\*(.+?)\*\*")
+
+
+def _markdown(texto: str, desplazamiento: int) -> List[Tuple[str, Any, str]]:
+    """Bloques (tipo, nivel, texto) de un texto en markdown sencillo; los títulos bajan `desplazamiento` niveles."""
+    bloques, parrafo = [], []
+
+    def cerrar_parrafo():
+        if parrafo:
+            bloques.append(("parrafo", None, " ".join(parrafo)))
+            parrafo.clear()
+
+    for linea in texto.splitlines():
+        linea = linea.rstrip()
+        if not linea.strip() or set(linea.strip()) <= set("-*_=|: "):  # Vacías, separadores y filas |---|
+            cerrar_parrafo()
+            continue
+        if m := _TITULO.match(linea):
+            cerrar_parrafo()
+            bloques.append(("titulo", min(3, len(m.group(1)) + desplazamiento), m.group(2).strip("*# ")))
+        elif m := _VINETA.match(linea):
+            cerrar_parrafo()
+            bloques.append(("vineta", None, m.group(1)))
+        elif m := _NUMERADO.match(linea):
+            cerrar_parrafo()
+            bloques.append(("numerado", None, m.group(1)))
+        elif linea.lstrip().startswith("|"):
+            cerrar_parrafo()
+            bloques.append(("parrafo", None, " · ".join(c.strip() for c in linea.strip("| ").split("|"))))
+        else:
+            parrafo.append(linea.strip())
+    cerrar_parrafo()
+    return bloques
+
+
+def _bloques_final(texto: str) -> List[Tuple[str, Any, str]]:
+    """Bloques del pliego revisado, con el título menos profundo en el nivel 1 (suele empezar por ##, ver unir_secciones)."""
+    minimo = min((len(m.group(1)) for m in map(_TITULO.match, texto.splitlines()) if m), default=1)
+    return _markdown(texto, 1 - minimo)
+
+
+def bloques_pliego(pliego: Dict[str, Any]) -> List[Tuple[str, Any, str]]:
+    if pliego.get("pliego_final"):
+        return _bloques_final(pliego["pliego_final"])
+    bloques = []
+    for titulo, contenido in pliego["secciones"].items():
+        bloques.append(("titulo", 1, titulo.strip()))
+        bloques += _markdown(contenido, 1)
+    return bloques
+
+
+def _segmentos(texto: str) -> List[Tuple[str, bool]]:
+    """(texto, negrita) según los **...** del markdown."""
+    partes = _NEGRITA.split(texto)
+    return [(parte, i % 2 == 1) for i, parte in enumerate(partes) if parte]
+
+
+# ── DOCX ──────────────────────────────────────────────────────────────────────
+def _campo_indice(parrafo, titulos: List[str]) -> None:
+    """Campo TOC de Word; hasta que se actualiza muestra los títulos de primer nivel."""
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    def fld(tipo):
+        elemento = OxmlElement("w:fldChar")
+        elemento.set(qn("w:fldCharType"), tipo)
+        return elemento
+
+    instruccion = OxmlElement("w:instrText")
+    instruccion.set(qn("xml:space"), "preserve")
+    instruccion.text = 'TOC \\o "1-2" \\h \\z \\u'
+    parrafo.add_run()._r.append(fld("begin"))
+    parrafo.add_run()._r.append(instruccion)
+    parrafo.add_run()._r.append(fld("separate"))
+    provisional = parrafo.add_run()
+    for i, titulo in enumerate(titulos):
+        if i:
+            provisional.add_break()
+        provisional.add_text(titulo)
+    parrafo.add_run()._r.append(fld("end"))
+
+
+def _docx(pliego: Dict[str, Any], bloques) -> bytes:
+    from docx import Document
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    documento = Document()
+    documento.add_heading(pliego["titulo"], level=0)
+    documento.add_paragraph(pliego["objeto"])
+    documento.add_paragraph().add_run("Índice").bold = True
+    _campo_indice(documento.add_paragraph(), [texto for tipo, nivel, texto in bloques if tipo == "titulo" and nivel == 1])
+    # Word recalcula el índice (con números de página) al abrir el documento
+    actualizar = OxmlElement("w:updateFields")
+    actualizar.set(qn("w:val"), "true")
+    documento.settings.element.append(actualizar)
+    documento.add_page_break()
+
+    estilos = {"vineta": "List Bullet", "numerado": "List Number"}
+    for tipo, nivel, texto in bloques:
+        if tipo == "titulo":
+            documento.add_heading(texto, level=nivel)
+            continue
+        parrafo = documento.add_paragraph(style=estilos.get(tipo))
+        for trozo, negrita in _segmentos(texto):
+            parrafo.add_run(trozo).bold = negrita
+
+    salida = io.BytesIO()
+    documento.save(salida)
+    return salida.getvalue()
+
+
+# ── PDF ───────────────────────────────────────────────────────────────────────
+def _pdf(pliego: Dict[str, Any], bloques) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import BaseDocTemplate, Frame, PageBreak, PageTemplate, Paragraph, Spacer
+    from reportlab.platypus.tableofcontents import TableOfContents
+
+    estilos = getSampleStyleSheet()
+    por_nivel = {
+        1: ParagraphStyle("T1", parent=estilos["Heading1"]),
+        2: ParagraphStyle("T2", parent=estilos["Heading2"]),
+        3: ParagraphStyle("T3", parent=estilos["Heading3"]),
+    }
+    cuerpo = ParagraphStyle("Cuerpo", parent=estilos["BodyText"], leading=14, spaceAfter=6)
+    lista = ParagraphStyle("Lista", parent=cuerpo, leftIndent=18, bulletIndent=6, spaceAfter=2)
+
+    class Documento(BaseDocTemplate):
+        def __init__(self, destino):
+            super().__init__(destino, pagesize=A4, leftMargin=2.5 * cm, rightMargin=2.5 * cm,
+                             topMargin=2.5 * cm, bottomMargin=2.5 * cm, title=pliego["titulo"])
+            marco = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id="cuerpo")
+            self.addPageTemplates([PageTemplate(id="pagina", frames=[marco], onPage=self.pie)])
+
+        @staticmethod
+        def pie(lienzo, documento):
+            lienzo.setFont("Helvetica", 8)
+            lienzo.drawRightString(A4[0] - 2.5 * cm, 1.5 * cm, str(documento.page))
+
+        def beforeDocument(self):
+            self.nivel_anterior = -1  # multiBuild maqueta varias veces: el esquema empieza de cero en cada pasada
+
+        def afterFlowable(self, flowable):
+            # Cada título de nivel 1-2 va al índice (con su página) y a los marcadores del PDF.
+            # El esquema del PDF no admite saltos de nivel (un 2 sin un 1 delante): se baja al anterior + 1
+            clave = getattr(flowable, "clave_indice", None)
+            if clave is not None:
+                nivel = min(flowable.nivel_indice - 1, self.nivel_anterior + 1)
+                self.nivel_anterior = nivel
+                self.canv.bookmarkPage(clave)
+                self.canv.addOutlineEntry(flowable.getPlainText(), clave, level=nivel)
+                self.notify("TOCEntry", (nivel, flowable.getPlainText(), self.page, clave))
+
+    indice = TableOfContents()
+    indice.levelStyles = [ParagraphStyle("I1", parent=cuerpo, fontSize=10, leftIndent=0),
+                          ParagraphStyle("I2", parent=cuerpo, fontSize=9, leftIndent=14)]
+    historia = [Paragraph(escape(pliego["titulo"]), estilos["Title"]),
+                Paragraph(escape(pliego["objeto"]), estilos["Heading3"]), Spacer(1, 12),
+                Paragraph("Índice", por_nivel[1]), indice, PageBreak()]
+
+    numero = 0
+    for i, (tipo, nivel, texto) in enumerate(bloques):
+        marcado = "".join(f"<b>{escape(t)}</b>" if negrita else escape(t) for t, negrita in _segmentos(texto))
+        if tipo == "titulo":
+            parrafo = Paragraph(marcado, por_nivel[nivel])
+            if nivel <= 2:
+                parrafo.clave_indice, parrafo.nivel_indice = f"t{i}", nivel
+        elif tipo == "vineta":
+            parrafo = Paragraph(marcado, lista, bulletText="•")
+        elif tipo == "numerado":
+            numero += 1
+            parrafo = Paragraph(marcado, lista, bulletText=f"{numero}.")
+        else:
+            parrafo = Paragraph(marcado, cuerpo)
+        if tipo != "numerado":
+            numero = 0
+        historia.append(parrafo)
+
+    salida = io.BytesIO()
+    Documento(salida).multiBuild(historia)  # Dos pasadas: la segunda ya conoce las páginas del índice
+    return salida.getvalue()
+
+
+def renderizar(pliego: Dict[str, Any], formato: str) -> bytes:
+    """Documento `formato` (docx o pdf) del pliego. Se ejecuta en el pool de procesos."""
+    bloques = bloques_pliego(pliego)
+    return _docx(pliego, bloques) if formato == "docx" else _pdf(pliego, bloques)
+
+
+# ── Texto, markdown y HTML ────────────────────────────────────────────────────
+def _html_bloques(bloques) -> str:
+    """HTML de una lista de bloques; las viñetas y los numerados seguidos van en una misma lista."""
+    partes, lista = [], None
+    for tipo, nivel, texto in bloques:
+        etiqueta = {"vineta": "ul", "numerado": "ol"}.get(tipo)
+        if etiqueta != lista:
+            if lista:
+                partes.append(f"</{lista}>")
+            if etiqueta:
+                partes.append(f"<{etiqueta}>")
+            lista = etiqueta
+        marcado = "".join(f"<strong>{html.escape(t)}</strong>" if negrita else html.escape(t) for t, negrita in _segmentos(texto))
+        if tipo == "titulo":
+            partes.append(f"<h{nivel + 1}>{marcado}</h{nivel + 1}>")
+        elif etiqueta:
+            partes.append(f"<li>{marcado}</li>")
+        else:
+            partes.append(f"<p>{marcado}</p>")
+    if lista:
+        partes.append(f"</{lista}>")
+    return "\n".join(partes) + "\n"
+
+
+def trozos_texto(pliego: Dict[str, Any], formato: str) -> Iterator[str]:
+    """El pliego en `formato` (texto, markdown o html): primero la cabecera con el índice y después una sección por trozo."""
+    titulo, objeto, indice = pliego["titulo"], pliego["objeto"], pliego["indice"]
+    final = pliego.get("pliego_final")
+    if formato == "texto":
+        yield f"{titulo.upper()} PARA: {objeto}\n\nÍNDICE:\n" + "".join(f"- {item}\n" for item in indice) + "\n"
+        if final:
+            yield final.strip() + "\n"
+        for seccion, contenido in ({} if final else pliego["secciones"]).items():
+            yield f"{seccion.strip().upper()}\n{contenido.strip()}\n\n"
+    elif formato == "markdown":
+        yield f"# {titulo}\n\n**Objeto:** {objeto}\n\n## Índice\n\n" + "".join(f"- {item}\n" for item in indice) + "\n"
+        if final:
+            yield final.strip() + "\n"
+        for seccion, contenido in ({} if final else pliego["secciones"]).items():
+            yield f"## {seccion.strip()}\n\n{contenido.strip()}\n\n"
+    else:
+        yield (
+            f'<!DOCTYPE html>\n<html lang="es">\n<head>\n<meta charset="utf-8">\n<title>{html.escape(titulo)}</title>\n</head>\n'
+            f"<body>\n<h1>{html.escape(titulo)}</h1>\n<p><strong>Objeto:</strong> {html.escape(objeto)}</p>\n"
+            "<nav>\n<h2>Índice</h2>\n<ul>\n" + "".join(f"<li>{html.escape(item)}</li>\n" for item in indice) + "</ul>\n</nav>\n"
+        )
+        if final:
+            yield f"<main>\n{_html_bloques(_bloques_final(final))}</main>\n"
+        for seccion, contenido in ({} if final else pliego["secciones"]).items():
+            yield f"<section>\n{_html_bloques([('titulo', 1, seccion.strip())] + _markdown(contenido, 1))}</section>\n"
+        yield "</body>\n</html>\n"
+
+
+def respuesta_texto(pliego: Dict[str, Any], formato: str) -> StreamingResponse:
+    """El pliego como texto, markdown o HTML, en streaming sección a sección."""
+    return StreamingResponse(trozos_texto(pliego, formato), media_type=FORMATOS_TEXTO[formato])
+
+
+# ── Caché y respuesta HTTP ────────────────────────────────────────────────────
+def pliego_exportable(titulo: str, resultado: Dict[str, Any]) -> Dict[str, Any]:
+    """Solo los campos que salen en el documento (sin id de borrador, estado...), para que la huella dependa del contenido."""
+    pliego = {"titulo": titulo, "objeto": resultado["objeto"], "indice": resultado["indice"], "secciones": resultado["secciones"]}
+    if resultado.get("pliego_final"):
+        pliego["pliego_final"] = resultado["pliego_final"]
+    return pliego
+
+
+def huella_exportacion(pliego: Dict[str, Any], formato: str) -> str:
+    return clave_canonica("exportacion", VERSION_EXPORTACION, formato, pliego)
+
+
+async def exportar(pliego: Dict[str, Any], formato: str) -> Tuple[bytes, str]:
+    """Devuelve (documento, estado de la caché). Solo renderiza si no está en caché ni renderizándose ya."""
+
+    async def generar():
+        with etapa("exportacion", formato=formato):
+            return await asyncio.get_running_loop().run_in_executor(_pool(), renderizar, pliego, formato)
+
+    return await CACHE_EXPORTACIONES.obtener_o_generar(huella_exportacion(pliego, formato), generar)
+
+
+def nombre_fichero(texto: str, formato: str) -> str:
+    ascii_ = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return (re.sub(r"[^A-Za-z0-9]+", "_", ascii_).strip("_")[:60] or "pliego") + f".{formato}"
+
+
+def _trozos(documento: bytes) -> Iterator[bytes]:
+    vista = memoryview(documento)
+    for inicio in range(0, len(documento), TROZO):
+        yield bytes(vista[inicio:inicio + TROZO])
+
+
+async def respuesta_descarga(pliego: Dict[str, Any], formato: str, si_coincide: Optional[str]) -> Response:
+    """Descarga del pliego en `formato`: 304 si el ETag del cliente coincide, si no el documento en streaming."""
+    etag = f'"{huella_exportacion(pliego, formato)[:32]}"'
+    if si_coincide == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    documento, estado = await exportar(pliego, formato)
+    return StreamingResponse(_trozos(documento), media_type=FORMATOS[formato], headers={
+        "ETag": etag, "X-Cache": estado, "Content-Length": str(len(documento)),
+        "Content-Disposition": f'attachment; filename="{nombre_fichero(pliego["objeto"], formato)}"',
+    })
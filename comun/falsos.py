@@ -0,0 +1,165 @@
+# comun/falsos.py
+"""
+Modelos falsos de Gemini y de Qdrant para probar la pasarela (comun.pasarela_llm) y los benchmarks sin red.
+
+Simulan una cuota por ventana de tiempo: si se supera, responden con ErrorCuota (código 429),
+como hace la API real cuando se pasan las peticiones por minuto. La latencia puede ser fija o
+una distribución (Latencia) y se puede pedir una tasa de errores transitorios (503).
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Any, List, Optional, Union
+
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+
+class ErrorCuota(Exception):
+    """Equivalente local de google.api_core.exceptions.ResourceExhausted."""
+    code = 429
+
+
+class ErrorServicio(Exception):
+    """Equivalente local de google.api_core.exceptions.ServiceUnavailable."""
+    code = 503
+
+
+class Latencia:
+    """
+    Latencia log-normal: la mitad de las llamadas tardan menos de `mediana` segundos y `dispersion`
+    (sigma del logaritmo) alarga la cola; con dispersion=0 es fija. Se lee de texto como "mediana[:dispersion]".
+    """
+
+    def __init__(self, mediana: float, dispersion: float = 0.0, semilla: Optional[int] = None):
+        self.mediana = mediana
+        self.dispersion = dispersion
+        self._azar = random.Random(semilla)
+
+    @classmethod
+    def desde_texto(cls, texto: str) -> "Latencia":
+        mediana, _, dispersion = texto.partition(":")
+        return cls(float(mediana), float(dispersion or 0))
+
+    def muestra(self) -> float:
+        if self.dispersion <= 0:
+            return self.mediana
+        return self.mediana * math.exp(self._azar.gauss(0, self.dispersion))
+
+    def __repr__(self) -> str:
+        return f"{self.mediana:g}:{self.dispersion:g}"
+
+
+def _segundos(latencia: Union[float, Latencia]) -> float:
+    return latencia.muestra() if isinstance(latencia, Latencia) else latencia
+
+
+def _fallar(tasa_error: float) -> None:
+    if tasa_error and random.random() < tasa_error:
+        raise ErrorServicio("503 The model is overloaded. Please try again later.")
+
+
+class CuotaFalsa:
+    """Ventana deslizante: como mucho `peticiones` llamadas cada `ventana` segundos."""
+
+    def __init__(self, peticiones: int, ventana: float = 60.0):
+        self.peticiones = peticiones
+        self.ventana = ventana
+        self._instantes = deque()
+        self.rechazadas = 0
+        self.aceptadas = 0
+
+    def comprobar(self) -> None:
+        ahora = time.monotonic()
+        while self._instantes and ahora - self._instantes[0] >= self.ventana:
+            self._instantes.popleft()
+        if len(self._instantes) >= self.peticiones:
+            self.rechazadas += 1
+            raise ErrorCuota("429 Resource has been exhausted (e.g. check quota).")
+        self._instantes.append(ahora)
+        self.aceptadas += 1
+
+
+class _Respuesta:
+    def __init__(self, texto: str):
+        self.text = texto
+
+
+class _Stream:
+    def __init__(self, texto: str, latencia: float):
+        self._texto = texto
+        self._latencia = latencia  # Ya muestreada: se reparte entre los trozos
+
+    async def __aiter__(self):
+        for palabra in self._texto.split():
+            await asyncio.sleep(self._latencia / 10)
+            yield _Respuesta(palabra + " ")
+
+
+class ModeloFalso:
+    """Imita genai.GenerativeModel.generate_content_async (app_tec)."""
+
+    def __init__(self, texto: str = "Texto de sección generado.", latencia: Union[float, Latencia] = 0.05,
+                 cuota: Optional[CuotaFalsa] = None, tasa_error: float = 0.0):
+        self.texto = texto
+        self.latencia = latencia
+        self.cuota = cuota
+        self.tasa_error = tasa_error
+        self.llamadas = 0
+
+    async def generate_content_async(self, prompt, stream: bool = False, **_):
+        self.llamadas += 1
+        if self.cuota is not None:
+            self.cuota.comprobar()
+        _fallar(self.tasa_error)
+        if stream:
+            return _Stream(self.texto, _segundos(self.latencia))
+        await asyncio.sleep(_segundos(self.latencia))
+        return _Respuesta(self.texto)
+
+
+class ChatFalso(FakeListChatModel):
+    """Imita ChatGoogleGenerativeAI (app_adm): FakeListChatModel con latencia, cuota y errores."""
+
+    latencia: Any = 0.05  # float o Latencia
+    cuota: Optional[CuotaFalsa] = None
+    tasa_error: float = 0.0
+
+    async def _comprobar(self) -> None:
+        if self.cuota is not None:
+            self.cuota.comprobar()
+        _fallar(self.tasa_error)
+        await asyncio.sleep(_segundos(self.latencia))
+
+    async def _agenerate(self, *args, **kwargs):
+        await self._comprobar()
+        return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        await self._comprobar()
+        async for trozo in super()._astream(*args, **kwargs):
+            yield trozo
+
+
+class AlmacenFalso:
+    """
+    Imita una colección de langchain_qdrant (asimilarity_search_with_score_by_vector) con latencia y
+    errores. Devuelve `k` documentos al azar con el resumen ya precalculado en el payload, como tras
+    el job de precalculo_adm, así que contexto_para no llama a Gemini para resumir.
+    """
+
+    def __init__(self, documentos: List[Document], latencia: Union[float, Latencia] = 0.01,
+                 tasa_error: float = 0.0):
+        self.documentos = documentos
+        self.latencia = latencia
+        self.tasa_error = tasa_error
+        self.busquedas = 0
+
+    async def asimilarity_search_with_score_by_vector(self, vector, k: int = 4, filter=None, **_):
+        self.busquedas += 1
+        await asyncio.sleep(_segundos(self.latencia))
+        _fallar(self.tasa_error)
+        elegidos = random.sample(self.documentos, min(k, len(self.documentos)))
+        return sorted(((doc, random.random()) for doc in elegidos), key=lambda hit: hit[1], reverse=True)
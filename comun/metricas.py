@@ -0,0 +1,245 @@
+# comun/metricas.py
+"""
+Instrumentación de las dos APIs: tiempos por etapa, tokens por llamada y métricas Prometheus.
+
+- etapa(nombre, seccion=..., coleccion=...) mide un bloque (async o no) y lo anota en el
+  histograma licizen_etapa_segundos y en el desglose de la petición HTTP en curso.
+- registrar_tokens() lo llama la pasarela de Gemini con los tokens de entrada y salida de cada
+  llamada; se atribuyen a la etapa en curso (p. ej. la sección que se está redactando).
+- MiddlewareMetricas mide cada petición y escribe una línea JSON por petición con el desglose
+  por etapas (logger "licizen.peticiones"; se desactiva con LICIZEN_LOG_PETICIONES=0).
+- exponer() devuelve el texto de /metrics en formato Prometheus; `router` lo publica y lo incluye
+  cada app (una sola vez también en la app unificada).
+
+Las métricas son por proceso: con varios workers, Prometheus debe raspar cada uno.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+log_peticiones = logging.getLogger("licizen.peticiones")
+
+CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120)
+
+# Desglose de la petición HTTP en curso: etapa -> [segundos acumulados, nº de veces]
+_DESGLOSE: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar("desglose", default=None)
+# Etiquetas de la etapa en curso, para atribuirle los tokens de las llamadas a Gemini
+_ETAPA: contextvars.ContextVar[Tuple[Tuple[str, str], ...]] = contextvars.ContextVar("etapa", default=())
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(pares: Iterable[Tuple[str, str]]) -> str:
+    pares = list(pares)
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}" if pares else ""
+
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, cubetas: Tuple[float, ...] = CUBETAS):
+        self.nombre, self.ayuda, self.cubetas = nombre, ayuda, cubetas
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}  # cuenta por cubeta (incluida +Inf) y, al final, la suma
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **etiquetas: str) -> None:
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._series.setdefault(clave, [0.0] * (len(self.cubetas) + 2))
+            serie[bisect.bisect_left(self.cubetas, valor)] += 1
+            serie[-1] += valor
+
+    def totales(self) -> Dict[Tuple[Tuple[str, str], ...], Tuple[float, float]]:
+        """(nº de observaciones, suma) por serie, p. ej. para comparar antes y después de una carga."""
+        with self._lock:
+            return {clave: (sum(serie[:-1]), serie[-1]) for clave, serie in self._series.items()}
+
+    def exponer(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {clave: list(serie) for clave, serie in self._series.items()}
+        for clave, serie in sorted(series.items()):
+            acumulado = 0.0
+            for limite, cuenta in zip(self.cubetas + (float("inf"),), serie):
+                acumulado += cuenta
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(clave + (('le', le),))} {acumulado:g}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(clave)} {serie[-1]:.6f}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(clave)} {acumulado:g}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre, self.ayuda = nombre, ayuda
+        self._series: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, valor: float = 1, **etiquetas: str) -> None:
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def suma(self, **filtro: str) -> float:
+        """Total de las series cuyas etiquetas incluyen `filtro` (todas si no se da)."""
+        with self._lock:
+            return sum(valor for clave, valor in self._series.items() if filtro.items() <= dict(clave).items())
+
+    def exponer(self) -> List[str]:
+        with self._lock:
+            series = dict(self._series)
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"] + [
+            f"{self.nombre}{_etiquetas(clave)} {valor:g}" for clave, valor in sorted(series.items())
+        ]
+
+
+ETAPAS = Histograma("licizen_etapa_segundos", "Duración de cada etapa de la generación (embedding, búsqueda, resumen, sección, revisión...)")
+PETICIONES = Histograma("licizen_peticion_segundos", "Duración de las peticiones HTTP")
+TOKENS = Contador("licizen_tokens_total", "Tokens de entrada y salida de las llamadas a Gemini, por etapa y sección")
+LLAMADAS = Contador("licizen_llamadas_llm_total", "Llamadas a Gemini por etapa y sección")
+
+# Funciones que devuelven líneas extra (gauges de la pasarela, cachés, colas...) al exponer
+_COLECTORES: List[Callable[[], List[str]]] = []
+
+
+def registrar_colector(colector: Callable[[], List[str]]) -> None:
+    _COLECTORES.append(colector)
+
+
+def serie(nombre: str, ayuda: str, valores: Iterable[Tuple[Dict[str, str], float]], tipo: str = "gauge") -> List[str]:
+    """Líneas de una métrica calculada en el momento (gauge o counter), para los colectores."""
+    return [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"] + [
+        f"{nombre}{_etiquetas(sorted(etiquetas.items()))} {valor:g}" for etiquetas, valor in valores
+    ]
+
+
+def registrar_servicio(servicio: str, cache, cola) -> None:
+    """Expone los aciertos/fallos de la caché de pliegos y la ocupación de la cola de trabajos de un servicio."""
+    def colector() -> List[str]:
+        etiquetas = {"servicio": servicio}
+        return (
+            serie("licizen_cache_aciertos_total", "Aciertos de la caché de pliegos", [(etiquetas, cache.aciertos)], "counter")
+            + serie("licizen_cache_fallos_total", "Fallos de la caché de pliegos", [(etiquetas, cache.fallos)], "counter")
+            + serie("licizen_cola_profundidad", "Trabajos esperando en la cola", [(etiquetas, cola.profundidad())])
+            + serie("licizen_cola_en_curso", "Trabajos ejecutándose", [(etiquetas, cola.en_curso())])
+        )
+    registrar_colector(colector)
+
+
+def exponer() -> str:
+    lineas: List[str] = []
+    for metrica in (ETAPAS, PETICIONES, TOKENS, LLAMADAS):
+        lineas += metrica.exponer()
+    for colector in _COLECTORES:
+        lineas += colector()
+    return "\n".join(lineas) + "\n"
+
+
+def anotar(nombre: str, duracion: float, **etiquetas: str) -> None:
+    """Anota la duración de una etapa medida a mano (p. ej. en generadores, donde no se usa etapa())."""
+    ETAPAS.observar(duracion, etapa=nombre, **etiquetas)
+    desglose = _DESGLOSE.get()
+    if desglose is not None:
+        clave = nombre if not etiquetas else f"{nombre}:{'/'.join(etiquetas.values())}"
+        acumulado = desglose.setdefault(clave, [0.0, 0])
+        acumulado[0] += duracion
+        acumulado[1] += 1
+
+
+@contextmanager
+def etapa(nombre: str, **etiquetas: str):
+    """
+    Mide el bloque como la etapa `nombre`; vale dentro de código async. No debe envolver un
+    `yield` de un generador: la etapa en curso es una contextvar y quedaría fuera de su contexto.
+    """
+    token = _ETAPA.set(tuple(sorted({"etapa": nombre, **etiquetas}.items())))
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _ETAPA.reset(token)
+        anotar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+
+def registrar_tokens(modelo: str, entrada: int, salida: int, etiquetas: Optional[Dict[str, str]] = None) -> None:
+    """Tokens de una llamada a Gemini, atribuidos a `etiquetas` o, si no se dan, a la etapa en curso."""
+    etiquetas = etiquetas or dict(_ETAPA.get()) or {"etapa": "otra"}
+    LLAMADAS.sumar(1, modelo=modelo, **etiquetas)
+    TOKENS.sumar(entrada, modelo=modelo, tipo="entrada", **etiquetas)
+    TOKENS.sumar(salida, modelo=modelo, tipo="salida", **etiquetas)
+    desglose = _DESGLOSE.get()
+    if desglose is not None:
+        for tipo, valor in (("tokens_entrada", entrada), ("tokens_salida", salida)):
+            acumulado = desglose.setdefault(tipo, [0, 0])
+            acumulado[0] += valor
+            acumulado[1] += 1
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metricas_prometheus():
+    """Métricas Prometheus del proceso: tiempos por etapa, tokens por sección, pasarela de Gemini, caché y cola."""
+    return PlainTextResponse(exponer(), media_type="text/plain; version=0.0.4")
+
+
+class RespuestaJSONMedida(JSONResponse):
+    """JSONResponse que mide la serialización de la respuesta como la etapa "serializacion"."""
+
+    def render(self, content) -> bytes:
+        with etapa("serializacion"):
+            return super().render(content)
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: duración de cada petición y una línea JSON por petición con su desglose por etapas."""
+
+    def __init__(self, app, servicio: str):
+        self.app = app
+        self.servicio = servicio
+        self.log = os.getenv("LICIZEN_LOG_PETICIONES", "1") != "0"
+        if self.log and not log_peticiones.handlers:
+            manejador = logging.StreamHandler()
+            manejador.setFormatter(logging.Formatter("%(message)s"))
+            log_peticiones.addHandler(manejador)
+            log_peticiones.setLevel(logging.INFO)
+            log_peticiones.propagate = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        desglose: Dict[str, List[float]] = {}
+        token = _DESGLOSE.set(desglose)
+        estado = {"codigo": 500}
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _DESGLOSE.reset(token)
+            duracion = time.perf_counter() - inicio
+            ruta = scope.get("route").path if scope.get("route") is not None else scope["path"]
+            PETICIONES.observar(duracion, servicio=self.servicio, metodo=scope["method"], ruta=ruta,
+                                estado=str(estado["codigo"]))
+            if self.log:
+                log_peticiones.info(json.dumps({
+                    "servicio": self.servicio, "metodo": scope["method"], "ruta": ruta,
+                    "estado": estado["codigo"], "duracion_s": round(duracion, 4),
+                    "etapas": {k: {"total": round(v[0], 4), "n": v[1]} for k, v in sorted(desglose.items())},
+                }, ensure_ascii=False))
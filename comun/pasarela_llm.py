@@ -0,0 +1,362 @@
+# comun/pasarela_llm.py
+"""
+Pasarela única para las llamadas a Gemini de app_tec y app_adm.
+
+Cada modelo tiene su pasarela (una por proceso), que aplica:
+
+- Límite de peticiones y de tokens por minuto (cubetas de tokens; LICIZEN_LLM_RPM, LICIZEN_LLM_TPM,
+  0 = sin límite; LICIZEN_LLM_RAFAGA = segundos de cuota que se pueden gastar de golpe).
+- Concurrencia adaptativa AIMD: se empieza en LICIZEN_LLM_CONCURRENCIA llamadas simultáneas, se
+  suma poco a poco con cada éxito y se reduce a la mitad cuando Gemini responde 429/503.
+- Reintentos con backoff exponencial y jitter (tenacity) para los errores transitorios
+  (LICIZEN_LLM_REINTENTOS).
+- Plazo por petición: si la petición HTTP tiene un plazo (MiddlewarePlazo, LICIZEN_PLAZO_PETICION),
+  no se reintenta ni se espera más allá de él.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from . import metricas
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Instante (time.monotonic) en que vence la petición en curso; None si no tiene plazo
+_PLAZO: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("plazo_llm", default=None)
+
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+CODIGOS_SATURACION = {429, 503}  # Gemini está al límite: hay que bajar la concurrencia
+NOMBRES_REINTENTABLES = {
+    "ResourceExhausted": 429, "TooManyRequests": 429, "ServiceUnavailable": 503,
+    "InternalServerError": 500, "BadGateway": 502, "GatewayTimeout": 504, "DeadlineExceeded": 504,
+    "TimeoutError": 504,  # Timeout del cliente o de la red (PlazoAgotado, el de la petición, no se reintenta)
+}
+
+
+class PlazoAgotado(TimeoutError):
+    """La petición ha superado su plazo antes de obtener respuesta de Gemini."""
+
+
+@contextmanager
+def plazo(segundos: Optional[float]):
+    """Fija el plazo de todo lo que se ejecute dentro (incluidas las tareas que se creen desde aquí)."""
+    token = _PLAZO.set(time.monotonic() + segundos if segundos else None)
+    try:
+        yield
+    finally:
+        _PLAZO.reset(token)
+
+
+def plazo_restante() -> Optional[float]:
+    vence = _PLAZO.get()
+    return None if vence is None else vence - time.monotonic()
+
+
+class MiddlewarePlazo:
+    """Middleware ASGI que da a cada petición HTTP el plazo LICIZEN_PLAZO_PETICION (segundos, 0 = sin plazo)."""
+
+    def __init__(self, app, segundos: Optional[float] = None):
+        self.app = app
+        self.segundos = segundos if segundos is not None else float(os.getenv("LICIZEN_PLAZO_PETICION") or 0)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.segundos:
+            return await self.app(scope, receive, send)
+        with plazo(self.segundos):
+            await self.app(scope, receive, send)
+
+
+def codigo_error(error: BaseException) -> Optional[int]:
+    """Código HTTP de un error de Gemini (google.api_core, langchain o el falso de comun.falsos), si lo tiene."""
+    while error is not None:
+        codigo = getattr(error, "code", None)
+        if isinstance(codigo, int):
+            return codigo
+        if type(error).__name__ in NOMBRES_REINTENTABLES:
+            return NOMBRES_REINTENTABLES[type(error).__name__]
+        error = error.__cause__
+    return None
+
+
+def es_reintentable(error: BaseException) -> bool:
+    return codigo_error(error) in CODIGOS_REINTENTABLES
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación barata (≈ 4 caracteres por token) para la cubeta de tokens por minuto."""
+    return max(1, len(texto) // 4)
+
+
+def uso_tokens(respuesta: Any) -> Optional[Tuple[int, int]]:
+    """(entrada, salida) según la respuesta: AIMessage de langchain o respuesta de google.generativeai."""
+    uso = getattr(respuesta, "usage_metadata", None)
+    if isinstance(uso, dict):
+        return (uso.get("input_tokens", 0), uso.get("output_tokens", 0)) if uso else None
+    if getattr(uso, "prompt_token_count", None) is not None:
+        return uso.prompt_token_count, uso.candidates_token_count
+    return None
+
+
+def _texto(respuesta: Any) -> str:
+    if isinstance(respuesta, str):
+        return respuesta
+    try:
+        return str(getattr(respuesta, "content", None) or getattr(respuesta, "text", "") or "")
+    except Exception:  # .text de google.generativeai falla si la respuesta no tiene candidatos
+        return ""
+
+
+class CubetaTokens:
+    """
+    Cubeta de tokens que se rellena a `por_minuto` / 60 por segundo y admite ráfagas de hasta
+    `rafaga` segundos de cuota (por defecto un minuto entero, como cuenta Gemini). reservar() descuenta siempre (el saldo puede quedar negativo) y devuelve cuánto hay que
+    esperar: así las reservas se atienden en orden de llegada sin bucles de sondeo.
+    """
+
+    def __init__(self, por_minuto: float, rafaga: float = 60.0):
+        self.ritmo = por_minuto / 60
+        self.capacidad = max(1.0, self.ritmo * rafaga)
+        self.saldo = self.capacidad
+        self._ultimo = time.monotonic()
+
+    def reservar(self, cantidad: float) -> float:
+        ahora = time.monotonic()
+        self.saldo = min(self.capacidad, self.saldo + (ahora - self._ultimo) * self.ritmo)
+        self._ultimo = ahora
+        self.saldo -= min(cantidad, self.capacidad)
+        return 0.0 if self.saldo >= 0 else -self.saldo / self.ritmo
+
+    def ajustar(self, cantidad: float) -> None:
+        """Corrige una reserva con el consumo real (positivo si se gastó más de lo estimado)."""
+        self.saldo -= cantidad
+
+
+class PasarelaLLM:
+    """Límite de ritmo, concurrencia adaptativa y reintentos para un modelo. Ver el docstring del módulo."""
+
+    def __init__(self, nombre: str, rpm: float = 0, tpm: float = 0, concurrencia: int = 8,
+                 concurrencia_min: int = 1, reintentos: int = 5, espera_base: float = 1.0,
+                 espera_max: float = 30.0, rafaga: float = 60.0):
+        self.nombre = nombre
+        self._peticiones = CubetaTokens(rpm, rafaga) if rpm else None
+        self._tokens = CubetaTokens(tpm, rafaga) if tpm else None
+        self.concurrencia_max = max(1, concurrencia)
+        self.concurrencia_min = max(1, min(concurrencia_min, self.concurrencia_max))
+        self.limite = float(self.concurrencia_max)
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.en_vuelo = 0
+        self._ultima_reduccion = 0.0
+        self._condicion: Optional[asyncio.Condition] = None
+        self._bucle = None
+        self.contadores = {"llamadas": 0, "reintentos": 0, "saturaciones": 0, "errores": 0, "espera_cuota": 0.0}
+
+    @classmethod
+    def desde_entorno(cls, nombre: str) -> "PasarelaLLM":
+        return cls(
+            nombre,
+            rpm=float(os.getenv("LICIZEN_LLM_RPM", "0")),
+            tpm=float(os.getenv("LICIZEN_LLM_TPM", "0")),
+            concurrencia=int(os.getenv("LICIZEN_LLM_CONCURRENCIA", "8")),
+            reintentos=int(os.getenv("LICIZEN_LLM_REINTENTOS", "5")),
+            espera_base=float(os.getenv("LICIZEN_LLM_ESPERA_BASE", "1")),
+            espera_max=float(os.getenv("LICIZEN_LLM_ESPERA_MAX", "30")),
+            rafaga=float(os.getenv("LICIZEN_LLM_RAFAGA", "60")),
+        )
+
+    # ── Concurrencia adaptativa ──────────────────────────────────────────────
+    def _cond(self) -> asyncio.Condition:
+        # La condición pertenece a un bucle de eventos: si cambia (tests, scripts) se crea otra
+        bucle = asyncio.get_running_loop()
+        if self._bucle is not bucle:
+            self._condicion, self._bucle, self.en_vuelo = asyncio.Condition(), bucle, 0
+        return self._condicion
+
+    @asynccontextmanager
+    async def _hueco(self):
+        condicion = self._cond()
+        async with condicion:
+            await condicion.wait_for(lambda: self.en_vuelo < int(self.limite))
+            self.en_vuelo += 1
+        try:
+            yield
+        finally:
+            async with condicion:
+                self.en_vuelo -= 1
+                condicion.notify_all()
+
+    def _exito(self) -> None:
+        anterior = int(self.limite)
+        self.limite = min(self.concurrencia_max, self.limite + 1 / self.limite)  # +1 por cada "ventana" de éxitos
+        if int(self.limite) > anterior and self._condicion is not None:
+            asyncio.ensure_future(self._avisar())
+
+    async def _avisar(self) -> None:
+        async with self._condicion:
+            self._condicion.notify_all()
+
+    def _saturacion(self) -> None:
+        self.contadores["saturaciones"] += 1
+        ahora = time.monotonic()
+        if ahora - self._ultima_reduccion < 1.0:
+            return  # Los 429 de una misma ráfaga cuentan como una sola señal
+        self._ultima_reduccion = ahora
+        self.limite = max(self.concurrencia_min, self.limite / 2)
+        log.warning("Gemini saturado (%s): concurrencia reducida a %d", self.nombre, int(self.limite))
+
+    # ── Ritmo (RPM / TPM) y plazo ────────────────────────────────────────────
+    async def _esperar_cuota(self, tokens: int) -> None:
+        espera = 0.0
+        if self._peticiones is not None:
+            espera = max(espera, self._peticiones.reservar(1))
+        if self._tokens is not None and tokens:
+            espera = max(espera, self._tokens.reservar(tokens))
+        if espera:
+            restante = plazo_restante()
+            if restante is not None and restante < espera:
+                raise PlazoAgotado(f"Sin cuota de {self.nombre} antes del plazo de la petición")
+            self.contadores["espera_cuota"] += espera
+            await asyncio.sleep(espera)
+
+    def _comprobar_plazo(self) -> Optional[float]:
+        restante = plazo_restante()
+        if restante is not None and restante <= 0:
+            raise PlazoAgotado(f"Plazo de la petición agotado esperando a {self.nombre}")
+        return restante
+
+    def _reintentos(self, reintentable: Callable[[BaseException], bool]) -> AsyncRetrying:
+        def parar_por_plazo(estado) -> bool:
+            restante = plazo_restante()
+            return restante is not None and restante <= (estado.upcoming_sleep or 0)
+
+        def antes_de_esperar(estado) -> None:
+            self.contadores["reintentos"] += 1
+            log.info("Reintentando %s (intento %d) en %.1f s: %s", self.nombre, estado.attempt_number,
+                     estado.upcoming_sleep, estado.outcome.exception())
+
+        return AsyncRetrying(
+            stop=stop_after_attempt(self.reintentos + 1) | parar_por_plazo,
+            wait=wait_random_exponential(multiplier=self.espera_base, max=self.espera_max),
+            retry=retry_if_exception(reintentable),
+            before_sleep=antes_de_esperar,
+            reraise=True,
+        )
+
+    def _registrar_error(self, error: BaseException) -> None:
+        if codigo_error(error) in CODIGOS_SATURACION:
+            self._saturacion()
+        self.contadores["errores"] += 1
+
+    # ── API pública ──────────────────────────────────────────────────────────
+    async def llamar(self, funcion: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        Ejecuta `funcion()` (una llamada a Gemini) con límite de ritmo, concurrencia y reintentos.
+        `tokens` es la estimación para la cubeta TPM; con la respuesta se corrige según el
+        consumo que informe Gemini (usage_metadata), si lo informa.
+        """
+        async for intento in self._reintentos(es_reintentable):
+            with intento:
+                await self._esperar_cuota(tokens)
+                async with self._hueco():
+                    restante = self._comprobar_plazo()
+                    self.contadores["llamadas"] += 1
+                    try:
+                        resultado = await asyncio.wait_for(funcion(), timeout=restante)
+                    except asyncio.TimeoutError as e:
+                        # Solo es PlazoAgotado si la petición tiene plazo y ha vencido; si no, es un timeout del
+                        # cliente o de la red y, como cualquier otro error, decide la política de reintentos
+                        if restante is not None and plazo_restante() <= 0:
+                            raise PlazoAgotado(f"Plazo de la petición agotado en la llamada a {self.nombre}") from e
+                        self._registrar_error(e)
+                        raise
+                    except Exception as e:
+                        self._registrar_error(e)
+                        raise
+                self._exito()
+                self._contabilizar(tokens, uso_tokens(resultado), _texto(resultado))
+                return resultado
+
+    async def transmitir(self, abrir: Callable[[], AsyncIterator[T]], tokens: int = 0,
+                         etiquetas: Optional[Dict[str, str]] = None) -> AsyncIterator[T]:
+        """
+        Versión para respuestas en streaming: `abrir()` devuelve el iterador de trozos.
+        Solo se reintenta si el error llega antes del primer trozo; después ya se ha entregado texto.
+        `etiquetas` indica a qué etapa atribuir los tokens (por defecto, la etapa en curso).
+        """
+        emitido = False
+        async for intento in self._reintentos(lambda e: not emitido and es_reintentable(e)):
+            with intento:
+                await self._esperar_cuota(tokens)
+                salida, uso = [], None
+                async with self._hueco():
+                    self._comprobar_plazo()
+                    self.contadores["llamadas"] += 1
+                    try:
+                        async for trozo in abrir():
+                            emitido = True
+                            salida.append(_texto(trozo))
+                            uso = uso_tokens(trozo) or uso  # El uso suele venir en el último trozo
+                            yield trozo
+                            self._comprobar_plazo()
+                    except Exception as e:
+                        self._registrar_error(e)
+                        raise
+                self._exito()
+                self._contabilizar(tokens, uso, "".join(salida), etiquetas)
+
+    def _contabilizar(self, estimados: int, uso: Optional[Tuple[int, int]], texto: str,
+                      etiquetas: Optional[Dict[str, str]] = None) -> None:
+        """Anota los tokens de la llamada en las métricas y corrige la cubeta TPM con el consumo real."""
+        entrada, salida = uso if uso else (estimados, estimar_tokens(texto) if texto else 0)
+        metricas.registrar_tokens(self.nombre, entrada, salida, etiquetas)
+        if uso and self._tokens is not None:
+            self._tokens.ajustar(entrada + salida - estimados)
+
+    def estado(self) -> Dict[str, Any]:
+        return {"modelo": self.nombre, "limite": int(self.limite), "en_vuelo": self.en_vuelo, **self.contadores}
+
+
+_PASARELAS: Dict[str, PasarelaLLM] = {}
+_PID_PASARELAS: Optional[int] = None
+
+
+def pasarela(modelo: str) -> PasarelaLLM:
+    """Pasarela compartida del proceso para un modelo (la cuota de Gemini es por modelo)."""
+    global _PID_PASARELAS
+    if _PID_PASARELAS != os.getpid():
+        # Tras un fork (gunicorn --preload) cada worker empieza con sus pasarelas y contadores
+        _PASARELAS.clear()
+        _PID_PASARELAS = os.getpid()
+    if modelo not in _PASARELAS:
+        _PASARELAS[modelo] = PasarelaLLM.desde_entorno(modelo)
+    return _PASARELAS[modelo]
+
+
+def estado_pasarelas() -> list:
+    return [p.estado() for p in _PASARELAS.values()]
+
+
+def _metricas_pasarelas() -> list:
+    estados = estado_pasarelas()
+
+    def valores(clave: str):
+        return [({"modelo": e["modelo"]}, e[clave]) for e in estados]
+
+    return (
+        metricas.serie("licizen_llm_concurrencia_limite", "Límite de concurrencia AIMD actual por modelo", valores("limite"))
+        + metricas.serie("licizen_llm_en_vuelo", "Llamadas a Gemini en curso por modelo", valores("en_vuelo"))
+        + metricas.serie("licizen_llm_reintentos_total", "Reintentos por modelo", valores("reintentos"), "counter")
+        + metricas.serie("licizen_llm_saturaciones_total", "Respuestas 429/503 por modelo", valores("saturaciones"), "counter")
+    )
+
+
+metricas.registrar_colector(_metricas_pasarelas)
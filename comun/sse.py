@@ -0,0 +1,7 @@
+# comun/sse.py
+import json
+
+
+def evento_sse(tipo: str, datos: dict) -> str:
+    """Da formato de Server-Sent Event a un evento (tipo + datos en JSON)."""
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
@@ -0,0 +1,368 @@
+# comun/trabajos.py
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import statistics
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+PENDIENTE, EN_CURSO, COMPLETADO, ERROR = "pendiente", "en_curso", "completado", "error"
+TERMINALES = (COMPLETADO, ERROR)
+
+# Un ejecutor recibe la entrada del trabajo y devuelve eventos (tipo, datos): "seccion" por cada
+# sección terminada y, al final, "resultado" con el pliego completo
+Ejecutor = Callable[[Dict[str, Any]], AsyncIterator[Tuple[str, Any]]]
+
+
+class _Tabla:
+    """Estado de los trabajos en SQLite (WAL). Métodos bloqueantes: se llaman con asyncio.to_thread."""
+
+    COLUMNAS = ("id", "estado", "entrada", "total", "terminadas", "resultado", "error", "creado", "iniciado", "terminado",
+                "dueno", "latido")
+
+    def __init__(self, ruta: str):
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS trabajos ("
+            " id TEXT PRIMARY KEY, estado TEXT NOT NULL, entrada TEXT NOT NULL, total INTEGER NOT NULL,"
+            " terminadas TEXT NOT NULL DEFAULT '[]', resultado TEXT, error TEXT,"
+            " creado REAL NOT NULL, iniciado REAL, terminado REAL)"
+        )
+        # Quién ejecuta cada trabajo en curso y cuándo dio señales de vida por última vez (bases anteriores: se añaden)
+        columnas = {fila[1] for fila in self._conexion.execute("PRAGMA table_info(trabajos)")}
+        for columna, tipo in (("dueno", "TEXT"), ("latido", "REAL")):
+            if columna not in columnas:
+                self._conexion.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} {tipo}")
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, creado)")
+        self._conexion.commit()
+
+    def _escribir(self, sql: str, parametros: tuple) -> int:
+        """Ejecuta la escritura y devuelve el nº de filas afectadas."""
+        with self._lock:
+            filas = self._conexion.execute(sql, parametros).rowcount
+            self._conexion.commit()
+        return filas
+
+    def crear(self, id_trabajo: str, entrada: Dict[str, Any], total: int) -> None:
+        self._escribir(
+            "INSERT INTO trabajos (id, estado, entrada, total, creado) VALUES (?, ?, ?, ?, ?)",
+            (id_trabajo, PENDIENTE, json.dumps(entrada, ensure_ascii=False), total, time.time()),
+        )
+
+    def obtener(self, id_trabajo: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fila = self._conexion.execute(
+                f"SELECT {', '.join(self.COLUMNAS)} FROM trabajos WHERE id = ?", (id_trabajo,)
+            ).fetchone()
+        if fila is None:
+            return None
+        trabajo = dict(zip(self.COLUMNAS, fila))
+        for clave in ("entrada", "terminadas", "resultado"):
+            if trabajo[clave] is not None:
+                trabajo[clave] = json.loads(trabajo[clave])
+        return trabajo
+
+    def reclamar(self, id_trabajo: str, dueno: str) -> bool:
+        """Pasa el trabajo a en curso a nombre de `dueno` solo si sigue pendiente: entre varios procesos, lo ejecuta uno."""
+        ahora = time.time()
+        return self._escribir(
+            "UPDATE trabajos SET estado = ?, dueno = ?, latido = ?, iniciado = ?, terminadas = '[]'"
+            " WHERE id = ? AND estado = ?",
+            (EN_CURSO, dueno, ahora, ahora, id_trabajo, PENDIENTE),
+        ) == 1
+
+    def progreso(self, id_trabajo: str, dueno: str, terminadas: List[str]) -> None:
+        self._escribir("UPDATE trabajos SET terminadas = ?, latido = ? WHERE id = ? AND dueno = ?",
+                       (json.dumps(terminadas, ensure_ascii=False), time.time(), id_trabajo, dueno))
+
+    def terminar(self, id_trabajo: str, dueno: str, resultado: Any = None, error: Optional[str] = None) -> bool:
+        """Guarda el final del trabajo; False si ya no es de `dueno` (se dio por muerto y lo reclamó otro)."""
+        return self._escribir(
+            "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, terminado = ? WHERE id = ? AND dueno = ? AND estado = ?",
+            (ERROR if error else COMPLETADO, None if error else json.dumps(resultado, ensure_ascii=False),
+             error, time.time(), id_trabajo, dueno, EN_CURSO),
+        ) == 1
+
+    def latir(self, dueno: str) -> None:
+        """Señal de vida de los trabajos en curso de `dueno`."""
+        self._escribir("UPDATE trabajos SET latido = ? WHERE dueno = ? AND estado = ?", (time.time(), dueno, EN_CURSO))
+
+    def liberar(self, dueno: str) -> None:
+        """Devuelve a pendientes los trabajos en curso de `dueno` (al apagar), para que los retome otro proceso."""
+        self._escribir("UPDATE trabajos SET estado = ?, dueno = NULL, iniciado = NULL WHERE dueno = ? AND estado = ?",
+                       (PENDIENTE, dueno, EN_CURSO))
+
+    def reanudables(self, caducidad: float) -> List[str]:
+        """
+        Trabajos pendientes, en orden de llegada, después de devolver a pendientes los en curso cuyo dueño
+        ha muerto (proceso de esta máquina que ya no existe) o lleva `caducidad` segundos sin dar señales.
+        Los de un dueño vivo no se tocan: un worker que arranca no vuelve a ejecutar lo que otro está ejecutando.
+        """
+        limite = time.time() - caducidad
+        with self._lock:
+            en_curso = self._conexion.execute(
+                "SELECT id, dueno, latido FROM trabajos WHERE estado = ?", (EN_CURSO,)
+            ).fetchall()
+            for id_trabajo, dueno, latido in en_curso:
+                if (latido or 0) < limite or not _dueno_vivo(dueno):
+                    # Solo si nadie lo ha tocado entretanto (otro proceso puede estar reclamándolo a la vez)
+                    self._conexion.execute(
+                        "UPDATE trabajos SET estado = ?, dueno = NULL, iniciado = NULL"
+                        " WHERE id = ? AND estado = ? AND dueno IS ? AND latido IS ?",
+                        (PENDIENTE, id_trabajo, EN_CURSO, dueno, latido),
+                    )
+            self._conexion.commit()
+            filas = self._conexion.execute(
+                "SELECT id FROM trabajos WHERE estado = ? ORDER BY creado", (PENDIENTE,)
+            ).fetchall()
+        return [f[0] for f in filas]
+
+    def tiempos(self, limite: int) -> Tuple[List[float], List[float], Dict[str, int]]:
+        """Espera y ejecución de los últimos `limite` trabajos terminados, y número de trabajos por estado."""
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT iniciado - creado, terminado - iniciado FROM trabajos"
+                " WHERE terminado IS NOT NULL AND iniciado IS NOT NULL ORDER BY terminado DESC LIMIT ?",
+                (limite,),
+            ).fetchall()
+            conteo = dict(self._conexion.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+        return [f[0] for f in filas], [f[1] for f in filas], conteo
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conexion.close()
+
+
+def _dueno_vivo(dueno: Optional[str]) -> bool:
+    """False si el dueño es un proceso de esta máquina que ya no existe; si es de otra, no se puede saber."""
+    if not dueno:
+        return False
+    maquina, _, resto = dueno.partition(":")
+    if maquina != socket.gethostname():
+        return True
+    try:
+        os.kill(int(resto.split(":")[0]), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+def _resumen(valores: List[float]) -> Dict[str, Optional[float]]:
+    if not valores:
+        return {"media": None, "p95": None, "max": None}
+    ordenados = sorted(valores)
+    return {
+        "media": round(statistics.fmean(ordenados), 3),
+        "p95": round(ordenados[min(len(ordenados) - 1, int(0.95 * len(ordenados)))], 3),
+        "max": round(ordenados[-1], 3),
+    }
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos de generación de pliegos con un pool acotado de workers asyncio.
+
+    Encolar devuelve un ID al momento; los workers ejecutan el trabajo y van guardando en
+    SQLite las secciones terminadas, así que el cliente puede consultar el estado o
+    suscribirse a los eventos sin mantener abierta la petición que lo creó.
+
+    Varios procesos (workers de gunicorn) pueden compartir la base de datos: cada trabajo se
+    reclama de forma atómica antes de ejecutarlo, el proceso que lo ejecuta da señales de vida
+    cada `latido` segundos y los demás solo lo retoman si su dueño ha muerto o lleva `caducidad`
+    segundos callado. Así los trabajos pendientes o a medias sobreviven a un reinicio sin que
+    un worker que arranca repita lo que otro sigue ejecutando.
+    """
+
+    def __init__(self, ruta: str, ejecutor: Ejecutor, trabajadores: int = 2,
+                 latido: float = 10.0, caducidad: float = 60.0):
+        self.ruta = ruta
+        self.ejecutor = ejecutor
+        self.trabajadores = max(1, trabajadores)
+        self.latido = latido
+        self.caducidad = caducidad
+        self.dueno = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tabla: Optional[_Tabla] = None
+        self._cola: Optional[asyncio.Queue] = None
+        self._encolados: set = set()  # Los que están en la cola de este proceso, para no meterlos dos veces
+        self._tareas: List[asyncio.Task] = []
+        self._eventos: Dict[str, List[Tuple[str, Any]]] = {}  # Eventos de los trabajos en curso
+        self._senales: Dict[str, asyncio.Event] = {}  # Se activa cada vez que un trabajo avanza
+
+    @classmethod
+    def desde_entorno(cls, prefijo: str, ruta_por_defecto: str, ejecutor: Ejecutor) -> "ColaTrabajos":
+        """Configuración por variables <PREFIJO>_TRABAJOS (ruta SQLite) y <PREFIJO>_TRABAJADORES."""
+        return cls(
+            os.getenv(f"{prefijo}_TRABAJOS", ruta_por_defecto), ejecutor,
+            trabajadores=int(os.getenv(f"{prefijo}_TRABAJADORES", "2")),
+        )
+
+    async def iniciar(self) -> None:
+        """Abre la base de datos, arranca los workers y reencola lo que quedó sin terminar."""
+        self._tabla = await asyncio.to_thread(_Tabla, self.ruta)
+        self._cola = asyncio.Queue()
+        reanudados = await self._recoger()
+        if reanudados:
+            log.info("Reanudando %d trabajos pendientes", reanudados)
+        self._tareas = [asyncio.create_task(self._trabajador()) for _ in range(self.trabajadores)]
+        self._tareas.append(asyncio.create_task(self._vigilar()))
+
+    async def cerrar(self) -> None:
+        """Para los workers. Lo que estuviera en curso vuelve a pendiente para que lo retome otro proceso o el próximo arranque."""
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        if self._tabla is not None:
+            await asyncio.to_thread(self._tabla.liberar, self.dueno)
+            self._tabla.cerrar()
+            self._tabla = None
+
+    def _poner(self, id_trabajo: str) -> None:
+        self._senales.setdefault(id_trabajo, asyncio.Event())
+        self._encolados.add(id_trabajo)
+        self._cola.put_nowait(id_trabajo)
+
+    async def _recoger(self) -> int:
+        """Encola los pendientes (y los huérfanos de un dueño muerto) que no estén ya en la cola de este proceso."""
+        nuevos = [i for i in await asyncio.to_thread(self._tabla.reanudables, self.caducidad) if i not in self._encolados]
+        for id_trabajo in nuevos:
+            self._poner(id_trabajo)
+        return len(nuevos)
+
+    async def _vigilar(self) -> None:
+        """Da señales de vida de los trabajos propios y recoge los que otro proceso dejó a medias."""
+        while True:
+            await asyncio.sleep(self.latido)
+            try:
+                await asyncio.to_thread(self._tabla.latir, self.dueno)
+                await self._recoger()
+            except Exception:
+                log.exception("Error al comprobar los trabajos de la cola")
+
+    async def encolar(self, entrada: Dict[str, Any], total: int) -> str:
+        """Guarda el trabajo y lo pone en la cola. `total` es el nº de secciones, para mostrar el progreso."""
+        id_trabajo = uuid.uuid4().hex
+        await asyncio.to_thread(self._tabla.crear, id_trabajo, entrada, total)
+        self._poner(id_trabajo)
+        return id_trabajo
+
+    async def obtener(self, id_trabajo: str) -> Optional[Dict[str, Any]]:
+        """Estado del trabajo para consultarlo por polling (sin la entrada)."""
+        trabajo = await asyncio.to_thread(self._tabla.obtener, id_trabajo)
+        if trabajo is None:
+            return None
+        ahora = time.time()
+        return {
+            "id": trabajo["id"],
+            "estado": trabajo["estado"],
+            "progreso": {"terminadas": trabajo["terminadas"], "total": trabajo["total"]},
+            "espera": round((trabajo["iniciado"] or ahora) - trabajo["creado"], 3),
+            "duracion": round((trabajo["terminado"] or ahora) - trabajo["iniciado"], 3) if trabajo["iniciado"] else None,
+            "resultado": trabajo["resultado"],
+            "error": trabajo["error"],
+        }
+
+    async def suscribir(self, id_trabajo: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Eventos del trabajo según avanza: "seccion" por cada sección terminada y, al acabar,
+        "estado" con el estado final (y el resultado). Si ya había terminado, solo el "estado".
+        """
+        vistos = 0
+        while True:
+            # La señal se coge antes de mirar el estado: así no se pierde un aviso que llegue entre medias
+            senal = self._senales.get(id_trabajo)
+            eventos = self._eventos.get(id_trabajo)
+            if eventos is not None:
+                for evento in eventos[vistos:]:
+                    yield evento
+                vistos = len(eventos)
+            else:
+                trabajo = await self.obtener(id_trabajo)
+                if trabajo is None:
+                    return
+                if trabajo["estado"] in TERMINALES or senal is None:
+                    yield "estado", trabajo
+                    return
+            await senal.wait()
+
+    def _avisar(self, id_trabajo: str) -> None:
+        senal = self._senales.get(id_trabajo)
+        if senal is not None:
+            senal.set()
+            self._senales[id_trabajo] = asyncio.Event()
+
+    async def _trabajador(self) -> None:
+        while True:
+            id_trabajo = await self._cola.get()
+            try:
+                await self._ejecutar(id_trabajo)
+            except Exception:
+                log.exception("Error inesperado en el trabajo %s", id_trabajo)
+            finally:
+                self._encolados.discard(id_trabajo)
+                self._cola.task_done()
+
+    async def _ejecutar(self, id_trabajo: str) -> None:
+        if not await asyncio.to_thread(self._tabla.reclamar, id_trabajo, self.dueno):
+            # Otro proceso ya lo ha reclamado (o terminado): sus suscriptores de aquí leen el estado de SQLite
+            self._avisar(id_trabajo)
+            self._senales.pop(id_trabajo, None)
+            return
+        trabajo = await asyncio.to_thread(self._tabla.obtener, id_trabajo)
+        eventos = self._eventos[id_trabajo] = []
+        terminadas: List[str] = []
+        resultado, error = None, None
+        self._avisar(id_trabajo)
+        try:
+            async for tipo, datos in self.ejecutor(trabajo["entrada"]):
+                if tipo == "resultado":
+                    resultado = datos
+                    continue
+                if tipo == "seccion":
+                    terminadas.append(datos["titulo"])
+                    await asyncio.to_thread(self._tabla.progreso, id_trabajo, self.dueno, terminadas)
+                eventos.append((tipo, datos))
+                self._avisar(id_trabajo)
+        except asyncio.CancelledError:
+            self._eventos.pop(id_trabajo, None)
+            raise  # Apagado: cerrar() lo devuelve a pendiente
+        except Exception as e:
+            log.warning("El trabajo %s ha fallado: %s", id_trabajo, e)
+            error = str(e) or type(e).__name__
+
+        if not await asyncio.to_thread(self._tabla.terminar, id_trabajo, self.dueno, resultado, error):
+            log.warning("El trabajo %s se dio por abandonado y lo ha retomado otro proceso: no se guarda este resultado", id_trabajo)
+        del self._eventos[id_trabajo]
+        self._avisar(id_trabajo)
+        self._senales.pop(id_trabajo, None)
+
+    def profundidad(self) -> int:
+        """Trabajos esperando en la cola de este proceso (0 si la cola no ha arrancado)."""
+        return self._cola.qsize() if self._cola is not None else 0
+
+    def en_curso(self) -> int:
+        """Trabajos que este proceso está ejecutando ahora."""
+        return len(self._eventos)
+
+    async def estadisticas(self, limite: int = 500) -> Dict[str, Any]:
+        """Profundidad de la cola y tiempos de espera y de ejecución (en segundos) de los últimos trabajos."""
+        esperas, ejecuciones, conteo = await asyncio.to_thread(self._tabla.tiempos, limite)
+        return {
+            "profundidad": self.profundidad(),
+            "en_curso": self.en_curso(),
+            "trabajadores": self.trabajadores,
+            "por_estado": conteo,
+            "espera": _resumen(esperas),
+            "ejecucion": _resumen(ejecuciones),
+        }
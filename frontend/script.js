@@ -107,7 +107,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         try {
-            const response = await fetch('http://127.0.0.1:8000/administrativo', {
+            // Con la app unificada se puede apuntar a otro servicio definiendo window.LICIZEN_API
+            const response = await fetch(`${window.LICIZEN_API || 'http://127.0.0.1:8000'}/administrativo`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(data)
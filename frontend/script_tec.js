@@ -6,8 +6,11 @@ document.addEventListener('DOMContentLoaded', () => {
     const loadingDiv = document.getElementById('loading');
 
     // --- URLs de las APIs Técnicas ---
-    const TEC_QUESTIONS_API_URL = 'http://127.0.0.1:8001/preguntas'; // Tu API técnica para preguntas
-    const TEC_GENERATE_API_URL = 'http://127.0.0.1:8001/generar';   // Tu API técnica para generar
+    // Con la app unificada (un solo servicio para las dos APIs) basta con definir window.LICIZEN_API antes de este script
+    const TEC_API_BASE = window.LICIZEN_API || 'http://127.0.0.1:8001';
+    const TEC_QUESTIONS_API_URL = `${TEC_API_BASE}/preguntas`; // Tu API técnica para preguntas
+    const TEC_GENERATE_API_URL = `${TEC_API_BASE}/generar`;   // Tu API técnica para generar
+    const TEC_STREAM_API_URL = `${TEC_API_BASE}/generar/stream`; // Misma generación, sección a sección (SSE)
 
     let technicalQuestions = []; // Para almacenar las preguntas obtenidas de la API
 
@@ -178,7 +181,7 @@ document.addEventListener('DOMContentLoaded', () => {
         console.log("Enviando datos técnicos:", requestPayload);
 
         try {
-            const response = await fetch(TEC_GENERATE_API_URL, {
+            const response = await fetch(TEC_STREAM_API_URL, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(requestPayload)
@@ -190,7 +193,54 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(`¡Error HTTP! Estado: ${response.status} - ${JSON.stringify(errorData)}`);
             }
 
-            const result = await response.json();
+            // --- Leer los eventos SSE según van llegando ---
+            // Cada sección llega en cuanto termina (con su posición); al final llega "fin" con objeto e índice
+            const seccionesPorPosicion = {};
+            const totalSecciones = Object.keys(respuestas).length;
+            let completadas = 0;
+            let fin = null;
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (fin === null) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let separador;
+                while ((separador = buffer.indexOf('\n\n')) !== -1) {
+                    const bloque = buffer.slice(0, separador);
+                    buffer = buffer.slice(separador + 2);
+
+                    const tipo = (bloque.match(/^event: (.*)$/m) || [])[1];
+                    const datos = JSON.parse((bloque.match(/^data: (.*)$/m) || [])[1] || '{}');
+
+                    if (tipo === 'seccion') {
+                        seccionesPorPosicion[datos.posicion] = datos;
+                        completadas += 1;
+                        tenderResultDiv.innerHTML = `<p>Sección redactada: ${datos.titulo.trim()} (${completadas}/${totalSecciones})</p>`;
+                    } else if (tipo === 'fin') {
+                        fin = datos;
+                    } else if (tipo === 'error') {
+                        throw new Error(datos.detalle);
+                    }
+                }
+            }
+
+            if (fin === null) {
+                throw new Error('La generación se interrumpió antes de terminar.');
+            }
+
+            // Reconstruimos el mismo formato que devuelve /generar, con las secciones en su orden
+            const result = { objeto: fin.objeto, indice: fin.indice, secciones: {} };
+            Object.keys(seccionesPorPosicion)
+                .sort((a, b) => a - b)
+                .forEach(posicion => {
+                    const seccion = seccionesPorPosicion[posicion];
+                    result.secciones[seccion.titulo] = seccion.contenido;
+                });
             console.log("Resultado técnico recibido:", result);
             // --- Construir el contenido en Markdown para el editor ---
             let editorContent = `## Pliego Técnico Generado (${result.objeto}):\n\n`;
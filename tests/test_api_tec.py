@@ -0,0 +1,41 @@
+# tests/test_api_tec.py
+import asyncio
+
+from fastapi import Response
+
+from app_tec import api_tec, core_tec
+from app_tec.model_tec import PreguntasRequest
+from comun.cache_resultados import CacheResultados
+from comun.falsos import ModeloFalso
+
+
+def test_generar_texto_mantiene_la_cabecera(monkeypatch):
+    resultado = {"objeto": "Digitalización", "indice": ["Objeto del contrato"], "secciones": {" Objeto del Contrato": "Texto."}}
+
+    async def con_cache(respuestas):
+        return resultado, "HIT"
+
+    monkeypatch.setattr(api_tec, "procesar_pliego_con_cache", con_cache)
+
+    async def escenario():
+        respuesta = await api_tec.generar_pliego_texto(PreguntasRequest(respuestas={}))
+        return respuesta, "".join([trozo async for trozo in respuesta.body_iterator])
+
+    respuesta, texto = asyncio.run(escenario())
+    assert texto == "PLIEGO TÉCNICO PARA: Digitalización\n\nÍNDICE:\n- Objeto del contrato\n\nOBJETO DEL CONTRATO\nTexto.\n\n"
+    assert respuesta.headers["X-Cache"] == "HIT"
+
+
+def test_generar_informa_del_estado_de_la_cache(monkeypatch):
+    modelo = ModeloFalso(latencia=0.001)
+    monkeypatch.setattr(core_tec, "inicializar_gemini", lambda: modelo)
+    monkeypatch.setattr(core_tec, "CACHE_PLIEGOS", CacheResultados())
+    peticion = PreguntasRequest(respuestas={" Objeto del Contrato": {"¿Hay una fecha concreta de inicio prevista?": "enero"}})
+
+    def generar() -> str:
+        respuesta = Response()
+        asyncio.run(api_tec.generar_pliego(peticion, respuesta))
+        return respuesta.headers["X-Cache"]
+
+    assert [generar(), generar()] == ["MISS", "HIT"]
+    assert modelo.llamadas == 1
@@ -0,0 +1,20 @@
+# tests/test_borradores.py
+from comun.borradores import AlmacenBorradores, fusionar
+
+
+def test_fusionar_es_profunda_y_no_modifica_la_base():
+    base = {"a": 1, "garantias": {"provisional": False, "definitiva": 5}, "lista": [1, 2]}
+    resultado = fusionar(base, {"garantias": {"provisional": True}, "lista": [3], "nuevo": {"x": 1}})
+    assert resultado == {"a": 1, "garantias": {"provisional": True, "definitiva": 5}, "lista": [3], "nuevo": {"x": 1}}
+    assert base["garantias"] == {"provisional": False, "definitiva": 5}
+
+
+def test_almacen_guarda_y_actualiza(tmp_path):
+    almacen = AlmacenBorradores(str(tmp_path / "borradores.sqlite3"))
+    id_borrador = almacen.crear("tec", {"a": 1}, {"A": "h1"}, {"secciones": {"A": "texto"}})
+    assert almacen.obtener(id_borrador, "adm") is None  # Un borrador de tec no se sirve desde adm
+    almacen.actualizar(id_borrador, {"a": 2}, {"A": "h2"}, {"secciones": {"A": "otro"}})
+    borrador = almacen.obtener(id_borrador, "tec")
+    assert borrador["entrada"] == {"a": 2} and borrador["huellas"] == {"A": "h2"}
+    assert almacen.candado(id_borrador) is almacen.candado(id_borrador)
+    almacen.cerrar()
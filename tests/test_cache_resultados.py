@@ -0,0 +1,65 @@
+# tests/test_cache_resultados.py
+import asyncio
+import time
+
+from comun.cache_resultados import COMPARTIDO, HIT, HIT_DISCO, MISS, CacheResultados, clave_canonica
+
+
+def test_clave_canonica_no_depende_del_orden():
+    assert clave_canonica({"a": 1, "b": 2}) == clave_canonica({"b": 2, "a": 1})
+    assert clave_canonica({"a": 1}) != clave_canonica({"a": 2})
+
+
+def test_peticiones_iguales_simultaneas_generan_una_vez():
+    cache = CacheResultados()
+    generaciones = []
+
+    async def generar():
+        generaciones.append(1)
+        await asyncio.sleep(0.05)
+        return {"pliego": "texto"}
+
+    async def escenario():
+        return await asyncio.gather(*(cache.obtener_o_generar("clave", generar) for _ in range(3)))
+
+    resultados = asyncio.run(escenario())
+    assert len(generaciones) == 1
+    assert sorted(estado for _, estado in resultados) == sorted([MISS, COMPARTIDO, COMPARTIDO])
+    assert all(valor == {"pliego": "texto"} for valor, _ in resultados)
+    assert asyncio.run(cache.obtener_o_generar("clave", generar))[1] == HIT
+    assert (cache.aciertos, cache.fallos) == (3, 1)
+
+
+def test_error_en_la_generacion_no_se_guarda():
+    cache = CacheResultados()
+
+    async def fallar():
+        raise RuntimeError("Gemini no responde")
+
+    async def escenario():
+        return await asyncio.gather(*(cache.obtener_o_generar("clave", fallar) for _ in range(2)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(escenario()))
+    assert asyncio.run(cache.obtener("clave")) == (None, MISS)
+
+
+def test_fallo_en_memoria_se_sirve_desde_disco(tmp_path):
+    ruta = str(tmp_path / "cache.sqlite3")
+    cache = CacheResultados(max_entradas=1, ttl=60, ruta_disco=ruta)
+
+    async def escenario():
+        await cache.guardar("a", {"pliego": "a"})
+        await cache.guardar("b", {"pliego": "b"})  # Expulsa "a" de la memoria, pero sigue en disco
+        return [await cache.obtener("a"), await cache.obtener("a")]
+
+    assert asyncio.run(escenario()) == [({"pliego": "a"}, HIT_DISCO), ({"pliego": "a"}, HIT)]
+
+    # Tras un reinicio (o desde otro worker) la memoria está vacía y responde el disco
+    assert asyncio.run(CacheResultados(ttl=60, ruta_disco=ruta).obtener("b")) == ({"pliego": "b"}, HIT_DISCO)
+
+
+def test_caducada_no_se_sirve_ni_desde_disco(tmp_path):
+    cache = CacheResultados(ttl=0.05, ruta_disco=str(tmp_path / "cache.sqlite3"))
+    asyncio.run(cache.guardar("clave", {"pliego": "texto"}))
+    time.sleep(0.1)
+    assert asyncio.run(cache.obtener("clave")) == (None, MISS)
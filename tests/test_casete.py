@@ -0,0 +1,27 @@
+# tests/test_casete.py
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from comun.casete import GRABAR, REPRODUCIR, Casete, FaltaEnCasete
+from comun.casete_langchain import ChatCasete
+
+
+def _chat(casete: Casete, respuesta: str = "Texto grabado") -> ChatCasete:
+    modelo = FakeListChatModel(responses=[respuesta]) if casete.modo == GRABAR else None
+    return ChatCasete(modelo=modelo, nombre="gemini-prueba", parametros={"temperature": 0.4}, casete=casete)
+
+
+def test_invoke_graba_y_reproduce(tmp_path):
+    ruta = str(tmp_path / "casete.sqlite3")
+    assert _chat(Casete(ruta, GRABAR)).invoke("Hola").content == "Texto grabado"
+    reproductor = _chat(Casete(ruta, REPRODUCIR))
+    assert reproductor.invoke("Hola").content == "Texto grabado"
+    # La grabación síncrona también la sirve la vía async
+    assert asyncio.run(reproductor.ainvoke("Hola")).content == "Texto grabado"
+
+
+def test_invoke_sin_grabar(tmp_path):
+    with pytest.raises(FaltaEnCasete):
+        _chat(Casete(str(tmp_path / "casete.sqlite3"), REPRODUCIR)).invoke("Sin grabar")
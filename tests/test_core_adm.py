@@ -0,0 +1,78 @@
+# tests/test_core_adm.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app_adm import LiciZen_adm, core_adm
+from app_adm.LiciZen_adm import SECCIONES, apartado_advertencias, separar_secciones, unir_secciones
+from comun.borradores import AlmacenBorradores
+from comun.cache_resultados import CacheResultados
+from comun.falsos import ChatFalso
+
+
+def test_separar_secciones_deshace_unir_secciones():
+    secciones = {SECCIONES[0]: "Órgano.\n\n### Detalle\n\ntexto", SECCIONES[4]: "- 5 %"}
+    assert separar_secciones(unir_secciones(secciones) + apartado_advertencias(["Revisar"])) == secciones
+
+
+@pytest.fixture
+def adm(monkeypatch, tmp_path):
+    almacen = AlmacenBorradores(str(tmp_path / "borradores.sqlite3"))
+    revisadas = []
+
+    async def redactar(datos, secciones=SECCIONES, memo_contexto=None):
+        return {sec: f"{sec}: {datos.version}" for sec in secciones}
+
+    async def revisar_seccion(sec, texto, hechos):
+        revisadas.append(sec)
+        return f"revisada {texto}"
+
+    # Datos mínimos: cada sección depende solo de su propio campo
+    def datos(**entrada):
+        return SimpleNamespace(objeto_contrato="Objeto", version=entrada, model_dump=lambda **_: entrada)
+
+    monkeypatch.setattr(core_adm, "Datos", datos)
+    monkeypatch.setattr(core_adm, "huellas_secciones", lambda datos: {sec: str(datos.version.get(sec)) for sec in SECCIONES})
+    monkeypatch.setattr(core_adm, "redactar_secciones", redactar)
+    monkeypatch.setattr(core_adm, "recursos", SimpleNamespace(obtener=lambda nombre: almacen))
+    monkeypatch.setattr(core_adm, "CACHE_PLIEGOS", CacheResultados())
+    monkeypatch.setattr(core_adm, "MODO_REVISION", "secciones")
+    monkeypatch.setattr(LiciZen_adm, "hechos_clave", lambda datos: "")
+    monkeypatch.setattr(LiciZen_adm, "_revisar_seccion", revisar_seccion)
+    monkeypatch.setattr(LiciZen_adm, "obtener_llm", lambda: ChatFalso(responses=['{"parches": [], "advertencias": []}'], latencia=0))
+    yield almacen, revisadas
+    almacen.cerrar()
+
+
+def test_borrador_solo_revisa_las_secciones_cambiadas(adm):
+    almacen, revisadas = adm
+    entrada = {sec: 1 for sec in SECCIONES}
+
+    async def escenario():
+        secciones = await core_adm.redactar_secciones(core_adm.Datos(**entrada))
+        resultado = {"objeto": "Objeto", "indice": list(secciones), "secciones": secciones,
+                     "pliego_final": await core_adm.revisar_pliego(secciones, core_adm.Datos(**entrada))}
+        id_borrador = almacen.crear("adm", entrada, core_adm.huellas_secciones(core_adm.Datos(**entrada)), resultado)
+        revisadas.clear()
+        return await core_adm.actualizar_borrador(id_borrador, {"Garantías": 2})
+
+    borrador = asyncio.run(escenario())
+    assert borrador["regeneradas"] == ["Garantías"]
+    assert revisadas == ["Garantías"]
+    final = separar_secciones(borrador["pliego_final"])
+    assert final["Garantías"] == "revisada Garantías: " + str({**entrada, "Garantías": 2})
+    assert final["Portada"] == "revisada Portada: " + str(entrada)
+
+
+def test_semaforos_en_varios_bucles():
+    async def ocupar():
+        async with LiciZen_adm.sem_secciones():
+            await asyncio.sleep(0.001)
+
+    async def con_contencion():
+        await asyncio.gather(*(ocupar() for _ in range(LiciZen_adm.MAX_SECCIONES + 2)))
+
+    # Como en los benchmarks o en --lote: cada asyncio.run es un bucle nuevo
+    asyncio.run(con_contencion())
+    asyncio.run(con_contencion())
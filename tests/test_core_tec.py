@@ -0,0 +1,94 @@
+# tests/test_core_tec.py
+import asyncio
+
+import pytest
+
+from app_tec import core_tec
+from comun.borradores import AlmacenBorradores, fusionar
+from comun.cache_resultados import CacheResultados
+from comun.falsos import ModeloFalso
+
+RESPUESTAS = {
+    " Objeto del Contrato": {"¿Cuál es el objeto principal del contrato? (por ejemplo: escaneo de documentos, desarrollo de software, suministro de material…)": "digitalización"},
+    " Situación Inicial": {"¿Dónde se encuentra actualmente la documentación/material que se va a tratar?": "archivo central"},
+}
+
+
+@pytest.fixture
+def modelo(monkeypatch):
+    falso = ModeloFalso(latencia=0.001)
+    monkeypatch.setattr(core_tec, "inicializar_gemini", lambda: falso)
+    monkeypatch.setattr(core_tec, "CACHE_PLIEGOS", CacheResultados())
+    return falso
+
+
+def _eventos(respuestas: dict) -> list:
+    async def recoger():
+        return [evento async for evento in core_tec.procesar_pliego_stream(respuestas)]
+    return asyncio.run(recoger())
+
+
+def test_stream_guarda_el_pliego_en_cache(modelo):
+    primera = _eventos(RESPUESTAS)
+    assert primera[-1][0] == "fin" and primera[-1][1]["cache"] == "MISS"
+    assert modelo.llamadas == len(RESPUESTAS)
+
+    # El mismo formulario otra vez (por stream o por /generar) no vuelve a llamar a Gemini
+    segunda = _eventos(RESPUESTAS)
+    assert segunda[-1][1]["cache"] == "HIT"
+    resultado, estado = asyncio.run(core_tec.procesar_pliego_con_cache(RESPUESTAS))
+    assert estado == "HIT" and list(resultado["secciones"]) == list(RESPUESTAS)
+    assert modelo.llamadas == len(RESPUESTAS)
+    assert [d["contenido"] for t, d in segunda if t == "seccion"] == list(resultado["secciones"].values())
+
+
+def test_claves_de_cache_no_releen_el_entorno(monkeypatch):
+    from app_tec import utils
+    lecturas = []
+    monkeypatch.setattr(utils, "_configuracion", None)
+    monkeypatch.setattr(utils, "load_dotenv", lambda: lecturas.append(1))
+    for _ in range(3):
+        core_tec.clave_pliego(RESPUESTAS)
+        core_tec.huellas_secciones(RESPUESTAS)
+    assert len(lecturas) == 1
+
+
+@pytest.fixture
+def almacen(monkeypatch, tmp_path):
+    almacen = AlmacenBorradores(str(tmp_path / "borradores.sqlite3"))
+    monkeypatch.setattr(core_tec, "obtener_borradores", lambda: almacen)
+    yield almacen
+    almacen.cerrar()
+
+
+def test_borrador_solo_regenera_las_secciones_cambiadas(modelo, almacen):
+    borrador, _ = asyncio.run(core_tec.crear_borrador(RESPUESTAS))
+    llamadas = modelo.llamadas
+
+    cambios = {" Situación Inicial": {"¿Dónde se encuentra actualmente la documentación/material que se va a tratar?": "almacén externo"}}
+    actualizado = asyncio.run(core_tec.actualizar_borrador(borrador["id"], cambios))
+    assert actualizado["regeneradas"] == [" Situación Inicial"]
+    assert modelo.llamadas == llamadas + 1
+
+    # Sin cambios reales no se llama a Gemini
+    sin_cambios = asyncio.run(core_tec.actualizar_borrador(borrador["id"], cambios))
+    assert sin_cambios["regeneradas"] == [] and modelo.llamadas == llamadas + 1
+
+
+def test_actualizaciones_simultaneas_del_mismo_borrador(modelo, almacen):
+    borrador, _ = asyncio.run(core_tec.crear_borrador(RESPUESTAS))
+    objeto = {" Objeto del Contrato": {"¿Cuál es el objeto principal del contrato? (por ejemplo: escaneo de documentos, desarrollo de software, suministro de material…)": "custodia"}}
+    situacion = {" Situación Inicial": {"¿Dónde se encuentra actualmente la documentación/material que se va a tratar?": "almacén externo"}}
+
+    async def escenario():
+        return await asyncio.gather(
+            core_tec.actualizar_borrador(borrador["id"], objeto),
+            core_tec.actualizar_borrador(borrador["id"], situacion),
+        )
+
+    primero, segundo = asyncio.run(escenario())
+    # Con el candado por borrador, la segunda parte del resultado de la primera y no se pierde ningún cambio
+    assert primero["regeneradas"] == [" Objeto del Contrato"]
+    assert segundo["regeneradas"] == [" Situación Inicial"]
+    entrada = almacen.obtener(borrador["id"], "tec")["entrada"]
+    assert entrada == fusionar(fusionar(RESPUESTAS, objeto), situacion)
@@ -0,0 +1,41 @@
+# tests/test_exportacion.py
+import io
+
+from comun.exportacion import bloques_pliego, renderizar
+
+PLIEGO_ADM = {
+    "titulo": "Pliego de cláusulas administrativas particulares",
+    "objeto": "Servicio de digitalización del archivo municipal",
+    "indice": ["Portada", "Garantías"],
+    "secciones": {"Portada": "Texto", "Garantías": "Texto"},
+    # Como lo deja unir_secciones (o la revisión final): los títulos empiezan en ##
+    "pliego_final": (
+        "## Portada\n\nÓrgano de contratación.\n\n## Garantías\n\n### Definitiva\n\n- 5 % del importe\n\n"
+        "## ⚠️ ADVERTENCIAS Y PUNTOS A REVISAR\n\n- Revisar la fecha"
+    ),
+}
+
+
+def test_pliego_final_empieza_en_nivel_1():
+    titulos = [(nivel, texto) for tipo, nivel, texto in bloques_pliego(PLIEGO_ADM) if tipo == "titulo"]
+    assert titulos[0] == (1, "Portada")
+    assert (2, "Definitiva") in titulos
+
+
+def test_pdf_de_pliego_administrativo():
+    documento = renderizar(PLIEGO_ADM, "pdf")
+    assert documento.startswith(b"%PDF")
+    assert b"/Outlines" in documento
+
+
+def test_pdf_con_salto_de_nivel():
+    # Un ## antes del primer # no debe romper el esquema del PDF
+    pliego = {**PLIEGO_ADM, "pliego_final": "## Detalle\n\ntexto\n\n# Pliego\n\n## Cláusula\n\ntexto"}
+    assert renderizar(pliego, "pdf").startswith(b"%PDF")
+
+
+def test_docx_de_pliego_administrativo():
+    from docx import Document
+
+    documento = Document(io.BytesIO(renderizar(PLIEGO_ADM, "docx")))
+    assert "Portada" in [p.text for p in documento.paragraphs if p.style.name == "Heading 1"]
@@ -0,0 +1,117 @@
+# tests/test_pasarela_llm.py
+import asyncio
+import multiprocessing
+
+import pytest
+
+from comun.falsos import CuotaFalsa, ErrorCuota, ErrorServicio, ModeloFalso
+from comun.pasarela_llm import PasarelaLLM, PlazoAgotado, pasarela, plazo
+
+
+def _pasarela() -> PasarelaLLM:
+    return PasarelaLLM("prueba", concurrencia=4, reintentos=2, espera_base=0.001, espera_max=0.001)
+
+
+def test_timeout_del_cliente_se_reintenta():
+    intentos = []
+
+    async def llamada():
+        intentos.append(1)
+        if len(intentos) == 1:
+            raise asyncio.TimeoutError()  # Timeout de la red, sin plazo de petición
+        return "ok"
+
+    pasarela = _pasarela()
+    assert asyncio.run(pasarela.llamar(llamada)) == "ok"
+    assert len(intentos) == 2
+    assert pasarela.contadores["errores"] == 1
+
+
+def test_plazo_de_la_peticion_agotado():
+    async def lenta():
+        await asyncio.sleep(1)
+
+    async def escenario():
+        with plazo(0.05):
+            await _pasarela().llamar(lenta)
+
+    with pytest.raises(PlazoAgotado):
+        asyncio.run(escenario())
+
+
+def test_concurrencia_se_reduce_tras_un_429_y_se_recupera():
+    modelo = ModeloFalso(latencia=0.01, cuota=CuotaFalsa(peticiones=0))
+    pasarela = PasarelaLLM("prueba", concurrencia=4, reintentos=0)
+    maximo = []
+
+    async def llamada():
+        maximo.append(pasarela.en_vuelo)
+        return await modelo.generate_content_async("prompt")
+
+    async def escenario():
+        with pytest.raises(ErrorCuota):
+            await pasarela.llamar(llamada)
+        assert int(pasarela.limite) == 2
+
+        modelo.cuota = None
+        await asyncio.gather(*(pasarela.llamar(llamada) for _ in range(4)))
+        assert max(maximo) <= 2  # Con el límite reducido no pasan más de 2 a la vez
+
+        for _ in range(10):
+            await pasarela.llamar(llamada)
+
+    asyncio.run(escenario())
+    assert int(pasarela.limite) == 4
+    assert pasarela.contadores["saturaciones"] == 1
+
+
+def test_stream_no_se_reintenta_tras_el_primer_trozo():
+    aperturas = []
+
+    async def abrir():
+        aperturas.append(1)
+        yield "primer trozo "
+        raise ErrorServicio("503 The model is overloaded.")
+
+    async def escenario():
+        return [trozo async for trozo in _pasarela().transmitir(abrir)]
+
+    with pytest.raises(ErrorServicio):
+        asyncio.run(escenario())
+    assert len(aperturas) == 1
+
+
+def test_stream_se_reintenta_antes_del_primer_trozo():
+    aperturas = []
+
+    async def abrir():
+        aperturas.append(1)
+        if len(aperturas) == 1:
+            raise ErrorServicio("503 The model is overloaded.")
+        yield "texto"
+
+    async def escenario():
+        return [trozo async for trozo in _pasarela().transmitir(abrir)]
+
+    assert asyncio.run(escenario()) == ["texto"]
+    assert len(aperturas) == 2
+
+
+def _contadores_en_hijo(cola) -> None:
+    cola.put(dict(pasarela("prueba-proceso").contadores))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requiere fork")
+def test_cada_proceso_tiene_su_pasarela():
+    compartida = pasarela("prueba-proceso")
+    assert pasarela("prueba-proceso") is compartida
+    compartida.contadores["llamadas"] = 7
+
+    contexto = multiprocessing.get_context("fork")
+    cola = contexto.Queue()
+    hijo = contexto.Process(target=_contadores_en_hijo, args=(cola,))
+    hijo.start()
+    contadores = cola.get(timeout=10)
+    hijo.join()
+    assert contadores["llamadas"] == 0  # El worker no hereda la pasarela (ni los contadores) del maestro
+    assert pasarela("prueba-proceso") is compartida
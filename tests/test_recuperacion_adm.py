@@ -0,0 +1,26 @@
+# tests/test_recuperacion_adm.py
+import numpy as np
+from langchain_core.documents import Document
+
+from app_adm.recuperacion_adm import contiene_palabras, filtro_titulo
+from app_adm.vectoriales_adm import IndiceNumpy, cumple_filtro
+
+TITULOS = ["Garantías — artículo 106", "Objeto del contrato", "Objetos sostenibles", "Proyecto de obras"]
+
+
+def test_contiene_palabras_enteras():
+    assert contiene_palabras("Objeto del contrato", "objeto")
+    assert not contiene_palabras("Objetos sostenibles", "objeto")  # Qdrant (tokenizer WORD) tampoco lo encuentra
+    assert not contiene_palabras("Proyecto de obras", "obra")
+    assert contiene_palabras("Garantías — artículo 106", "GARANTÍAS")
+
+
+def test_indice_numpy_y_cumple_filtro_coinciden():
+    indice = IndiceNumpy(dimension=2)
+    indice.anadir(np.ones((len(TITULOS), 2)), [Document(page_content=t, metadata={"titulo": t}) for t in TITULOS])
+    for palabra in ("objeto", "garantías", "obra", "artículo 106"):
+        filtro = filtro_titulo(palabra)
+        por_mascara = [d.page_content for d, _ in indice.buscar_lote([[1, 1]], k=10, filtro=filtro)[0]]
+        uno_a_uno = [t for t in TITULOS if cumple_filtro({"titulo": t}, filtro)]
+        esperado = [t for t in TITULOS if contiene_palabras(t, palabra)]
+        assert sorted(por_mascara) == sorted(uno_a_uno) == sorted(esperado)
@@ -0,0 +1,86 @@
+# tests/test_trabajos.py
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+
+from comun.trabajos import COMPLETADO, EN_CURSO, ColaTrabajos
+
+
+def _ejecutor(registro: list, espera: float = 0.05):
+    async def ejecutar(entrada):
+        registro.append(entrada["n"])
+        await asyncio.sleep(espera)
+        yield "resultado", {"n": entrada["n"]}
+    return ejecutar
+
+
+async def _esperar_terminados(cola: ColaTrabajos, ids: list, limite: float = 5.0) -> None:
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        estados = [(await cola.obtener(i))["estado"] for i in ids]
+        if all(e == COMPLETADO for e in estados):
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"Trabajos sin terminar: {estados}")
+
+
+def test_dos_colas_sobre_la_misma_base_no_repiten_trabajos(tmp_path):
+    ruta = str(tmp_path / "trabajos.sqlite3")
+    registro = []
+
+    async def escenario():
+        a = ColaTrabajos(ruta, _ejecutor(registro), trabajadores=1)
+        await a.iniciar()
+        ids = [await a.encolar({"n": n}, total=1) for n in range(3)]
+        await asyncio.sleep(0.01)  # El primero ya está en curso en `a`
+        b = ColaTrabajos(ruta, _ejecutor(registro), trabajadores=2)  # Otro worker que arranca
+        await b.iniciar()
+        await _esperar_terminados(a, ids)
+        await a.cerrar()
+        await b.cerrar()
+
+    asyncio.run(escenario())
+    assert sorted(registro) == [0, 1, 2]
+
+
+def test_retoma_los_trabajos_de_un_dueno_muerto(tmp_path):
+    ruta = str(tmp_path / "trabajos.sqlite3")
+    registro = []
+
+    async def escenario():
+        a = ColaTrabajos(ruta, _ejecutor(registro), trabajadores=1)
+        await a.iniciar()
+        id_trabajo = await a.encolar({"n": 7}, total=1)
+        await a.cerrar()
+        # Lo dejamos en curso a nombre de un proceso de esta máquina que ya no existe
+        with sqlite3.connect(ruta) as conexion:
+            conexion.execute("UPDATE trabajos SET estado = ?, dueno = ?, latido = ? WHERE id = ?",
+                             (EN_CURSO, f"{socket.gethostname()}:{2 ** 22 + os.getpid()}:x", time.time(), id_trabajo))
+        b = ColaTrabajos(ruta, _ejecutor(registro), trabajadores=1)
+        await b.iniciar()
+        await _esperar_terminados(b, [id_trabajo])
+        await b.cerrar()
+
+    asyncio.run(escenario())
+    assert registro == [7]
+
+
+def test_no_retoma_los_de_un_dueno_vivo(tmp_path):
+    ruta = str(tmp_path / "trabajos.sqlite3")
+    registro = []
+
+    async def escenario():
+        a = ColaTrabajos(ruta, _ejecutor(registro, espera=0.5), trabajadores=1)
+        await a.iniciar()
+        id_trabajo = await a.encolar({"n": 1}, total=1)
+        await asyncio.sleep(0.05)
+        b = ColaTrabajos(ruta, _ejecutor(registro), trabajadores=1)
+        await b.iniciar()
+        await _esperar_terminados(a, [id_trabajo])
+        await a.cerrar()
+        await b.cerrar()
+
+    asyncio.run(escenario())
+    assert registro == [1]